@@ -1,14 +1,19 @@
-import re
-import pandas as pd
 import os
-from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor
-from threading import Lock, Semaphore
-import queue
-from CommentsTranslate import translate_with_rate_limit
-
-from translateUtils.BaiduTranslation import createRequestBaidu
-from translateUtils.QuickTable import *
+from CommentsTranslate import translate_deepseek_batch, translate_routed, router, job_db_path, checkpoint_rows
+
+from translateUtils.DeepSeekTranslate import migrate_legacy_cache
+from translateUtils.TextNormalize import plan_dedup
+from translateUtils.TranslateEngine import translate_parallel
+from translateUtils.TextClassify import classify_texts, PASSTHROUGH
+from translateUtils.JobQueue import TranslationJobQueue, drain, make_job_id, DONE, FAILED
+from translateUtils.TranslationManifest import TranslationManifest
+from translateUtils.TranslationCache import get_cache
+from assUtils import read_ass, write_ass, plain_text, replace_text
+
+# 每个请求包含的连续台词行数、附带的前文行数、同时进行的窗口数
+window_size = 20
+context_lines = 5
+ass_workers = 8
 
 def translate_ass(input_path, output_path):
     """
@@ -16,80 +21,123 @@ def translate_ass(input_path, output_path):
     :param input_path: 输入ASS文件路径
     :param output_path: 输出ASS文件路径
     """
-    # 读取文件
-    with open(input_path, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-
-    # 查找[Events]部分
-    events_index = -1
-    for i, line in enumerate(lines):
-        if line.strip().lower() == '[events]':
-            events_index = i
-            break
-
-    if events_index == -1:
+    # 解析文件：只取 [Events] 中的 Dialogue 行，其余内容原样保留
+    doc = read_ass(input_path)
+    if doc.section('Events') is None:
         raise ValueError("ASS文件中缺少[Events]部分")
-
-    # 检查Format行
-    format_line = events_index + 1
-    if not lines[format_line].lower().startswith('format:'):
-        raise ValueError("Format行格式异常")
-
-    # 预处理：获取所有需要处理的行索引
-    process_indices = []
-    for idx in range(events_index + 2, len(lines)):
-        if lines[idx].strip().startswith('Dialogue:'):
-            process_indices.append(idx)
-
-    total_lines = len(process_indices)  # 准确的总进度
-
+    doc.bom = True  # 保持BOM头
+
+    # 提取需要翻译的文本（去掉特效标签），条目ID为台词序号
+    entries = [(idx, event, plain_text(event.text)) for idx, event in enumerate(doc.dialogues())]
+
+    # 本地分类：不需要翻译的行（符号、英文、中文等）保持原样，不发送请求
+    kinds, report = classify_texts([original_text for _, _, original_text in entries])
+    print(report)
+    entries = [entry for entry, kind in zip(entries, kinds) if kind != PASSTHROUGH]
+
+    # 任务队列：每 checkpoint_rows 行提交一次结果，中断后重新运行只翻译未完成的行
+    queue_db = TranslationJobQueue(job_db_path)
+    job_id = make_job_id('ass', input_path)
+    # 增量翻译：按内容与上次输出的清单比对，原文没变的行直接复用译文，只翻译新增或修改的行
+    manifest = TranslationManifest.for_output(output_path)
+    reused, missing = manifest.split([(idx, original_text) for idx, _, original_text in entries])
+    print(manifest.report())
+    queue_db.enqueue(job_id, missing, kind='ass', source=input_path)
+    counts = drain(queue_db, job_id, translate_lines, chunk_size=checkpoint_rows)
+    print(f"完成 {counts[DONE]} 行，失败 {counts[FAILED]} 行")
+    print(get_cache().report())
+    print(router.report())
+
+    done = queue_db.results(job_id)
+    done.update(reused)
+    materialize_ass(doc, entries, done, output_path)
+    manifest.rebuild((original_text, done[idx][0], done[idx][1]) for idx, _, original_text in entries if idx in done)
+    manifest.save()
+
+
+def translate_window(window):
+    """
+    翻译一个台词窗口 (连续的台词, 前文)：整个窗口作为一个请求交给路由决策（预算、目标耗时、决策日志）；
+    选中 DeepSeek 时一次带前文的结构化请求，选中的服务没有带前文的批量接口时逐条按路由翻译
+    """
+    texts, context = window
+    joined = '\n'.join(texts)
+    decision = router.route(joined)
+    if decision.backend == 'deepseek':
+        results = translate_deepseek_batch(texts, context)
+        router.record(joined, decision, {'backend': 'deepseek', 'error': None,
+                                         'tokens_cost': sum(r['tokens_cost'] or 0 for r in results)})
+        return results
+    # 释放窗口决策的预估花费，实际花费按逐条的路由结果计入
+    router.record(joined, decision, {'backend': None, 'error': None})
+    decisions = router.plan(texts)
+    results = [translate_routed((text, d.backend)) for text, d in zip(texts, decisions)]
+    for text, d, r in zip(texts, decisions, results):
+        router.record(text, d, r)
+    return results
+
+
+def translate_lines(texts):
+    """
+    翻译一组连续的台词：按原始台词顺序分成窗口，每个窗口一次请求，并附带窗口前的原始台词作为语境；
+    去重只决定哪些台词需要发送（每个去重键只在首次出现的窗口中翻译），不改变窗口和前文；
+    多个窗口并发翻译，结果按原顺序写回
+    :return: 与 texts 等长的结果
+    """
+    plan = plan_dedup(texts)
+    print(plan.report())
+    router.start_job()
+
+    raw = [t.strip() if isinstance(t, str) else '' for t in texts]
+    size = max(1, window_size)
+    windows, window_keys = [], []
+    sent = set()
+    for j in range(0, len(texts), size):
+        keys = []
+        for key_index in plan.row_keys[j:j + size]:
+            if key_index >= 0 and key_index not in sent:
+                sent.add(key_index)
+                keys.append(key_index)
+        if not keys:
+            continue
+        context = [t for t in raw[max(0, j - context_lines):j] if t] if context_lines else None
+        windows.append(([plan.keys[k] for k in keys], context or None))
+        window_keys.append(keys)
+
+    window_results = translate_parallel(windows, translate_window, max_workers=ass_workers,
+                                        progress='ordered', desc="翻译进度")
+    key_results = [None] * len(plan.keys)
+    for keys, results in zip(window_keys, window_results):
+        for key_index, result in zip(keys, results):
+            key_results[key_index] = result
+    return plan.expand(key_results)
+
+
+def materialize_ass(doc, entries, done, output_path):
+    """
+    把队列中已完成的译文写回各行并输出
+    :param done: {台词序号: (译文, 服务, tokens)}
+    """
     all_token_cost = 0
-
-    # 使用tqdm显示进度条
-    with tqdm(total=total_lines, desc="翻译进度", unit="line") as pbar:
-        for idx in process_indices:
-            line = lines[idx].strip()
-
-            # 高级分割逻辑：保留原始结构
-            parts = re.split(r',\s*(?![^{}]*\})', line, maxsplit=9)
-            if len(parts) < 10:
-                continue
-
-            # 提取需要翻译的文本（保留特效标签）
-            original_text = parts[9].split('}')[1] if '}' in parts[9] else parts[9]
-
-            # 调用翻译函数
-            result = translate_with_rate_limit(original_text, 2)
-            translated = result['trans_res']
-            all_token_cost += result['tokens_cost']
-
-            # 保留原始特效标签
-            if '\\N' in original_text:
-                translated = translated.replace('\n', '\\N')
-            if '}' in parts[9]:
-                translated_text = parts[9].split('}', 1)[0] + '}' + translated
-            else:
-                translated_text = translated
-
-            # 重构完整行
-            parts[9] = translated_text
-            lines[idx] = ','.join(parts) + '\n'
-
-            # 更新进度条
-            pbar.update(1)
-            pbar.set_postfix({
-                '当前行': f"{idx + 1}/{len(lines)}",
-                '原文': original_text[:20] + '...' if len(original_text) > 20 else original_text,
-                '译文': translated[:20] + '...' if len(translated) > 20 else translated
-            })
-
-    # 写入翻译后的文件
-    with open(output_path, 'w', encoding='utf-8-sig') as f:  # 保持BOM头
-        f.writelines(lines)
-
-    print('总消耗tokens = ', all_token_cost) 
+    failed = 0
+    for idx, event, original_text in entries:
+        if idx not in done:  # 未完成或翻译失败的行保留原文
+            failed += 1
+            continue
+        translated, _, tokens = done[idx]
+        all_token_cost += tokens
+        # 保留原始特效标签，换行写回为 \N
+        event.text = replace_text(event.text, translated)
+
+    # 写入翻译后的文件，未修改的行逐字节保持原样
+    write_ass(doc, output_path)
+
+    print('总消耗tokens = ', all_token_cost)
+    if failed:
+        print(f"未翻译 {failed} 行，已保留原文")
 
 if __name__ == '__main__':
+    migrate_legacy_cache()
     ass_file = r"E:\R-User-File\R-Project-Myself\CommentCatcher\kirinuki\04\04-audio-align.ass"
     output_dir = r"E:\R-User-File\R-Project-Myself\CommentCatcher\kirinuki\04\trans"
     
@@ -1,69 +1,287 @@
 import pandas as pd
-import time
-from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor
-from threading import Lock, Semaphore
 import queue
+import sys
+from dataclasses import replace
 
-from translateUtils.BaiduTranslation import createRequestBaidu
-from translateUtils.DeepSeekTranslate import createRequestDeepSeek
+from translateUtils.BaiduTranslation import createRequestBaidu, createRequestBaiduBatch, pack_baidu_batches
+from translateUtils.DeepSeekTranslate import createRequestDeepSeek, createRequestDeepSeekBatch, batch_stats, migrate_legacy_cache
+from translateUtils.YoudaoTranslate import createRequest as createRequestYoudao, appid as youdao_appid
 from translateUtils.QuickTable import *
+from translateUtils.PhraseDict import lookup_phrase
+from translateUtils.TranslateEngine import backend_slot, translate_parallel, format_limiter_status, limiter_status
+from translateUtils.Resilience import ResilientTranslator, retry_call
+from translateUtils.Router import CostLatencyRouter, LengthRouter, RoutingLog, DEFAULT_PROFILES
+from translateUtils.TextNormalize import plan_dedup
+from translateUtils.TextClassify import classify_texts, PASSTHROUGH, DICTIONARY
+from translateUtils.JobQueue import TranslationJobQueue, drain, make_job_id, DONE, PENDING, IN_FLIGHT, FAILED
+from translateUtils.TranslationManifest import TranslationManifest
+from translateUtils.TranslationCache import get_cache
+from chatUtils.CommentStore import read_comments, write_comments, TEXT, TRANSLATION, BACKEND, TOKENS
 
-# 读取 Excel 文件
+# 读取弹幕表（.arrow / .parquet / .xlsx）
 excel_path = r"E:\R-User-File\R-Project-Myself\CommentCatcher\Comment2Ass2MP4\ytbcomments\04.xlsx"
 
-# 创建限流器和锁
-rate_limiter = Semaphore(10)  # 限制最大并发数为10
-lock = Lock()
+# 并发线程数；每个翻译服务的并发/QPS 由 TranslateEngine.BACKEND_LIMITS 自适应调整
+max_workers = 32
+# 单条弹幕（含重试、对冲）的截止时间（秒）
+request_deadline = 60.0
+# 主服务超过其 p95 延迟仍未返回时，是否向另一个服务发出对冲请求
+hedge_requests = True
+# 进度显示：'throughput' 按完成顺序，'ordered' 按行顺序
+progress_mode = 'throughput'
+# 百度短文本是否合并为多段批量请求
+baidu_batch = True
+# DeepSeek 每个批量请求包含的弹幕条数（K），1 表示逐条请求
+deepseek_batch_size = 20
+# 路由：'cost' 按成本和耗时选择服务，'length' 为旧规则（超过11个字符用 DeepSeek）
+router_mode = 'cost'
+# 翻译预算（元）和目标耗时（秒），None 表示不限
+translation_budget = None
+target_seconds = None
+# 每次路由决策写入的日志文件
+routing_log_path = r".\output\routing-decisions.jsonl"
+# 翻译任务队列（中断后续接、多进程共同处理），每处理多少行提交一次检查点
+job_db_path = r".\output\translate-jobs.sqlite3"
+checkpoint_rows = 500
 error_queue = queue.Queue()
 
-def translate_with_rate_limit(text, translation_service=1):
+def _request_baidu(text):
+    with backend_slot("baidu"):  # 按服务分别控制并发和QPS，限流时自动降速
+        return createRequestBaidu(text), 0  # 调用百度翻译
+
+def _request_deepseek(text):
+    with backend_slot("deepseek"):
+        return createRequestDeepSeek(text)  # 调用Deepseek API
+
+def _request_youdao(text):
+    with backend_slot("youdao"):
+        return createRequestYoudao(text), 0
+
+backends = {"baidu": _request_baidu, "deepseek": _request_deepseek}
+if youdao_appid:  # 配置了有道密钥时才参与路由
+    backends["youdao"] = _request_youdao
+
+# 截止时间、退避重试、对冲请求和熔断：主服务失败或过慢时转到另一个服务
+resilient = ResilientTranslator(backends, deadline=request_deadline, hedge=hedge_requests)
+
+def build_router():
+    if router_mode == 'length':
+        return LengthRouter(dictionary=lookup_phrase, log=RoutingLog(routing_log_path))
+    profiles = dict(DEFAULT_PROFILES)
+    profiles["baidu"] = replace(profiles["baidu"], batch_size=profiles["baidu"].batch_size if baidu_batch else 1)
+    profiles["deepseek"] = replace(profiles["deepseek"], batch_size=max(1, deepseek_batch_size))
+    return CostLatencyRouter(list(backends), profiles, budget=translation_budget, target_seconds=target_seconds,
+                             dictionary=lookup_phrase, stats=resilient.stats,
+                             available=lambda name: resilient.breakers[name].available(),
+                             limits=lambda: {s["backend"]: s for s in limiter_status()},
+                             log=RoutingLog(routing_log_path))
+
+router = build_router()
+
+def _error_result(error):
+    return {"trans_res": None, "tokens_cost": 0, "backend": None, "error": error}
+
+def _fill_failed(results, texts, backend):
+    """批量结果中失败（None）的条目改为逐条翻译（带重试和失败转移）"""
+    for i, (r, t) in enumerate(zip(results, texts)):
+        if r["trans_res"] is None:
+            results[i] = translate_with_rate_limit(t, backend)
+    return results
+
+def translate_baidu_batch(texts):
+    """百度多段批量翻译：一个批次一次签名请求，返回与 texts 等长的结果"""
+    try:
+        translated = retry_call(lambda: createRequestBaiduBatch(texts, limiter=lambda: backend_slot("baidu")))
+        results = [{"trans_res": t, "tokens_cost": 0, "backend": "baidu", "error": None} for t in translated]
+        return _fill_failed(results, texts, "baidu")
+    except Exception as e:
+        error_queue.put(f"批量翻译 {len(texts)} 条时出错: {e}")
+        return [translate_with_rate_limit(t, "baidu") for t in texts]
+
+def translate_deepseek_batch(texts, context=None):
+    """
+    DeepSeek 批量翻译：一批弹幕一次请求，tokens 记在该批第一条上
+    :param context: 前文（如字幕的上几行），只作为语境随请求发送
+    """
+    def request():
+        with backend_slot("deepseek"):
+            return createRequestDeepSeekBatch(texts, context=context)
+
+    try:
+        translated, tokens_cost = retry_call(request)
+        results = [{"trans_res": t, "tokens_cost": tokens_cost if i == 0 else 0, "backend": "deepseek", "error": None}
+                   for i, t in enumerate(translated)]
+        return _fill_failed(results, texts, "deepseek")
+    except Exception as e:
+        error_queue.put(f"批量翻译 {len(texts)} 条时出错: {e}")
+        return [translate_with_rate_limit(t, "deepseek") for t in texts]
+
+def translate_with_rate_limit(text, backend=None):
+    """
+    翻译单条文本
+    :param backend: 指定主服务（其余服务作为备用）；None 时由路由器决定
+    :return: {"trans_res", "tokens_cost", "backend", "error"}；失败时 trans_res 为 None，不能写入译文列
+    """
     # 去除文本前后的空白字符
     text = text.strip()
     if not text:  # 如果文本为空，直接返回
-        return {"trans_res": text, "tokens_cost": 0}
+        return {"trans_res": text, "tokens_cost": 0, "backend": None, "error": None}
         
-    # 获取翻译映射表并检查是否存在对应翻译
-    translation_map = get_translation_map()
-    if text in translation_map:
-        return {"trans_res": translation_map[text], "tokens_cost": 0}
-    
-    api_tokens_cost = 0
+    # 短语词典命中时直接返回，不发出请求
+    translated = lookup_phrase(text)
+    if translated is not None:
+        return {"trans_res": translated, "tokens_cost": 0, "backend": "dict", "error": None}
 
-    if len(text) > 11:
-        translation_service = 2
+    decision = None
+    if backend is None:
+        decision = router.route(text)
+        order = decision.order
+    elif backend in resilient.backends:
+        order = [backend] + [b for b in resilient.backends if b != backend]
+    else:
+        return _error_result(f"不支持的翻译服务 {backend}")
 
-    try:
-        with rate_limiter:  # 使用信号量控制并发
-            time.sleep(0.1)  # 确保QPS不超过10
-            if translation_service == 1:
-                trans_res = createRequestBaidu(text)  # 调用百度翻译
-            elif translation_service == 2:
-                trans_res, tokens_cost = createRequestDeepSeek(text)  # 调用Deepseek API
-                api_tokens_cost += tokens_cost
-            else:
-                raise ValueError("不支持的翻译服务")
-            return {"trans_res": trans_res, "tokens_cost": api_tokens_cost}
-    except Exception as e:
-        error_msg = f"翻译 {text} 时出错: {e}"
-        error_queue.put(error_msg)
-        return {"trans_res": text, "tokens_cost": 0}
+    result = resilient.translate(text, order)
+    if decision is not None:
+        router.record(text, decision, result)
+    if result["error"] is not None:
+        error_queue.put(f"翻译 {text} 时出错: {result['error']}")
+    return result
+
+def translate_routed(item):
+    """按已有的路由结果翻译 (文本, 服务)；词典命中等非请求服务交给 translate_with_rate_limit 处理"""
+    text, backend = item
+    return translate_with_rate_limit(text, backend if backend in resilient.backends else None)
+
+def translate_unique(texts):
+    """按服务分流翻译一组（已去重的）文本，结果按输入顺序返回"""
+    results = [None] * len(texts)
+    router.start_job()
+    decisions = router.plan(texts)
+
+    # 路由到百度的文本：打包成多段请求，一个批次一次请求
+    baidu_idx = [i for i, d in enumerate(decisions) if d.backend == "baidu"]
+    if baidu_batch:
+        batches = [[baidu_idx[j] for j in b] for b in pack_baidu_batches([texts[i] for i in baidu_idx])]
+        batch_results = translate_parallel([[texts[i] for i in b] for b in batches], translate_baidu_batch,
+                                           max_workers=max_workers, progress=progress_mode, desc="百度批量翻译")
+        print(f"百度翻译 {len(baidu_idx)} 条，合并为 {len(batches)} 次请求")
+        for batch, batch_result in zip(batches, batch_results):
+            for i, r in zip(batch, batch_result):
+                results[i] = r
+
+    # 路由到 DeepSeek 的文本：每 K 条编号后放在一个请求中
+    deepseek_idx = [i for i, d in enumerate(decisions) if results[i] is None and d.backend == "deepseek"]
+    if deepseek_batch_size > 1:
+        batches = [deepseek_idx[j:j + deepseek_batch_size] for j in range(0, len(deepseek_idx), deepseek_batch_size)]
+        batch_results = translate_parallel([[texts[i] for i in b] for b in batches], translate_deepseek_batch,
+                                           max_workers=max_workers, progress=progress_mode, desc="DeepSeek批量翻译")
+        for batch, batch_result in zip(batches, batch_results):
+            for i, r in zip(batch, batch_result):
+                results[i] = r
+        stats = batch_stats()
+        print(f"DeepSeek 批量翻译 {stats['comments']} 条，{stats['requests']} 次请求"
+              f"（失败重拆 {stats['failed_batches']} 次），平均每条 {stats['tokens_per_comment']:.1f} tokens")
+
+    # 其余文本（词典命中、有道、未批量的）按路由结果并发逐条翻译
+    rest_idx = [i for i, r in enumerate(results) if r is None]
+    rest_results = translate_parallel([(texts[i], decisions[i].backend) for i in rest_idx], translate_routed,
+                                      max_workers=max_workers, progress=progress_mode, desc="检查并重新翻译")
+    for i, r in zip(rest_idx, rest_results):
+        results[i] = r
+    for text, decision, result in zip(texts, decisions, results):
+        router.record(text, decision, result)
+    print(format_limiter_status())
+    print(resilient.report())
+    print(router.report())
+    return results
+
+def translate_texts(texts):
+    """
+    翻译多行文本：先在本地分类，表情/贴图/数字/笑声/英文/中文原样保留，词典命中直接替换；
+    只有需要翻译的行规范化去重后发送请求，每个去重键只翻译一次，再把结果分发回每一行
+    :return: 与 texts 等长、按行顺序排列的结果
+    """
+    kinds, report = classify_texts(texts)
+    print(report)
+    results = [None] * len(texts)
+    mt_idx = []
+    for i, (text, kind) in enumerate(zip(texts, kinds)):
+        phrase = lookup_phrase(text) if kind == DICTIONARY else None
+        if kind == PASSTHROUGH:
+            results[i] = {"trans_res": text if isinstance(text, str) else "", "tokens_cost": 0,
+                          "backend": "passthrough", "error": None}
+        elif phrase is not None:
+            results[i] = {"trans_res": phrase, "tokens_cost": 0, "backend": "dict", "error": None}
+        else:  # NEEDS_MT，或词典刚好热加载删掉了该词条
+            mt_idx.append(i)
+
+    plan = plan_dedup([texts[i] for i in mt_idx])
+    print(plan.report())
+    for i, r in zip(mt_idx, plan.expand(translate_unique(plan.keys))):
+        results[i] = r
+    return results
+
+def enqueue_comments(queue, job_id, df, manifest=None):
+    """
+    把每行弹幕按行号加入任务队列；已完成且原文未变的行保持完成状态
+    提供清单时，原文在上次输出中出现过的行直接复用译文，不加入队列
+    :return: (新加入队列的条数, {行号: (译文, 服务, 0)} 复用的行)
+    """
+    items = [(i, text if isinstance(text, str) else "") for i, text in enumerate(df[TEXT])]
+    reused = {}
+    if manifest is not None:
+        reused, items = manifest.split(items)
+        print(manifest.report())
+    return queue.enqueue(job_id, items, kind="comments", source=excel_path), reused
+
+def materialize_comments(df, queue, job_id, output_path, reused=None, manifest=None):
+    """
+    按队列中已完成的结果（加上复用的译文）生成输出文件（.arrow / .parquet / .xlsx）
+    提供清单时，用本次的译文重建清单，供下次增量翻译
+    """
+    df = df.reset_index(drop=True)
+    done = queue.results(job_id)
+    done.update(reused or {})
+    rows = sorted(i for i in done if i < len(df))
+    df.loc[rows, TRANSLATION] = [done[i][0] for i in rows]
+    df.loc[rows, BACKEND] = [done[i][1] for i in rows]
+    df.loc[rows, TOKENS] = [done[i][2] for i in rows]
+    write_comments(df, output_path)
+    if manifest is not None:
+        texts = df[TEXT]
+        manifest.rebuild((texts[i] if isinstance(texts[i], str) else "", done[i][0], done[i][1]) for i in rows)
+        manifest.save()
+    return df
 
 if __name__ == '__main__':
+    # 加 --worker 参数运行时只领取并翻译队列中的条目（可同时运行多个进程），不读取输入也不生成输出
+    worker_only = '--worker' in sys.argv
+    migrate_legacy_cache()
+    queue_db = TranslationJobQueue(job_db_path)
+    job_id = make_job_id("comments", excel_path)
+    # 保存为列式弹幕表（也可以用 .xlsx 后缀导出表格）
+    new_excel_path = r".\output\04-comment-translation.arrow"
 
-    df = pd.read_excel(excel_path)
+    if not worker_only:
+        df = read_comments(excel_path)
+        print("开始翻译弹幕内容...")
+        # 增量翻译：与上次输出的清单按内容比对，只翻译新增或修改的弹幕
+        manifest = TranslationManifest.for_output(new_excel_path)
+        added, reused = enqueue_comments(queue_db, job_id, df, manifest)
+        counts = queue_db.counts(job_id)
+        print(f"共 {len(df)} 条弹幕，复用 {len(reused)} 条，新加入队列 {added} 条，"
+              f"已完成 {counts[DONE]} 条，待翻译 {counts[PENDING] + counts[IN_FLIGHT]} 条")
 
-    print("开始翻译弹幕内容...")
-    # 检查已有的翻译结果,如果翻译后内容与原始内容相同则重新翻译
-    total_rows = len(df)
-    if '翻译后' not in df.columns:
-        df['翻译后'] = None
-    for idx, row in tqdm(df.iterrows(), total=total_rows, desc="检查并重新翻译"):
-        if pd.isna(row['翻译后']) or row['翻译后'] == row['弹幕内容']:  # 检查翻译后列是否为空或者是否等于弹幕内容
-            df.at[idx, '翻译后'] = translate_with_rate_limit(row['弹幕内容'])
+    # 每 checkpoint_rows 行提交一次结果，中断后重新运行从队列续接
+    counts = drain(queue_db, job_id, translate_texts, chunk_size=checkpoint_rows)
+    print(f"完成 {counts[DONE]} 条，失败 {counts[FAILED]} 条（可用 retry_failed 重新排队）")
+    print(get_cache().report())
 
-    # 保存为新的 Excel 文件
-    new_excel_path = r".\output\04-comment-translation.xlsx"
-    df.to_excel(new_excel_path, index=False)
+    while not error_queue.empty():
+        print(error_queue.get())
 
-    print(f"翻译后的文件已保存到 {new_excel_path}")
\ No newline at end of file
+    if not worker_only:
+        df = materialize_comments(df, queue_db, job_id, new_excel_path, reused, manifest)
+        print('总消耗tokens = ', int(df[TOKENS].fillna(0).sum()))
+        print(f"翻译后的文件已保存到 {new_excel_path}")
@@ -1,13 +1,14 @@
 import os
-import json
 import subprocess
 import time
+from collections import deque
 from dataclasses import dataclass
-import concurrent.futures
-from typing import List, Dict
-from moviepy.editor import VideoFileClip, TextClip, CompositeVideoClip
+from typing import List, Dict, Optional
+import numpy as np
+from moviepy.editor import VideoFileClip
 import pandas as pd
-from tqdm import tqdm
+
+from assUtils import DanmakuColumns, clamp_end, AssWriter, EVENT_FORMAT, STYLE_FORMAT, wrap_text
 
 # --------------------------
 # 配置类（集中管理所有参数）
@@ -16,7 +17,7 @@ from tqdm import tqdm
 class AppConfig:
     # 输入输出路径
     video_path: str = r"E:\R-User-File\R-Project-Myself\CommentCatcher\kirinuki\04\04-MASK.mp4"
-    excel_path: str = r"E:\R-User-File\R-Project-Myself\CommentCatcher\kirinuki\04\04-comment-translation.xlsx"
+    excel_path: str = r"E:\R-User-File\R-Project-Myself\CommentCatcher\kirinuki\04\04-comment-translation.arrow"
     output_path: str = r"E:\R-User-File\R-Project-Myself\CommentCatcher\kirinuki\04\04-MASK-DANMU-TEST-17.mp4"
 
     main_ass_path : str = r"trans04-audio-align.ass"
@@ -32,6 +33,7 @@ class AppConfig:
     comment_block_start_y = 100
     comment_block_max_wide_chars = 10
     comment_block_max_lines = 16
+    comment_block_emitter = 'lifetime'  # 'lifetime' 每条弹幕按位置输出事件，'snapshot' 每个状态输出全部弹幕
 
     # 弹幕参数
     start_comment_index: int = 22
@@ -46,19 +48,6 @@ class AppConfig:
     # FFmpeg参数
     ffmpeg_preset: str = 'fast'      # slow, fast
 
-# --------------------------
-# 数据类（结构化数据处理）
-# --------------------------
-@dataclass
-class DanmuInfo:
-    text: str
-    start_time: float
-    end_time: float
-    layer: int
-    scroll_speed: int
-    text_width: int
-    lines: int
-
 # --------------------------
 # 核心功能类
 # --------------------------
@@ -68,7 +57,6 @@ class DanmuProcessor:
         self.video = VideoFileClip(config.video_path)
         self.danmu_data = None
         self.layer_system = None
-        self.thread_num = 8
 
         # 初始化验证
         self._validate_video()
@@ -81,229 +69,249 @@ class DanmuProcessor:
         print(f"视频帧率: {self.video.fps}")
 
     def _load_data(self):
-        """加载并预处理弹幕数据"""
-        # 读取Excel
-        self.danmu_data = pd.read_excel(self.config.excel_path)
+        """加载并预处理弹幕数据（列式，整列计算）"""
+        # 读取弹幕表（.arrow / .parquet / .xlsx），只投影时间戳和译文两列；译文在弹幕表中已是独立的列
+        self.danmu_data = DanmakuColumns.from_store(self.config.excel_path)
         print(f"原始弹幕数: {len(self.danmu_data)}条")
 
-        # 截取起始弹幕
-        if len(self.danmu_data) < self.config.start_comment_index:
-            raise ValueError("弹幕数据不足")
+        # 截取起始弹幕，以它的时间为 0 点
+        self.danmu_data = self.danmu_data.rebase(self.config.start_comment_index)
         
-        baseline_time = self.danmu_data.loc[self.config.start_comment_index-1, "时间"]
-        self.danmu_data = self.danmu_data.iloc[self.config.start_comment_index-1:]
-        self.danmu_data["时间"] = (self.danmu_data["时间"] - baseline_time) / 1000
-        
-        # 过滤超长弹幕
+        # 过滤超长弹幕和没有译文的弹幕（不占用轨道/弹幕框位置，也不输出空事件）
         original_count = len(self.danmu_data)
-        self.danmu_data = self.danmu_data[self.danmu_data["时间"] <= self.video.duration]
-        print(f"过滤后弹幕数: {len(self.danmu_data)}条 (过滤{original_count - len(self.danmu_data)}条)")
-
-    def generate_danmu_clips(self) -> List[DanmuInfo]:
-        """生成弹幕剪辑信息"""
+        in_video = self.danmu_data.start <= self.video.duration
+        has_text = self.danmu_data.has_text()
+        self.danmu_data = self.danmu_data.take(in_video & has_text)
+        print(f"过滤后弹幕数: {len(self.danmu_data)}条 (过滤{original_count - len(self.danmu_data)}条，"
+              f"其中无译文{int((in_video & ~has_text).sum())}条)")
+
+    def generate_danmu_clips(self) -> DanmakuColumns:
+        """生成弹幕剪辑信息：换行结果、行数、起止时间都是列，每种文本只计算一次"""
         print("正在生成弹幕剪辑信息...")
         start_time = time.time()
-        danmu_clips = []
-        video_width, _ = self.video.size
-
-        def process_danmu(row):
-            # 解析基础信息
-            start_time = row["时间"]
-            
-            try:
-                translated_data = json.loads(row["翻译后"].replace("'", "\""))  # 处理单引号问题
-                text = translated_data["trans_res"]
-            except json.JSONDecodeError:
-                print("JSON 解析失败，请检查字符串格式:", row["翻译后"])
-            except KeyError:
-                print("trans_res 字段不存在:", row["翻译后"])
-
-            # 创建文本剪辑
-            text_clip = TextClip(
-                text,
-                fontsize=self.config.font_size,
-                color='white',
-                font='SimHei',
-                stroke_color='black',
-                stroke_width=1
-            )
-
-            # 计算滚动参数
-            scroll_time = min(
-                self.config.scroll_duration,
-                self.video.duration - start_time
-            )
-            text_width = text_clip.size[0]
-            _, lines = ASSGenerator._process_text(text, max_chars=10)
-            
-            # 记录弹幕信息
-            danmu_info = DanmuInfo(
-                text=text,
-                start_time=start_time,
-                end_time=start_time + scroll_time,
-                layer=0,
-                scroll_speed=self.config.scroll_speed,
-                text_width=text_width,
-                lines=lines
-            )
-            return danmu_info
-
-        total_count = len(self.danmu_data)
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.thread_num) as executor:
-            futures = []
-            for _, row in self.danmu_data.iterrows():
-                future = executor.submit(process_danmu, row)
-                futures.append(future)
-
-            for future in tqdm(concurrent.futures.as_completed(futures), total=total_count, desc="生成弹幕"):
-                danmu = future.result()
-                danmu_clips.append(danmu)
+        danmu = self.danmu_data.sort_by_start()
+
+        # 计算滚动参数（不超过视频结尾）
+        danmu.end = clamp_end(danmu.start, self.config.scroll_duration, self.video.duration)
+        # 换行结果（文本, 行数）
+        wrapped = danmu.map_text(lambda text: ASSGenerator._process_text(text, max_chars=10))
+        danmu.wrapped = np.array([w for w, _ in wrapped], dtype=object)
+        danmu.lines = np.array([n for _, n in wrapped], dtype=np.int32)
 
         print(f"弹幕信息处理完成，耗时: {time.time() - start_time:.2f}秒")
-        return danmu_clips
+        return danmu
 
 
 class ASSGenerator:
+    # 每批格式化时间码并写出的弹幕条数，内存占用与弹幕总数无关
+    chunk_size = 4096
+
     @staticmethod
-    def generate_capacity_based_ass(danmu_clips: List[DanmuInfo], video_size: tuple = (1920, 1080)) -> str:
-        """生成基于容量队列的ASS字幕内容"""
-        # 初始化队列和记录列表
-        queue = []
-        lines_queue = []
+    def _snapshots(danmu_clips: DanmakuColumns, video_duration: float):
+        """
+        按时间依次产生弹幕框的状态 (开始时间, 结束时间, 从新到旧的弹幕)，不保存全部快照
+        每条弹幕为 (序号, 换行后的文本, 行数)，序号用于区分内容相同的弹幕
+        """
+        # 初始化队列
+        queue = deque()
         current_lines = 0
-        ass_quickshot_list = []
         prev_time = None
 
-        # 按时间排序弹幕
-        sorted_danmu = sorted(danmu_clips, key=lambda x: x.start_time)
+        # 按时间排序弹幕，逐条取出三列的值
+        order = np.argsort(danmu_clips.start, kind='stable')
+        rows = zip(danmu_clips.start[order].tolist(), danmu_clips.wrapped[order].tolist(),
+                   danmu_clips.lines[order].tolist())
 
-        for danmu in sorted_danmu:
-            current_time = danmu.start_time
+        for index, (current_time, wrapped, lines) in enumerate(rows):
 
             # 维护队列
             if len(queue) >= AppConfig().comment_block_capacity:
-                queue.pop(0)
-                current_lines -= lines_queue.pop(0)
+                current_lines -= queue.popleft()[2]
 
-            queue.append(danmu.text)
-            lines_queue.append(danmu.lines)
-            current_lines += danmu.lines
+            queue.append((index, wrapped, lines))
+            current_lines += lines
 
             # 如果总行数超过限制，让元素出队直到小于等于限制
             while current_lines > AppConfig().comment_block_max_lines:
-                queue.pop(0)
-                current_lines -= lines_queue.pop(0)
+                current_lines -= queue.popleft()[2]
 
             # 记录当前队列状态和时间
             if prev_time is not None:
-                ass_quickshot_list.append({
-                    'start_time': prev_time,
-                    'end_time': current_time,
-                    'danmus': queue.copy()[::-1]
-                })
+                yield prev_time, current_time, list(reversed(queue))
             prev_time = current_time
 
         # 处理最后一个时间点，设置结束时间为视频结束时间
         if prev_time is not None:
-            video_clip = VideoFileClip(AppConfig().video_path)
-            video_duration = video_clip.duration
-            video_clip.close()
-            ass_quickshot_list.append({
-                'start_time': prev_time,
-                'end_time': video_duration,
-                'danmus': queue.copy()[::-1]
-            })
-
-        # 生成ASS内容
-        ass_content = f"""\
-        
-    [Script Info]
-    Title: Danmu Subtitles
-    ScriptType: v4.00+
-    WrapStyle: 0
-    ScaledBorderAndShadow: yes
-    YCbCr Matrix: TV.601
-    PlayResX: {video_size[0]}
-    PlayResY: {video_size[1]}
-
-    [V4+ Styles]
-    Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
-    Style: Default,黑体,29,&H00E1E1E1,&H007F7F7F,&HD3000000,&H80000000,-1,0,0,0,100,100,0,0,3,3,3,7,0,0,0,1
-
-    [Events]
-    Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
-    """
-
-        current_y = AppConfig().comment_block_start_y  # 当前Y位置
-
-        for i, entry in enumerate(ass_quickshot_list):
-            start_tc = ASSGenerator._seconds_to_timecode(entry['start_time'])
-            end_tc = ASSGenerator._seconds_to_timecode(entry['end_time'])
-            danmus = entry['danmus']
+            yield prev_time, video_duration, list(reversed(queue))
 
+    @staticmethod
+    def _layout(danmu_clips: DanmakuColumns, video_duration: float):
+        """
+        计算每个状态中各条弹幕的位置
+        :return: 依次产生 (开始时间, 结束时间, [(序号, 换行后的文本, x, y)])，时间为百分之一秒的整数（与时间码一致）
+        """
+        config = AppConfig()
+        for i, (start_time, end_time, danmus) in enumerate(ASSGenerator._snapshots(danmu_clips, video_duration)):
             # 计算每个字幕的位置，从上到下排列，右对齐显示
-            video_width, video_height = video_size
-            for j, text in enumerate(danmus[:AppConfig().comment_block_capacity]):
-                # 处理换行并获取行数
-                processed_text, lines = ASSGenerator._process_text(text, max_chars=10)
-                
-                y_pos = current_y
-
-                if i < AppConfig().gamestart or i > AppConfig().gameend:
-                    x_pos = 1550
-                    y_bonus = 120
-                else:
-                    x_pos = AppConfig().comment_block_start_x
-                    y_bonus = 0
-                
-                # 添加字幕
-                ass_content += (
-                    f"Dialogue: 0,{start_tc},{end_tc},Default,,0,0,0,,"
-                    f"{{\\pos({x_pos}, {y_pos + y_bonus})}}{processed_text}\n"
-                )
-                
+            if i < config.gamestart or i > config.gameend:
+                x_pos = 1550
+                y_bonus = 120
+            else:
+                x_pos = config.comment_block_start_x
+                y_bonus = 0
+
+            placed = []
+            current_y = config.comment_block_start_y  # 当前Y位置
+            for index, processed_text, lines in danmus[:config.comment_block_capacity]:
+                placed.append((index, processed_text, x_pos, current_y + y_bonus))
+
                 # 更新当前Y位置，为下个弹幕留出空间
-                current_y += lines * AppConfig().comment_row_space
+                current_y += lines * config.comment_row_space
 
-            # 重置current_y为起始位置
-            current_y = AppConfig().comment_block_start_y
+            yield int(round(start_time * 100)), int(round(end_time * 100)), placed
 
-        return ass_content
+    @staticmethod
+    def _write_header(writer: AssWriter, video_size: tuple):
+        writer.section('[Script Info]')
+        writer.write_lines([
+            'Title: Danmu Subtitles',
+            'ScriptType: v4.00+',
+            'WrapStyle: 0',
+            'ScaledBorderAndShadow: yes',
+            'YCbCr Matrix: TV.601',
+            f'PlayResX: {video_size[0]}',
+            f'PlayResY: {video_size[1]}',
+        ])
+        writer.section('[V4+ Styles]')
+        writer.format(STYLE_FORMAT)
+        writer.record('Style', ['Default', '黑体', 29, '&H00E1E1E1', '&H007F7F7F', '&HD3000000', '&H80000000',
+                                -1, 0, 0, 0, 100, 100, 0, 0, 3, 3, 3, 7, 0, 0, 0, 1])
+        writer.section('[Events]')
+        writer.format(EVENT_FORMAT)
 
     @staticmethod
-    def _process_text(text: str, max_chars: int = AppConfig().comment_block_max_wide_chars) -> tuple:
-        """处理文本，使其不超过max_chars个字符，并添加换行符，返回处理后的文本和行数"""
-        processed = []
-        current_line = ""
-        lines = 0
-        char_count = 0
-        
-        for char in text:
-            if '\u4e00' <= char <= '\u9fa5':  # 判断是否为中文字符
-                char_count += 1
+    def _video_duration(video_duration: Optional[float]) -> float:
+        if video_duration is None:
+            video_clip = VideoFileClip(AppConfig().video_path)
+            video_duration = video_clip.duration
+            video_clip.close()
+        return video_duration
+
+    @staticmethod
+    def write_capacity_based_ass(danmu_clips: DanmakuColumns, writer: AssWriter,
+                                 video_size: tuple = (1920, 1080), video_duration: Optional[float] = None):
+        """把基于容量队列的ASS字幕逐段写入 writer：每个状态输出其中的全部弹幕"""
+        video_duration = ASSGenerator._video_duration(video_duration)
+        ASSGenerator._write_header(writer, video_size)
+
+        starts, ends, texts = [], [], []
+        for start_c, end_c, placed in ASSGenerator._layout(danmu_clips, video_duration):
+            for _, processed_text, x_pos, y_pos in placed:
+                starts.append(start_c / 100)
+                ends.append(end_c / 100)
+                texts.append(f"{{\\pos({x_pos}, {y_pos})}}{processed_text}")
+
+            # 攒够一批后写出，时间码一次格式化
+            if len(texts) >= ASSGenerator.chunk_size:
+                writer.dialogues(starts, ends, 'Default', texts)
+                starts, ends, texts = [], [], []
+        if texts:
+            writer.dialogues(starts, ends, 'Default', texts)
+
+    @staticmethod
+    def write_lifetime_ass(danmu_clips: DanmakuColumns, writer: AssWriter,
+                           video_size: tuple = (1920, 1080), video_duration: Optional[float] = None) -> str:
+        """
+        与 write_capacity_based_ass 画面相同，但每条弹幕在整个显示期间只输出少量事件：
+        位置不变的连续状态合并为一段；相邻两段合并为一个事件，用 \\move(x1, y1, x2, y2, t, t) 在段的分界处瞬间移动
+        （libass/VSFilter 在 t 毫秒及之前取起点、之后取终点，因此取分界前 1 毫秒，与原来换事件的时刻一致）
+        :return: 与逐状态输出相比的事件数和文件大小报告
+        """
+        video_duration = ASSGenerator._video_duration(video_duration)
+        ASSGenerator._write_header(writer, video_size)
+
+        starts, ends, texts = [], [], []
+        stats = {'snapshot_events': 0, 'snapshot_bytes': 0, 'events': 0, 'bytes': 0}
+        # 每条显示中的弹幕：[换行后的文本, 已结束待合并的段, 当前段, 文本的字节数]，段为 ((x, y), 开始, 结束)
+        active = {}
+        # 每行除时间码和文本以外的固定部分
+        fixed_bytes = len('Dialogue: 0,,,Default,,0,0,0,,\n')
+
+        def timecodes_bytes(start_c, end_c):
+            # H:MM:SS.cc，小时位数随时长增加
+            return 9 + len(str(start_c // 360000)) + 9 + len(str(end_c // 360000))
+
+        def emit(processed_text, first, second=None):
+            (x1, y1), start_c, end_c = first
+            if second is None:
+                texts.append(f"{{\\pos({x1}, {y1})}}{processed_text}")
             else:
-                char_count += 0.5  # 英文/标点算半个字符
-            
-            if char_count <= max_chars:
-                current_line += char
+                (x2, y2), _, end_c = second
+                t = (first[2] - start_c) * 10 - 1
+                texts.append(f"{{\\move({x1}, {y1}, {x2}, {y2}, {t}, {t})}}{processed_text}")
+            starts.append(start_c / 100)
+            ends.append(end_c / 100)
+            stats['events'] += 1
+            stats['bytes'] += fixed_bytes + timecodes_bytes(start_c, end_c) + len(texts[-1].encode('utf-8'))
+
+        def finish(state):
+            processed_text, done, current, _ = state
+            if done is not None:
+                emit(processed_text, done, current)
             else:
-                processed.append(current_line)
-                current_line = char
-                char_count = 1 if '\u4e00' <= char <= '\u9fa5' else 0.5
-                lines += 1
-        if current_line:
-            processed.append(current_line)
-            lines += 1
-        
-        return ('\\N'.join(processed), lines)
+                emit(processed_text, current)
+
+        for start_c, end_c, placed in ASSGenerator._layout(danmu_clips, video_duration):
+            # 逐状态输出时每行的大小：固定部分 + 时间码 + {\\pos(x, y)} + 文本（用于对比）
+            line_base = fixed_bytes + timecodes_bytes(start_c, end_c) + len('{\\pos(, )}')
+            stats['snapshot_events'] += len(placed)
+            visible = end_c > start_c  # 时长为 0 的状态不会显示，只计入对比
+            seen = set()
+            for index, processed_text, x_pos, y_pos in placed:
+                pos = (x_pos, y_pos)
+                state = active.get(index)
+                appeared = state is None
+                if appeared:
+                    state = [processed_text, None, (pos, start_c, end_c), len(processed_text.encode('utf-8'))]
+                stats['snapshot_bytes'] += line_base + len(str(x_pos)) + len(str(y_pos)) + state[3]
+                if not visible:
+                    continue
+                seen.add(index)
+                if appeared:
+                    active[index] = state
+                    continue
+                current = state[2]
+                if current[0] == pos and current[2] == start_c:
+                    state[2] = (pos, current[1], end_c)  # 位置不变，延长当前段
+                elif state[1] is None:
+                    state[1], state[2] = current, (pos, start_c, end_c)
+                else:
+                    emit(processed_text, state[1], current)
+                    state[1], state[2] = None, (pos, start_c, end_c)
+            if not visible:
+                continue
+            # 离开弹幕框的弹幕输出剩余的段
+            for index in [index for index in active if index not in seen]:
+                finish(active.pop(index))
+
+            if len(texts) >= ASSGenerator.chunk_size:
+                writer.dialogues(starts, ends, 'Default', texts)
+                starts, ends, texts = [], [], []
+        for state in active.values():
+            finish(state)
+        if texts:
+            writer.dialogues(starts, ends, 'Default', texts)
+
+        events_ratio = stats['snapshot_events'] / max(stats['events'], 1)
+        bytes_ratio = stats['snapshot_bytes'] / max(stats['bytes'], 1)
+        return (f"弹幕框事件数: {stats['events']}（逐状态输出为 {stats['snapshot_events']}，减少到 1/{events_ratio:.1f}），"
+                f"事件大小: {stats['bytes'] / 1024:.0f} KB（逐状态输出为 {stats['snapshot_bytes'] / 1024:.0f} KB，"
+                f"减少到 1/{bytes_ratio:.1f}）")
 
     @staticmethod
-    def _seconds_to_timecode(seconds: float) -> str:
-        """秒数转时间码"""
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        seconds = seconds % 60
-        return f"{hours:01d}:{minutes:02d}:{seconds:06.2f}"
+    def _process_text(text: str, max_chars: int = AppConfig().comment_block_max_wide_chars) -> tuple:
+        """处理文本，使其不超过max_chars个全角字符，并添加换行符，返回处理后的文本和行数（结果有缓存）"""
+        return wrap_text(text, max_chars)
 
 # --------------------------
 # 工具函数
@@ -385,14 +393,22 @@ def CommentAssVideo():
             processor = DanmuProcessor(config)
             danmu_clips = processor.generate_danmu_clips()
 
-            # 生成ASS文件
-            ass_content = ASSGenerator.generate_capacity_based_ass(
-                danmu_clips, 
-                processor.video.size
-            )
-
-            with open(ass_path, 'w', encoding='utf-8') as f:
-                f.write(ass_content)
+            # 生成ASS文件（直接流式写入文件）
+            with AssWriter(ass_path) as writer:
+                if config.comment_block_emitter == 'lifetime':
+                    print(ASSGenerator.write_lifetime_ass(
+                        danmu_clips, 
+                        writer,
+                        processor.video.size,
+                        processor.video.duration
+                    ))
+                else:
+                    ASSGenerator.write_capacity_based_ass(
+                        danmu_clips, 
+                        writer,
+                        processor.video.size,
+                        processor.video.duration
+                    )
         else:
             print('Skipped ass generation...')
 
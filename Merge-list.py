@@ -8,6 +8,9 @@ from moviepy.editor import VideoFileClip, TextClip, CompositeVideoClip
 import pandas as pd
 from tqdm import tqdm
 
+from chatUtils.CommentStore import read_comments, TIMESTAMP, TRANSLATION
+from assUtils import wrap_text
+
 # --------------------------
 # 配置类（集中管理所有参数）
 # --------------------------
@@ -84,8 +87,9 @@ class DanmuProcessor:
 
     def _load_data(self):
         """加载并预处理弹幕数据"""
-        # 读取Excel
-        self.danmu_data = pd.read_excel(self.config.excel_path)
+        # 读取弹幕表（.arrow / .parquet / .xlsx），只投影需要的两列
+        self.danmu_data = read_comments(self.config.excel_path, columns=[TIMESTAMP, TRANSLATION])
+        self.danmu_data = self.danmu_data.rename(columns={TIMESTAMP: "时间", TRANSLATION: "翻译后"})
         print(f"原始弹幕数: {len(self.danmu_data)}条")
 
         # 截取起始弹幕
@@ -267,30 +271,8 @@ class ASSGenerator:
 
     @staticmethod
     def _process_text(text: str, max_chars: int = AppConfig().comment_block_max_wide_chars) -> tuple:
-        """处理文本，使其不超过max_chars个字符，并添加换行符，返回处理后的文本和行数"""
-        processed = []
-        current_line = ""
-        lines = 0
-        char_count = 0
-        
-        for char in text:
-            if '\u4e00' <= char <= '\u9fa5':  # 判断是否为中文字符
-                char_count += 1
-            else:
-                char_count += 0.5  # 英文/标点算半个字符
-            
-            if char_count <= max_chars:
-                current_line += char
-            else:
-                processed.append(current_line)
-                current_line = char
-                char_count = 1 if '\u4e00' <= char <= '\u9fa5' else 0.5
-                lines += 1
-        if current_line:
-            processed.append(current_line)
-            lines += 1
-        
-        return ('\\N'.join(processed), lines)
+        """处理文本，使其不超过max_chars个全角字符，并添加换行符，返回处理后的文本和行数（结果有缓存）"""
+        return wrap_text(text, max_chars)
 
     @staticmethod
     def _seconds_to_timecode(seconds: float) -> str:
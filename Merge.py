@@ -2,10 +2,12 @@ import os
 import subprocess
 import time
 from dataclasses import dataclass
-from typing import List, Dict
-from moviepy.editor import VideoFileClip, TextClip, CompositeVideoClip
+from typing import List, Dict, Optional
+import numpy as np
+from moviepy.editor import VideoFileClip
 import pandas as pd
-from tqdm import tqdm
+
+from assUtils import DanmakuColumns, AssWriter, EVENT_FORMAT, STYLE_FORMAT, get_font_metrics, LaneScheduler, DELAY
 
 # --------------------------
 # 配置类（集中管理所有参数）
@@ -23,23 +25,16 @@ class AppConfig:
     vertical_layers: int = 8         # 最大垂直分层数
     min_layer_height: int = 50       # 最小层高度（像素）
     font_size: int = 40              # 字体大小
-    scroll_duration: int = 12        # 默认滚动时长（秒）
+    font_name: str = 'SimHei'        # 字体名（与样式一致）
+    font_path: Optional[str] = None  # 字体文件路径，None 时按字体名在系统字体目录中查找
+    outline: int = 2                 # 边框宽度（与样式一致）
+    lane_gap: int = 20               # 同一层相邻弹幕的最小间距（像素）
+    lane_policy: str = DELAY         # 所有层都被占用时：DELAY 推迟 / DROP 丢弃 / OVERFLOW 放到覆盖层
+    max_delay: float = 3.0           # 最多推迟的秒数，超过则丢弃
 
     # FFmpeg参数
     ffmpeg_preset: str = 'fast'      # veryslowe, fast
 
-# --------------------------
-# 数据类（结构化数据处理）
-# --------------------------
-@dataclass
-class DanmuInfo:
-    text: str
-    start_time: float
-    end_time: float
-    layer: int
-    scroll_speed: int
-    text_width: int
-
 # --------------------------
 # 核心功能类
 # --------------------------
@@ -49,6 +44,7 @@ class DanmuProcessor:
         self.video = VideoFileClip(config.video_path)
         self.danmu_data = None
         self.layer_system = None
+        self.metrics = get_font_metrics(config.font_name, config.font_path)
 
         # 初始化验证
         self._validate_video()
@@ -62,23 +58,21 @@ class DanmuProcessor:
         print(f"视频帧率: {self.video.fps}")
 
     def _load_data(self):
-        """加载并预处理弹幕数据"""
-        # 读取Excel
-        self.danmu_data = pd.read_excel(self.config.excel_path)
+        """加载并预处理弹幕数据（列式，整列计算）"""
+        # 读取弹幕表（.arrow / .parquet / .xlsx），只投影时间戳和译文两列
+        self.danmu_data = DanmakuColumns.from_store(self.config.excel_path)
         print(f"原始弹幕数: {len(self.danmu_data)}条")
 
-        # 截取起始弹幕
-        if len(self.danmu_data) < self.config.start_comment_index:
-            raise ValueError("弹幕数据不足")
-        
-        baseline_time = self.danmu_data.loc[self.config.start_comment_index-1, "时间"]
-        self.danmu_data = self.danmu_data.iloc[self.config.start_comment_index-1:]
-        self.danmu_data["时间"] = (self.danmu_data["时间"] - baseline_time) / 1000
+        # 截取起始弹幕，以它的时间为 0 点
+        self.danmu_data = self.danmu_data.rebase(self.config.start_comment_index)
         
-        # 过滤超长弹幕
+        # 过滤超长弹幕和没有译文的弹幕（不占用轨道/弹幕框位置，也不输出空事件）
         original_count = len(self.danmu_data)
-        self.danmu_data = self.danmu_data[self.danmu_data["时间"] <= self.video.duration]
-        print(f"过滤后弹幕数: {len(self.danmu_data)}条 (过滤{original_count - len(self.danmu_data)}条)")
+        in_video = self.danmu_data.start <= self.video.duration
+        has_text = self.danmu_data.has_text()
+        self.danmu_data = self.danmu_data.take(in_video & has_text)
+        print(f"过滤后弹幕数: {len(self.danmu_data)}条 (过滤{original_count - len(self.danmu_data)}条，"
+              f"其中无译文{int((in_video & ~has_text).sum())}条)")
 
     def _init_layer_system(self):
         """初始化弹幕分层系统"""
@@ -91,114 +85,90 @@ class DanmuProcessor:
             top_third_height / self.config.vertical_layers
         )
         self.vertical_layers = int(top_third_height / layer_height)
-        
-        self.layer_system = {
-            'layer_height': layer_height,
-            'end_times': [0] * self.vertical_layers
-        }
+        self.layer_height = layer_height
+
+        # 按实际宽度和固定像素速度分配轨道，保证同一层的弹幕互不重叠
+        self.layer_system = LaneScheduler(
+            self.vertical_layers, video_width, self.config.scroll_speed,
+            gap=self.config.lane_gap, policy=self.config.lane_policy, max_delay=self.config.max_delay
+        )
         print(f"初始化分层系统: {self.vertical_layers}层，层高{layer_height:.1f}像素")
 
-    def _allocate_layer(self, start_time: float) -> int:
-        """智能分配弹幕层"""
-        # 似乎可以再优化一下
-        # 优先查找可用层
-        for layer, end_time in enumerate(self.layer_system['end_times']):
-            if start_time >= end_time:
-                return layer
-        
-        # 没有可用层时选择最早结束的层
-        return self.layer_system['end_times'].index(min(self.layer_system['end_times']))
+    def generate_danmu_clips(self) -> DanmakuColumns:
+        """生成弹幕剪辑信息：宽度、轨道、起止时间都是列"""
+        start_time = time.time()
+        # 轨道按出现时间顺序分配
+        danmu = self.danmu_data.sort_by_start()
 
-    def generate_danmu_clips(self) -> List[DanmuInfo]:
-        """生成弹幕剪辑信息"""
-        danmu_clips = []
-        video_width, _ = self.video.size
-        
-        for _, row in tqdm(self.danmu_data.iterrows(), total=len(self.danmu_data), desc="生成弹幕"):
-            # 解析基础信息
-            start_time = row["时间"]
-            text = row["翻译后"]
-            
-            # 创建文本剪辑
-            text_clip = TextClip(
-                text, 
-                fontsize=self.config.font_size,
-                color='white',
-                font='SimHei',
-                stroke_color='black',
-                stroke_width=1
-            )
-            
-            # 计算滚动参数
-            scroll_time = min(
-                self.config.scroll_duration,
-                self.video.duration - start_time
-            )
-            text_width = text_clip.size[0]
-            
-            # 分配弹幕层
-            layer = self._allocate_layer(start_time)
-            self.layer_system['end_times'][layer] = start_time + scroll_time
-            
-            # 记录弹幕信息
-            danmu_clips.append(DanmuInfo(
-                text=text,
-                start_time=start_time,
-                end_time=start_time + scroll_time,
-                layer=layer,
-                scroll_speed=self.config.scroll_speed,
-                text_width=text_width
-            ))
-        
-        return danmu_clips
+        # 按字体的字宽表计算宽度（含两侧边框），每种文本只计算一次
+        danmu.width = danmu.map_text(
+            lambda text: self.metrics.text_width(text, self.config.font_size, outline=self.config.outline),
+            dtype=np.float64
+        )
+
+        # 分配弹幕层：同一层中前一条的尾部离开右边缘后才能出现
+        danmu.lane, danmu.start, danmu.end, danmu.overflow = self.layer_system.place_many(danmu.start, danmu.width)
+        danmu = danmu.take((danmu.lane >= 0) & (danmu.start < self.video.duration))
+
+        # 视频结束时截断（滚动速度不变）
+        danmu.end = np.minimum(danmu.end, self.video.duration)
+
+        print(self.layer_system.report())
+        print(f"弹幕信息处理完成，耗时: {time.time() - start_time:.2f}秒")
+        return danmu
 
 class ASSGenerator:
+    # 每批格式化时间码并写出的弹幕条数，内存占用与弹幕总数无关
+    chunk_size = 4096
+
     @staticmethod
-    def generate(danmu_clips: List[DanmuInfo], video_size: tuple, config: AppConfig) -> str:
-        """生成ASS字幕内容"""
+    def write(danmu_clips: DanmakuColumns, video_size: tuple, config: AppConfig, writer: AssWriter,
+              layer_height: Optional[float] = None):
+        """把ASS字幕逐段写入 writer，不在内存中拼接整个文件"""
         # 样式头
-        ass_content = f"""\
-[Script Info]
-; Generated by Danmu Processor
-Title: Danmu Subtitles
-ScriptType: v4.00+
-WrapStyle: 0
-ScaledBorderAndShadow: yes
-YCbCr Matrix: TV.601
-PlayResX: {video_size[0]}
-PlayResY: {video_size[1]}
+        writer.section('[Script Info]')
+        writer.write_lines([
+            '; Generated by Danmu Processor',
+            'Title: Danmu Subtitles',
+            'ScriptType: v4.00+',
+            'WrapStyle: 0',
+            'ScaledBorderAndShadow: yes',
+            'YCbCr Matrix: TV.601',
+            f'PlayResX: {video_size[0]}',
+            f'PlayResY: {video_size[1]}',
+        ])
 
-[V4+ Styles]
-Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
-"""
         # 生成样式
-        layer_height = config.min_layer_height  # 实际计算值需从processor获取
+        writer.section('[V4+ Styles]')
+        writer.format(STYLE_FORMAT)
+        layer_height = layer_height or config.min_layer_height
         for layer in range(config.vertical_layers):
-            ass_content += f"Style: Layer{layer},SimHei,40,&H00000000,&H000000FF,&H00FFFFFF,&H80000000,-1,0,0,0,100,100,0,0,1,2,0,7,0,0,{layer * layer_height},0\n"
+            # 字体、字号和边框与测量宽度时使用的配置一致，轨道分配才能保证不重叠
+            writer.record('Style', [f'Layer{layer}', config.font_name, config.font_size, '&H00000000', '&H000000FF',
+                                    '&H00FFFFFF', '&H80000000', -1, 0, 0, 0, 100, 100, 0, 0, 1, config.outline, 0, 7,
+                                    0, 0, layer * layer_height, 0])
 
         # 事件头
-        ass_content += "\n[Events]\nFormat: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
-
-        # 弹幕条目
-        for danmu in danmu_clips:
-            start_tc = ASSGenerator._seconds_to_timecode(danmu.start_time)
-            end_tc = ASSGenerator._seconds_to_timecode(danmu.end_time)
-            y_pos = danmu.layer * config.min_layer_height  # 需与实际计算层高一致
-            
-            ass_content += (
-                f"Dialogue: 0,{start_tc},{end_tc},Layer{danmu.layer},,0,0,0,,"
-                f"{{\\move({video_size[0]}, {y_pos}, -500, {y_pos})}}{danmu.text}\n"
+        writer.section('[Events]')
+        writer.format(EVENT_FORMAT)
+
+        # 弹幕条目：分批写出，位置和移动时长按列计算，每批的时间码一次格式化
+        screen_width = video_size[0]
+        for i in range(0, len(danmu_clips), ASSGenerator.chunk_size):
+            chunk = danmu_clips.take(slice(i, i + ASSGenerator.chunk_size))
+            y_pos = np.rint(chunk.lane * layer_height).astype(np.int64)
+            # 从右边缘移动到尾部离开左边缘，移动时长按固定像素速度计算（不受视频结束截断影响）
+            end_x = -np.rint(chunk.width).astype(np.int64)
+            move_ms = np.rint((screen_width + chunk.width) / config.scroll_speed * 1000).astype(np.int64)
+            texts = [f"{{\\move({screen_width}, {y}, {x}, {y}, 0, {ms})}}{text}"
+                     for y, x, ms, text in zip(y_pos.tolist(), end_x.tolist(), move_ms.tolist(), chunk.text)]
+            writer.dialogues(
+                chunk.start,
+                chunk.end,
+                [f"Layer{lane}" for lane in chunk.lane.tolist()],
+                texts,
+                chunk.overflow.astype(np.int64).tolist()
             )
-        
-        return ass_content
-
-    @staticmethod
-    def _seconds_to_timecode(seconds: float) -> str:
-        """秒数转时间码"""
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        seconds = seconds % 60
-        return f"{hours:01d}:{minutes:02d}:{seconds:06.2f}"
 
 # --------------------------
 # 工具函数
@@ -234,20 +204,16 @@ def CommentAssVideo():
         processor = DanmuProcessor(config)
         danmu_clips = processor.generate_danmu_clips()
         
-        # 生成ASS文件
-        ass_content = ASSGenerator.generate(
-            danmu_clips, 
-            processor.video.size, 
-            config
-        )
-        
-        # 保存ASS文件到临时文件夹
-        # 修改后（方法一：转义反斜杠）
+        # 生成ASS文件（直接流式写入文件）
         ass_path = 'temp_danmu.ass'
-        if not os.path.exists('temp'):
-            os.makedirs('temp')
-        with open(ass_path, 'w', encoding='utf-8') as f:
-            f.write(ass_content)
+        with AssWriter(ass_path) as writer:
+            ASSGenerator.write(
+                danmu_clips, 
+                processor.video.size, 
+                config,
+                writer,
+                processor.layer_height
+            )
         
         # 合并视频
         run_ffmpeg(config, ass_path)
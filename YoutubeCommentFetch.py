@@ -1,27 +1,48 @@
-import pytchat
 import pandas as pd
 import os
 
-# 获取 YouTube 视频 ID
-def get_video_id(url):
-    if 'v=' in url:
-        return url.split('v=')[1].split('&')[0]
-    raise ValueError("Invalid YouTube URL")
+from chatUtils.ChatLog import ChatLogWriter, finalize_chat_log
+from chatUtils.ChatCheckpoint import ChatCheckpoint
+from chatUtils.ChatReplay import replay_live_chat_json
+from chatUtils.AsyncFetch import fetch_many
+from chatUtils.YoutubeChat import get_video_id, create_chat, message_to_record
+
+# 流式抓取日志目录
+LOG_ROOT = './ytbcomments/logs'
+# 流式抓取的最终输出格式（.arrow / .parquet 为列式弹幕存储，.xlsx 为旧版表格）
+OUTPUT_SUFFIX = '.arrow'
 
 # 获取实时弹幕数据
-def get_live_chat(video_id):
-    chat = pytchat.create(video_id=video_id)
-    chat_data = []
+def get_live_chat(video_id, log_writer=None, checkpoint=None):
+    """
+    获取实时弹幕
+    :param log_writer: 传入 ChatLogWriter 时按批次写入磁盘日志，不在内存中保留弹幕
+    :param checkpoint: 传入 ChatCheckpoint 时跳过已获取的弹幕并持续更新断点
+    :return: 未传入 log_writer 时返回全部弹幕列表，否则返回 None
+    """
+    chat = create_chat(video_id, checkpoint)
+    chat_data = [] if log_writer is None else None
+    total = 0
+    skipped = 0
 
     while chat.is_alive():
         for message in chat.get().items:
-            chat_data.append({
-                '时间': message.timestamp,
-                '用户名': message.author.name,
-                '弹幕内容': message.message,
-                '用户ID': message.author.channelId
-            })
-        print(f"已获取 {len(chat_data)} 条弹幕...")
+            record = message_to_record(message)
+            if checkpoint is not None:
+                if checkpoint.is_seen(record):
+                    skipped += 1
+                    continue
+                checkpoint.observe(record)
+            if log_writer is None:
+                chat_data.append(record)
+            else:
+                log_writer.append(record)
+            total += 1
+        if checkpoint is not None:
+            checkpoint.update_from_chat(chat)
+        if log_writer is not None:
+            log_writer.flush_if_due()
+        print(f"已获取 {total} 条弹幕..." + (f" (跳过已有 {skipped} 条)" if skipped else ''))
 
     return chat_data
 
@@ -35,12 +56,44 @@ def save_to_excel(data, video_id):
     print(f"弹幕数据已保存到 {file_path}")
 
 # 主函数
-def main(url):
+def main(url, streaming=True, batch_size=500, flush_interval=5.0, resume=True):
+    """
+    :param streaming: 是否使用流式抓取（边抓取边写入追加日志，结束后再压缩为 xlsx）
+    :param batch_size: 流式抓取时每批刷写的弹幕条数
+    :param flush_interval: 流式抓取时的最长刷写间隔（秒）
+    :param resume: 流式抓取时是否读取断点，跳过上次已经获取的弹幕
+    """
     video_id = get_video_id(url)
     print(f"正在获取视频 {video_id} 的实时弹幕...")
-    chat_data = get_live_chat(video_id)
-    save_to_excel(chat_data, video_id)
+    if not streaming:
+        chat_data = get_live_chat(video_id)
+        save_to_excel(chat_data, video_id)
+        return
+
+    log_dir = os.path.join(LOG_ROOT, video_id)
+    checkpoint = ChatCheckpoint.for_log_dir(log_dir) if resume else None
+    with ChatLogWriter(log_dir, batch_size=batch_size, flush_interval=flush_interval,
+                       on_flush=checkpoint.save if checkpoint else None) as writer:
+        get_live_chat(video_id, writer, checkpoint)
+    finalize_chat_log(log_dir, f'./ytbcomments/{video_id}_live_chat{OUTPUT_SUFFIX}')
+
+# 在同一进程中并发抓取多个视频（联动直播、批量补录回放）
+def main_many(urls, max_concurrency=4, batch_size=500, flush_interval=5.0, resume=True):
+    stats = fetch_many(urls, log_root=LOG_ROOT, max_concurrency=max_concurrency,
+                       batch_size=batch_size, flush_interval=flush_interval, resume=resume)
+    for video_id in stats:
+        finalize_chat_log(os.path.join(LOG_ROOT, video_id), f'./ytbcomments/{video_id}_live_chat{OUTPUT_SUFFIX}')
+
+# 离线回放：从录制的弹幕文件（如 yt-dlp 的 .live_chat.json）生成同样格式的弹幕数据
+def replay(dump_path, video_id=None):
+    video_id = video_id or os.path.basename(dump_path).split('.')[0]
+    log_dir = os.path.join(LOG_ROOT, video_id)
+    checkpoint = ChatCheckpoint.for_log_dir(log_dir)
+    with ChatLogWriter(log_dir, batch_size=5000, flush_interval=0, on_flush=checkpoint.save) as writer:
+        count = replay_live_chat_json(dump_path, writer, checkpoint)
+    print(f"回放 {dump_path}：新增 {count} 条弹幕")
+    finalize_chat_log(log_dir, f'./ytbcomments/{video_id}_live_chat{OUTPUT_SUFFIX}')
 
 if __name__ == '__main__':
     url = 'https://www.youtube.com/watch?v=D5KvM6aBGMg&t=458s&ab_channel=amiamiHobbyChannel'
-    main(url)
\ No newline at end of file
+    main(url)
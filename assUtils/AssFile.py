@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+import io
+import re
+
+import numpy as np
+from typing import Callable, Iterator, List, Optional, Sequence, TextIO, Tuple, Union
+
+# 带 Format 行、按字段解析的段落
+STYLE_SECTIONS = ('[v4+ styles]', '[v4 styles]')
+EVENT_SECTIONS = ('[events]',)
+
+EVENT_FORMAT = ['Layer', 'Start', 'End', 'Style', 'Name', 'MarginL', 'MarginR', 'MarginV', 'Effect', 'Text']
+STYLE_FORMAT = ['Name', 'Fontname', 'Fontsize', 'PrimaryColour', 'SecondaryColour', 'OutlineColour',
+                'BackColour', 'Bold', 'Italic', 'Underline', 'StrikeOut', 'ScaleX', 'ScaleY', 'Spacing',
+                'Angle', 'BorderStyle', 'Outline', 'Shadow', 'Alignment', 'MarginL', 'MarginR', 'MarginV',
+                'Encoding']
+
+_BOM = '\ufeff'
+_SECTION_RE = re.compile(r'^\s*\[[^\]]+\]\s*$')
+_RECORD_RE = re.compile(r'^([A-Za-z]+):(\s*)(.*?)(\r?\n)?$', re.S)
+# 覆盖标签块 {...}
+_TAG_RE = re.compile(r'\{[^}]*\}')
+# 文本中的换行：\N 硬换行，\n 软换行
+_BREAK_RE = re.compile(r'\\[Nn]')
+
+TAG = 'tag'
+TEXT = 'text'
+
+
+class AssFormat:
+    """Format 行：字段名到下标的映射"""
+    __slots__ = ('fields', 'index', 'raw')
+
+    def __init__(self, fields: Sequence[str], raw: Optional[str] = None):
+        self.fields = [f.strip() for f in fields]
+        self.index = {name.lower(): i for i, name in enumerate(self.fields)}
+        self.raw = raw
+
+    @classmethod
+    def parse(cls, line: str) -> 'AssFormat':
+        return cls(line.split(':', 1)[1].strip().split(','), raw=line)
+
+    def serialize(self, newline: str = '\n') -> str:
+        return self.raw if self.raw is not None else f"Format: {', '.join(self.fields)}{newline}"
+
+
+class AssRecord:
+    """
+    Style / Dialogue / Comment 等按 Format 解析的一行
+    未修改的记录按原始文本输出（逐字节一致），修改字段后按字段重新拼接
+    """
+    __slots__ = ('kind', 'values', 'format', '_raw', '_prefix', '_newline')
+
+    def __init__(self, kind: str, values: List[str], format: AssFormat,
+                 raw: Optional[str] = None, prefix: str = ' ', newline: str = '\n'):
+        self.kind = kind
+        self.values = values
+        self.format = format
+        self._raw = raw
+        self._prefix = prefix
+        self._newline = newline
+
+    @classmethod
+    def parse(cls, line: str, format: AssFormat) -> Optional['AssRecord']:
+        match = _RECORD_RE.match(line)
+        if match is None:
+            return None
+        kind, prefix, body, newline = match.groups()
+        # 最后一个字段（Text）可以包含逗号
+        values = body.split(',', len(format.fields) - 1)
+        if len(values) < len(format.fields):
+            return None
+        return cls(kind, values, format, raw=line, prefix=prefix, newline=newline or '')
+
+    def get(self, field: str) -> str:
+        return self.values[self.format.index[field.lower()]]
+
+    def set(self, field: str, value):
+        self.values[self.format.index[field.lower()]] = str(value)
+        self._raw = None
+
+    @property
+    def modified(self) -> bool:
+        return self._raw is None
+
+    @property
+    def text(self) -> str:
+        return self.values[-1]
+
+    @text.setter
+    def text(self, value: str):
+        self.values[-1] = value
+        self._raw = None
+
+    @property
+    def start(self) -> str:
+        return self.get('Start')
+
+    @property
+    def end(self) -> str:
+        return self.get('End')
+
+    @property
+    def style(self) -> str:
+        return self.get('Style')
+
+    @property
+    def name(self) -> str:
+        return self.get('Name')
+
+    def serialize(self) -> str:
+        if self._raw is not None:
+            return self._raw
+        # 保留原行的换行符（CRLF/LF/文件末尾没有换行），新建的记录默认为 \n
+        return self.kind + ':' + self._prefix + ','.join(self.values) + self._newline
+
+
+class AssSection:
+    """
+    一个段落：标题行 + 各行（原样保存的字符串，或解析后的 Format/AssRecord）
+    """
+    __slots__ = ('name', 'header', 'lines', 'format')
+
+    def __init__(self, name: str, header: Optional[str] = None):
+        self.name = name
+        self.header = header if header is not None else f"{name}\n"
+        self.lines: List[Union[str, AssFormat, AssRecord]] = []
+        self.format: Optional[AssFormat] = None
+
+    @property
+    def records(self) -> List[AssRecord]:
+        return [line for line in self.lines if isinstance(line, AssRecord)]
+
+    def serialize(self) -> str:
+        parts = [self.header]
+        for line in self.lines:
+            parts.append(line if isinstance(line, str) else line.serialize())
+        return ''.join(parts)
+
+
+def _parses_records(section_name: str) -> bool:
+    return section_name.lower() in STYLE_SECTIONS + EVENT_SECTIONS
+
+
+class AssDocument:
+    """
+    ASS 文件：标题之前的内容（preamble）+ 各段落
+    :param bom: 文件开头是否有 BOM，写出时保持一致
+    """
+
+    def __init__(self, preamble: str = '', sections: Optional[List[AssSection]] = None, bom: bool = False):
+        self.preamble = preamble
+        self.sections = sections or []
+        self.bom = bom
+
+    def section(self, name: str) -> Optional[AssSection]:
+        key = name.lower()
+        for section in self.sections:
+            if section.name.lower() == key:
+                return section
+        return None
+
+    @property
+    def styles(self) -> List[AssRecord]:
+        section = self.section('[V4+ Styles]') or self.section('[V4 Styles]')
+        return section.records if section else []
+
+    @property
+    def events(self) -> List[AssRecord]:
+        section = self.section('[Events]')
+        return section.records if section else []
+
+    def dialogues(self) -> List[AssRecord]:
+        return [event for event in self.events if event.kind == 'Dialogue']
+
+    def serialize(self) -> str:
+        return self.preamble + ''.join(section.serialize() for section in self.sections)
+
+
+# --------------------------
+# 解析
+# --------------------------
+def iter_ass_lines(lines: Iterator[str]) -> Iterator[Tuple[Optional[str], Union[str, AssFormat, AssRecord]]]:
+    """
+    逐行解析，产出 (段落名, 行)：段落标题行的段落名为 None、行为标题原文；
+    样式/事件段中的 Format 行和记录行解析为 AssFormat/AssRecord，其它行为原始字符串
+    不在内存中保留整个文件，可用于处理很大的文件
+    """
+    section = None
+    format = None
+    for line in lines:
+        if _SECTION_RE.match(line):
+            section = line.strip()
+            format = None
+            yield None, line
+            continue
+        if section is not None and _parses_records(section):
+            stripped = line.lstrip()
+            if stripped[:7].lower() == 'format:':
+                format = AssFormat.parse(line)
+                yield section, format
+                continue
+            if format is not None and not stripped.startswith(';'):
+                record = AssRecord.parse(line, format)
+                if record is not None:
+                    yield section, record
+                    continue
+        yield section, line
+
+
+def _open_text(path) -> Tuple[TextIO, bool]:
+    """以保留换行符的方式打开，返回 (文件, 是否有 BOM)"""
+    f = open(path, 'r', encoding='utf-8', newline='')
+    bom = f.read(1) == _BOM
+    if not bom:
+        f.seek(0)
+    return f, bom
+
+
+def parse_ass(text: str) -> AssDocument:
+    bom = text.startswith(_BOM)
+    if bom:
+        text = text[1:]
+    return _build_document(iter_ass_lines(io.StringIO(text, newline='')), bom)
+
+
+def read_ass(path) -> AssDocument:
+    """读取整个 ASS 文件"""
+    f, bom = _open_text(path)
+    with f:
+        return _build_document(iter_ass_lines(f), bom)
+
+
+def _build_document(items, bom: bool) -> AssDocument:
+    doc = AssDocument(bom=bom)
+    preamble = []
+    current = None
+    for section, line in items:
+        if section is None and isinstance(line, str) and _SECTION_RE.match(line):
+            current = AssSection(line.strip(), header=line)
+            doc.sections.append(current)
+            continue
+        if current is None:
+            preamble.append(line)
+            continue
+        if isinstance(line, AssFormat):
+            current.format = line
+        current.lines.append(line)
+    doc.preamble = ''.join(preamble)
+    return doc
+
+
+def write_ass(doc: AssDocument, path, bom: Optional[bool] = None):
+    """写出 ASS 文件；未修改的行与原文件逐字节一致"""
+    bom = doc.bom if bom is None else bom
+    with open(path, 'w', encoding='utf-8-sig' if bom else 'utf-8', newline='') as f:
+        f.write(doc.preamble)
+        for section in doc.sections:
+            f.write(section.serialize())
+
+
+def transform_ass(src_path, dst_path, fn: Callable[[str, AssRecord], Optional[AssRecord]]):
+    """
+    流式处理：逐行读取、逐行写出，内存占用与文件大小无关
+    :param fn: 对每条样式/事件记录调用 fn(段落名, 记录)，返回修改后的记录，返回 None 时删除该行
+    :return: 处理的记录数
+    """
+    count = 0
+    src, bom = _open_text(src_path)
+    with src, open(dst_path, 'w', encoding='utf-8-sig' if bom else 'utf-8', newline='') as dst:
+        for section, line in iter_ass_lines(src):
+            if isinstance(line, AssRecord):
+                count += 1
+                line = fn(section, line)
+                if line is None:
+                    continue
+            dst.write(line if isinstance(line, str) else line.serialize())
+    return count
+
+
+# --------------------------
+# 文本：覆盖标签和文字
+# --------------------------
+def tokenize_text(text: str) -> List[Tuple[str, str]]:
+    """把 Text 字段拆成 (TAG, '{...}') 和 (TEXT, 文字) 的序列"""
+    tokens = []
+    pos = 0
+    for match in _TAG_RE.finditer(text):
+        if match.start() > pos:
+            tokens.append((TEXT, text[pos:match.start()]))
+        tokens.append((TAG, match.group()))
+        pos = match.end()
+    if pos < len(text):
+        tokens.append((TEXT, text[pos:]))
+    return tokens
+
+
+def plain_text(text: str) -> str:
+    """去掉所有覆盖标签后的文字，\\N/\\n 转为换行符"""
+    return _BREAK_RE.sub('\n', ''.join(value for kind, value in tokenize_text(text) if kind == TEXT))
+
+
+def replace_text(text: str, new_text: str) -> str:
+    """
+    替换文字并保留所有覆盖标签：新文字放在原来第一段文字的位置，其余文字段删除，
+    标签的先后顺序不变；新文字中的换行符转为 \\N
+    """
+    new_text = new_text.replace('\r\n', '\n').replace('\n', '\\N')
+    parts = []
+    placed = False
+    for kind, value in tokenize_text(text):
+        if kind == TAG:
+            parts.append(value)
+        elif not placed:
+            parts.append(new_text)
+            placed = True
+    if not placed:
+        parts.append(new_text)
+    return ''.join(parts)
+
+
+# --------------------------
+# 时间码与写出
+# --------------------------
+def parse_timecode(tc: str) -> float:
+    """H:MM:SS.cc -> 秒"""
+    hours, minutes, seconds = tc.strip().split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def format_timecode(seconds: float) -> str:
+    """秒 -> H:MM:SS.cc（四舍五入到百分之一秒）"""
+    centis = int(round(max(seconds, 0.0) * 100))
+    hours, centis = divmod(centis, 360000)
+    minutes, centis = divmod(centis, 6000)
+    secs, centis = divmod(centis, 100)
+    return f"{hours:d}:{minutes:02d}:{secs:02d}.{centis:02d}"
+
+
+def format_timecodes(seconds) -> List[str]:
+    """批量把秒数转为时间码：取整和进位用数组运算一次完成，结果与 format_timecode 相同"""
+    centis = np.rint(np.maximum(np.asarray(seconds, dtype=np.float64), 0.0) * 100).astype(np.int64)
+    hours, centis = np.divmod(centis, 360000)
+    minutes, centis = np.divmod(centis, 6000)
+    secs, centis = np.divmod(centis, 100)
+    return [f"{h}:{m:02d}:{s:02d}.{c:02d}"
+            for h, m, s, c in zip(hours.tolist(), minutes.tolist(), secs.tolist(), centis.tolist())]
+
+
+class AssWriter:
+    """
+    逐行写出 ASS 文件，不在内存中拼接整个文件
+    用法：
+        with AssWriter(path) as w:
+            w.section('[Script Info]'); w.line('ScriptType: v4.00+')
+            w.section('[Events]'); w.format(EVENT_FORMAT); w.record('Dialogue', [...])
+    """
+
+    def __init__(self, path_or_file, bom: bool = False, newline: str = '\n', buffering: int = 1 << 16):
+        if isinstance(path_or_file, (str, bytes)) or hasattr(path_or_file, '__fspath__'):
+            self._file = open(path_or_file, 'w', encoding='utf-8-sig' if bom else 'utf-8', newline='',
+                              buffering=buffering)
+            self._owns = True
+        else:
+            self._file = path_or_file
+            self._owns = False
+        self.newline = newline
+        self._started = False
+
+    def line(self, text: str = ''):
+        self._file.write(text + self.newline)
+
+    def section(self, name: str):
+        if self._started:
+            self._file.write(self.newline)
+        self._started = True
+        self.line(name)
+
+    def format(self, fields: Sequence[str]):
+        self.line(f"Format: {', '.join(fields)}")
+
+    def record(self, kind: str, values: Sequence):
+        self.line(f"{kind}: {','.join(map(str, values))}")
+
+    def dialogue(self, start: Union[str, float], end: Union[str, float], style: str, text: str,
+                 layer: int = 0, name: str = '', margin_l: int = 0, margin_r: int = 0, margin_v: int = 0,
+                 effect: str = ''):
+        """按标准 EVENT_FORMAT 写一条 Dialogue；时间可以是秒数或已格式化的时间码"""
+        if not isinstance(start, str):
+            start = format_timecode(start)
+        if not isinstance(end, str):
+            end = format_timecode(end)
+        self._file.write(f"Dialogue: {layer},{start},{end},{style},{name},"
+                         f"{margin_l},{margin_r},{margin_v},{effect},{text}{self.newline}")
+
+    def dialogues(self, starts: Sequence[float], ends: Sequence[float], styles, texts: Sequence[str], layers=0):
+        """
+        批量写 Dialogue：一次格式化所有时间码
+        :param styles: 样式名，或与 texts 等长的样式名序列
+        :param layers: Layer，或与 texts 等长的 Layer 序列
+        """
+        nl = self.newline
+        styles = [styles] * len(texts) if isinstance(styles, str) else styles
+        layers = [layers] * len(texts) if isinstance(layers, int) else layers
+        self._file.writelines(
+            f"Dialogue: {layer},{start},{end},{style},,0,0,0,,{text}{nl}"
+            for start, end, style, text, layer in zip(format_timecodes(starts), format_timecodes(ends),
+                                                     styles, texts, layers))
+
+    def write_lines(self, lines):
+        """写出已拼好的多行（每个元素不含换行符）"""
+        nl = self.newline
+        self._file.writelines(line + nl for line in lines)
+
+    def close(self):
+        if self._owns:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
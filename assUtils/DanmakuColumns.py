@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from chatUtils.CommentStore import read_comment_table, TIMESTAMP, TRANSLATION
+
+
+class DanmakuRecord:
+    """单条弹幕的只读视图（调试或逐条处理时使用），读取字段时才从列中取值"""
+    __slots__ = ('_columns', 'index')
+
+    def __init__(self, columns: 'DanmakuColumns', index: int):
+        self._columns = columns
+        self.index = index
+
+    def __getattr__(self, name):
+        if name not in DanmakuColumns.FIELDS:
+            raise AttributeError(name)
+        value = getattr(self._columns, name)[self.index]
+        return value.item() if isinstance(value, np.generic) else value
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in DanmakuColumns.FIELDS)
+        return f"DanmakuRecord({fields})"
+
+
+class DanmakuColumns:
+    """
+    列式弹幕数据（struct of arrays）：每个字段一个 NumPy 数组，按下标对应，布局计算全部按列进行
+    text: 译文（object）；start / end: 出现和消失时间（秒，float64）；width: 宽度（像素，float64）；
+    lines: 换行后的行数（int32）；wrapped: 换行后的文本（object）；lane: 轨道（int32，-1 为未分配）；
+    overflow: 是否在覆盖层（bool）
+    """
+    FIELDS = ('text', 'start', 'end', 'width', 'lines', 'wrapped', 'lane', 'overflow')
+    __slots__ = FIELDS + ('_factorized',)
+
+    def __init__(self, text, start, **fields):
+        n = len(text)
+        self.text = np.asarray(text, dtype=object)
+        self.start = np.asarray(start, dtype=np.float64)
+        self.end = np.asarray(fields.get('end', self.start), dtype=np.float64)
+        self.width = np.asarray(fields.get('width', np.zeros(n)), dtype=np.float64)
+        self.lines = np.asarray(fields.get('lines', np.zeros(n)), dtype=np.int32)
+        self.wrapped = np.asarray(fields.get('wrapped', self.text), dtype=object)
+        self.lane = np.asarray(fields.get('lane', np.full(n, -1)), dtype=np.int32)
+        self.overflow = np.asarray(fields.get('overflow', np.zeros(n)), dtype=bool)
+        self._factorized = None
+
+    @classmethod
+    def from_store(cls, path) -> 'DanmakuColumns':
+        """
+        从弹幕表（.arrow / .parquet / .xlsx）只读取时间戳和译文两列
+        时间为相对第一条弹幕的秒数（先用整数毫秒相减，避免大时间戳的浮点误差）；缺失的译文为空字符串
+        """
+        table = read_comment_table(path, columns=[TIMESTAMP, TRANSLATION])
+        timestamps = table.column(TIMESTAMP).to_numpy()
+        text = table.column(TRANSLATION).to_numpy(zero_copy_only=False).astype(object)
+        text[pd.isna(text)] = ''
+        if len(timestamps):
+            timestamps = timestamps - timestamps[0]
+        return cls(text, timestamps / 1000)
+
+    def __len__(self):
+        return len(self.text)
+
+    def __getitem__(self, index: int) -> DanmakuRecord:
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        return DanmakuRecord(self, index % len(self))
+
+    def take(self, indices) -> 'DanmakuColumns':
+        """按下标数组或布尔掩码取子集（新对象）"""
+        return DanmakuColumns(self.text[indices], self.start[indices],
+                              **{name: getattr(self, name)[indices] for name in self.FIELDS[2:]})
+
+    def rebase(self, start_index: int) -> 'DanmakuColumns':
+        """从第 start_index 条弹幕（从1开始）开始截取，并以它的时间为 0 点"""
+        if len(self) < start_index:
+            raise ValueError("弹幕数据不足")
+        part = self.take(slice(start_index - 1, None))
+        baseline = part.start[0]
+        part.start = part.start - baseline
+        part.end = part.end - baseline
+        return part
+
+    def sort_by_start(self) -> 'DanmakuColumns':
+        """按出现时间排序（稳定排序，时间相同时保持原顺序）"""
+        order = np.argsort(self.start, kind='stable')
+        return self.take(order)
+
+    def has_text(self) -> np.ndarray:
+        """有译文的行的掩码：缺失（空字符串）或只有空白的译文为 False，这些行不参与布局"""
+        return self.map_text(lambda text: bool(text.strip()), dtype=bool)
+
+    def map_text(self, fn: Callable[[str], object], dtype=object) -> np.ndarray:
+        """对每种不同的文本只调用一次 fn，结果按行展开为数组"""
+        if self._factorized is None:
+            self._factorized = pd.factorize(self.text)
+        codes, uniques = self._factorized
+        values = np.empty(len(uniques), dtype=dtype)
+        for i, text in enumerate(uniques):
+            values[i] = fn(text)
+        return values[codes]
+
+
+def clamp_end(start: np.ndarray, duration: float, video_duration: Optional[float] = None) -> np.ndarray:
+    """结束时间 = 开始时间 + duration，不超过视频时长"""
+    end = start + duration
+    return end if video_duration is None else np.minimum(end, video_duration)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import heapq
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+# 所有轨道都被占用时的处理方式
+DELAY = 'delay'        # 推迟到最早空出的轨道（不超过 max_delay 秒）
+DROP = 'drop'          # 丢弃
+OVERFLOW = 'overflow'  # 放到覆盖层（另一组轨道，ASS Layer 更高），覆盖层也满时丢弃
+
+
+@dataclass
+class LanePlacement:
+    """
+    一条滚动弹幕的位置
+    :param lane: 轨道序号（从上到下）
+    :param start: 出现时间（秒），推迟时晚于原时间
+    :param end: 尾部离开屏幕左边缘的时间（秒）
+    :param overflow: 是否在覆盖层
+    """
+    lane: int
+    start: float
+    end: float
+    overflow: bool = False
+
+
+class LaneScheduler:
+    """
+    滚动弹幕的轨道分配：所有弹幕以相同的像素速度从右向左移动，
+    同一轨道中后一条弹幕必须等前一条的尾部离开屏幕右边缘（再加 gap 像素间距）才能出现；
+    速度相同时两条弹幕的距离保持不变，头部到达左边缘的时间也必然晚于前一条，因此不会重叠
+    空闲轨道按序号放在一个堆中（优先用最上面的轨道），占用中的轨道按空出时间放在另一个堆中，
+    每条弹幕的分配为 O(log 轨道数)
+    弹幕必须按出现时间顺序分配
+    :param lanes: 轨道数
+    :param screen_width: 画面宽度（像素）
+    :param speed: 滚动速度（像素/秒）
+    :param gap: 同一轨道中相邻弹幕的最小间距（像素）
+    :param policy: 所有轨道都被占用时的处理方式：DELAY / DROP / OVERFLOW
+    :param max_delay: DELAY 时最多推迟的秒数，超过则丢弃
+    """
+
+    def __init__(self, lanes: int, screen_width: float, speed: float, gap: float = 0.0,
+                 policy: str = DELAY, max_delay: float = 3.0):
+        if lanes <= 0 or speed <= 0:
+            raise ValueError("轨道数和滚动速度必须大于0")
+        if policy not in (DELAY, DROP, OVERFLOW):
+            raise ValueError(f"未知的处理方式: {policy}")
+        self.lanes = lanes
+        self.screen_width = screen_width
+        self.speed = speed
+        self.gap = gap
+        self.policy = policy
+        self.max_delay = max_delay
+        self.stats = Counter()
+        self._free = list(range(lanes))  # 空闲轨道（按序号）
+        self._busy = []                  # (尾部离开右边缘的时间, 轨道)
+        self._last_start = float('-inf')
+        self._overflow = LaneScheduler(lanes, screen_width, speed, gap, DROP) if policy == OVERFLOW else None
+
+    def duration(self, width: float) -> float:
+        """弹幕从头部进入右边缘到尾部离开左边缘的时长"""
+        return (self.screen_width + width) / self.speed
+
+    def _release(self, time: float):
+        while self._busy and self._busy[0][0] <= time:
+            _, lane = heapq.heappop(self._busy)
+            heapq.heappush(self._free, lane)
+
+    def place(self, start: float, width: float) -> Optional[LanePlacement]:
+        """
+        为出现时间为 start、宽度为 width 像素的弹幕分配轨道
+        :return: 位置；被丢弃时返回 None
+        """
+        if start < self._last_start:
+            raise ValueError("弹幕需按出现时间顺序分配轨道")
+        self._last_start = start
+        self._release(start)
+
+        if self._free:
+            lane = heapq.heappop(self._free)
+        elif self.policy == DELAY and self._busy[0][0] - start <= self.max_delay:
+            # 推迟到最早空出的轨道
+            ready, lane = heapq.heappop(self._busy)
+            self.stats['delayed'] += 1
+            self.stats['delay_seconds'] += ready - start
+            start = ready
+        elif self._overflow is not None:
+            placement = self._overflow.place(start, width)
+            if placement is None:
+                self.stats['dropped'] += 1
+                return None
+            placement.overflow = True
+            self.stats['overflow'] += 1
+            return placement
+        else:
+            self.stats['dropped'] += 1
+            return None
+
+        self.stats['placed'] += 1
+        heapq.heappush(self._busy, (start + (width + self.gap) / self.speed, lane))
+        return LanePlacement(lane, start, start + self.duration(width))
+
+    def place_many(self, starts: np.ndarray, widths: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        按列批量分配轨道（starts 需已按时间排序）
+        :return: (轨道, 出现时间, 尾部离开左边缘的时间, 是否在覆盖层) 四个数组；被丢弃的弹幕轨道为 -1
+        """
+        lanes, placed_starts, overflow = [], [], []
+        for start, width in zip(np.asarray(starts).tolist(), np.asarray(widths).tolist()):
+            placement = self.place(start, width)
+            if placement is None:
+                lanes.append(-1)
+                placed_starts.append(start)
+                overflow.append(False)
+            else:
+                lanes.append(placement.lane)
+                placed_starts.append(placement.start)
+                overflow.append(placement.overflow)
+        placed_starts = np.array(placed_starts, dtype=np.float64)
+        ends = placed_starts + (self.screen_width + np.asarray(widths, dtype=np.float64)) / self.speed
+        return np.array(lanes, dtype=np.int32), placed_starts, ends, np.array(overflow, dtype=bool)
+
+    def report(self) -> str:
+        s = self.stats
+        text = f"轨道分配：显示 {s['placed']} 条"
+        if s['delayed']:
+            text += f"（其中推迟 {s['delayed']} 条，平均 {s['delay_seconds'] / s['delayed']:.2f} 秒）"
+        if s['overflow']:
+            text += f"，覆盖层 {s['overflow']} 条"
+        return text + f"，丢弃 {s['dropped']} 条"
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional
+
+from fontTools.ttLib import TTFont
+
+from assUtils.AssFile import plain_text
+from assUtils.TextWrap import char_width
+
+# 常用字体名 -> 字体文件名（ASS 样式里写的是字体名，libass 通过系统字体库找到文件）
+FONT_FILES = {
+    'simhei': ['simhei.ttf'],
+    '黑体': ['simhei.ttf'],
+    'microsoft yahei': ['msyh.ttc', 'msyh.ttf'],
+    '微软雅黑': ['msyh.ttc', 'msyh.ttf'],
+    'simsun': ['simsun.ttc'],
+    '宋体': ['simsun.ttc'],
+    'noto sans cjk sc': ['NotoSansCJK-Regular.ttc', 'NotoSansCJKsc-Regular.otf'],
+}
+
+FONT_DIRS = [
+    Path(os.environ.get('WINDIR', r'C:\Windows')) / 'Fonts',
+    Path.home() / 'AppData' / 'Local' / 'Microsoft' / 'Windows' / 'Fonts',
+    Path('/usr/share/fonts'),
+    Path('/usr/local/share/fonts'),
+    Path.home() / '.fonts',
+    Path.home() / '.local' / 'share' / 'fonts',
+    Path('/Library/Fonts'),
+    Path('/System/Library/Fonts'),
+]
+
+
+def find_font(name: str) -> Optional[Path]:
+    """按字体名在系统字体目录中查找字体文件（也可以直接传入文件路径）"""
+    if os.path.isfile(name):
+        return Path(name)
+    candidates = FONT_FILES.get(name.lower(), [])
+    wanted = {c.lower() for c in candidates} | {f"{name.lower()}.{ext}" for ext in ('ttf', 'ttc', 'otf')}
+    for font_dir in FONT_DIRS:
+        if not font_dir.is_dir():
+            continue
+        for root, _, files in os.walk(font_dir):
+            for file in files:
+                if file.lower() in wanted:
+                    return Path(root) / file
+    return None
+
+
+class FontMetrics:
+    """
+    字体度量：加载一次字体，建立 字符 -> 字宽（字体单位）的表，按表计算文字宽度
+    缩放方式与 libass/VSFilter 一致：ASS 的字号是 (usWinAscent + usWinDescent) 对应的像素高度，
+    而不是 em 大小，因此字宽 = 字宽单位 * 字号 / (usWinAscent + usWinDescent)
+    找不到字体文件时按东亚宽度估算（全角字宽为字号，半角为一半，规则与 TextWrap 相同）
+    :param font: 字体名（如 SimHei）或字体文件路径
+    :param font_path: 字体文件路径，指定时不再按字体名查找
+    :param cache_size: 每种字体缓存的 (文本, 字号, ...) 测量结果条数
+    """
+
+    def __init__(self, font: str = 'SimHei', font_path: Optional[str] = None, cache_size: int = 65536):
+        self.font = font
+        self.path = Path(font_path) if font_path else find_font(font)
+        self._advances: Dict[int, int] = {}
+        if self.path is not None:
+            self._load(self.path)
+        else:
+            print(f"未找到字体 {font}，按字符宽度估算文字宽度")
+            self.units_per_em = 1000
+            self.height_units = 1000
+            self.default_advance = 1000
+        self.measure = lru_cache(maxsize=cache_size)(self._measure)
+
+    def _load(self, path: Path):
+        font = TTFont(str(path), fontNumber=0, lazy=True)
+        try:
+            self.units_per_em = font['head'].unitsPerEm
+            hmtx = font['hmtx'].metrics
+            self._advances = {cp: hmtx[glyph][0] for cp, glyph in font.getBestCmap().items() if glyph in hmtx}
+            os2 = font['OS/2'] if 'OS/2' in font else None
+            if os2 is not None and os2.usWinAscent + os2.usWinDescent > 0:
+                self.height_units = os2.usWinAscent + os2.usWinDescent
+            else:
+                hhea = font['hhea']
+                self.height_units = hhea.ascent - hhea.descent
+            self.default_advance = hmtx['.notdef'][0] if '.notdef' in hmtx else self.units_per_em
+        finally:
+            font.close()
+
+    def advance(self, char: str) -> int:
+        """单个字符的字宽（字体单位）；字体中没有的字符按东亚宽度估算（宽度不定的 A 类按全角）"""
+        units = self._advances.get(ord(char))
+        if units is not None:
+            return units
+        # 与换行使用同一套宽度规则（TextWrap.char_width）：全角为 1 em，半角为半个 em
+        return self.units_per_em * char_width(char) // 2
+
+    def _scale(self, size: float, scale_x: float) -> float:
+        return size / self.height_units * scale_x / 100
+
+    def _measure(self, text: str, size: float, scale_x: float = 100, spacing: float = 0,
+                 outline: float = 0) -> float:
+        lines = plain_text(text).split('\n')
+        scale = self._scale(size, scale_x)
+        widths = [sum(self.advance(c) for c in line) * scale + spacing * len(line) for line in lines]
+        return max(widths) + 2 * outline
+
+    def text_width(self, text: str, size: float, scale_x: float = 100, spacing: float = 0,
+                   outline: float = 0) -> float:
+        """
+        文字渲染后的宽度（像素），多行时取最长的一行
+        :param scale_x: 样式的 ScaleX（百分比）
+        :param spacing: 样式的 Spacing（每个字符额外的像素）
+        :param outline: 边框宽度，两侧各加一次，用于碰撞判断
+        """
+        if not isinstance(text, str) or not text:
+            return 2 * outline
+        return self.measure(text, size, scale_x, spacing, outline)
+
+    def cache_info(self):
+        return self.measure.cache_info()
+
+
+@lru_cache(maxsize=None)
+def get_font_metrics(font: str = 'SimHei', font_path: Optional[str] = None) -> FontMetrics:
+    """每种字体只加载一次"""
+    return FontMetrics(font, font_path)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import unicodedata
+from functools import lru_cache
+from typing import Tuple
+
+# 字符宽度，以半角为单位：0 不占宽度（组合符号、零宽字符），1 半角，2 全角
+# 全角包括 East Asian Width 为 W/F 的字符（汉字、假名、韩文、全角标点、大部分 emoji），
+# 以及 A（宽度不定，如 ○ ※ 希腊字母），因为黑体等中文字体把它们画成全角
+
+
+def _char_width(char: str) -> int:
+    if unicodedata.combining(char) or unicodedata.category(char) in ('Mn', 'Me', 'Cf'):
+        return 0
+    return 2 if unicodedata.east_asian_width(char) in ('W', 'F', 'A') else 1
+
+
+# 基本多文种平面的宽度表，导入时计算一次
+_BMP_WIDTHS = bytes(_char_width(chr(cp)) if not 0xd800 <= cp <= 0xdfff else 1 for cp in range(0x10000))
+
+
+@lru_cache(maxsize=4096)
+def _astral_width(char: str) -> int:
+    return _char_width(char)
+
+
+def char_width(char: str) -> int:
+    """单个字符的宽度（半角为 1，全角为 2）"""
+    cp = ord(char)
+    return _BMP_WIDTHS[cp] if cp < 0x10000 else _astral_width(char)
+
+
+def text_width(text: str) -> int:
+    """文本的宽度（半角为 1，全角为 2）"""
+    widths = _BMP_WIDTHS
+    return sum(widths[ord(c)] if ord(c) < 0x10000 else _astral_width(c) for c in text)
+
+
+@lru_cache(maxsize=65536)
+def wrap_text(text: str, max_chars: float) -> Tuple[str, int]:
+    """
+    按显示宽度逐字换行：每行不超过 max_chars 个全角字符（半角算半个），原有的换行符保留
+    结果按 (文本, 宽度) 缓存，同一条弹幕只计算一次
+    :return: (用 \\N 连接的文本, 行数)
+    """
+    if not text:
+        return '', 0
+    limit = max_chars * 2
+    widths = _BMP_WIDTHS
+    lines = []
+    for part in text.replace('\r\n', '\n').split('\n'):
+        start = 0
+        used = 0
+        for i, char in enumerate(part):
+            cp = ord(char)
+            width = widths[cp] if cp < 0x10000 else _astral_width(char)
+            if used + width > limit and i > start:
+                lines.append(part[start:i])
+                start = i
+                used = 0
+            used += width
+        lines.append(part[start:])
+    return '\\N'.join(lines), len(lines)
@@ -0,0 +1,7 @@
+from .AssFile import (AssDocument, AssSection, AssFormat, AssRecord, AssWriter, read_ass, parse_ass, write_ass,
+                      iter_ass_lines, transform_ass, tokenize_text, plain_text, replace_text,
+                      parse_timecode, format_timecode, format_timecodes, EVENT_FORMAT, STYLE_FORMAT)
+from .TextMetrics import FontMetrics, get_font_metrics, find_font
+from .LaneScheduler import LaneScheduler, LanePlacement, DELAY, DROP, OVERFLOW
+from .TextWrap import wrap_text, text_width, char_width
+from .DanmakuColumns import DanmakuColumns, DanmakuRecord, clamp_end
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+from chatUtils.ChatLog import ChatLogWriter
+from chatUtils.ChatCheckpoint import ChatCheckpoint
+from chatUtils.YoutubeChat import get_video_id, create_chat, message_to_record
+
+
+# --------------------------
+# 弹幕源
+# --------------------------
+class PytchatSource:
+    """
+    pytchat 弹幕源：阻塞的轮询放到线程中执行，不占用事件循环
+    非主线程不能注册信号处理，因此关闭 interruptable
+    """
+
+    def __init__(self, video_id: str, checkpoint: Optional[ChatCheckpoint] = None):
+        self.video_id = video_id
+        self.checkpoint = checkpoint
+        self._chat = None
+
+    def _poll(self) -> Optional[List[Dict]]:
+        if self._chat is None:
+            self._chat = create_chat(self.video_id, self.checkpoint, interruptable=False)
+        if not self._chat.is_alive():
+            return None
+        records = [message_to_record(message) for message in self._chat.get().items]
+        if self.checkpoint is not None:
+            self.checkpoint.update_from_chat(self._chat)
+        return records
+
+    async def next_batch(self) -> Optional[List[Dict]]:
+        """返回下一批弹幕，直播结束时返回 None"""
+        return await asyncio.to_thread(self._poll)
+
+    async def close(self):
+        if self._chat is not None:
+            await asyncio.to_thread(self._chat.terminate)
+
+
+class FakeChatSource:
+    """
+    本地假弹幕源，用于测试和基准测试
+    :param records: 要依次输出的弹幕记录
+    :param batch_size: 每次输出多少条
+    :param delay: 每批之间的等待时间（秒），模拟网络轮询
+    """
+
+    def __init__(self, records: Iterable[Dict], batch_size: int = 50, delay: float = 0.0):
+        self._records = list(records)
+        self.batch_size = batch_size
+        self.delay = delay
+        self._pos = 0
+
+    async def next_batch(self) -> Optional[List[Dict]]:
+        if self._pos >= len(self._records):
+            return None
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        batch = self._records[self._pos:self._pos + self.batch_size]
+        self._pos += len(batch)
+        return batch
+
+    async def close(self):
+        pass
+
+
+# --------------------------
+# 抓取管理
+# --------------------------
+@dataclass
+class FetchStats:
+    video_id: str
+    messages: int = 0
+    skipped: int = 0
+    started: float = 0.0
+    finished: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished or time.monotonic()
+        return max(end - self.started, 1e-9) if self.started else 0.0
+
+    @property
+    def rate(self) -> float:
+        """吞吐量（条/秒）"""
+        return self.messages / self.elapsed if self.started else 0.0
+
+
+@dataclass
+class ChatFetchManager:
+    """
+    在单个进程中用 asyncio 并发抓取多个视频的弹幕
+    :param source_factory: (video_id, checkpoint) -> 弹幕源
+    :param log_root: 每个视频的日志写在 log_root/<video_id> 下
+    :param max_concurrency: 同时抓取的视频数上限
+    :param report_interval: 打印吞吐统计的间隔（秒），0 表示不打印
+    """
+    source_factory: Callable = PytchatSource
+    log_root: str = './ytbcomments/logs'
+    max_concurrency: int = 4
+    batch_size: int = 500
+    flush_interval: float = 5.0
+    resume: bool = True
+    report_interval: float = 10.0
+    stats: Dict[str, FetchStats] = field(default_factory=dict)
+
+    def log_dir(self, video_id: str) -> str:
+        return os.path.join(self.log_root, video_id)
+
+    async def run(self, urls_or_ids: Iterable[str]) -> Dict[str, FetchStats]:
+        video_ids = list(dict.fromkeys(get_video_id(u) for u in urls_or_ids))
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        for video_id in video_ids:
+            self.stats[video_id] = FetchStats(video_id)
+
+        reporter = asyncio.create_task(self._report_loop()) if self.report_interval else None
+        try:
+            await asyncio.gather(*(self._fetch_one(video_id, semaphore) for video_id in video_ids))
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+        self.report()
+        return self.stats
+
+    async def _fetch_one(self, video_id: str, semaphore: asyncio.Semaphore):
+        stats = self.stats[video_id]
+        async with semaphore:
+            log_dir = self.log_dir(video_id)
+            checkpoint = ChatCheckpoint.for_log_dir(log_dir) if self.resume else None
+            source = self.source_factory(video_id, checkpoint)
+            writer = ChatLogWriter(log_dir, batch_size=self.batch_size, flush_interval=self.flush_interval,
+                                   on_flush=checkpoint.save if checkpoint else None)
+            stats.started = time.monotonic()
+            try:
+                while True:
+                    batch = await source.next_batch()
+                    if batch is None:
+                        break
+                    fresh = []
+                    for record in batch:
+                        if checkpoint is not None:
+                            if checkpoint.is_seen(record):
+                                stats.skipped += 1
+                                continue
+                            checkpoint.observe(record)
+                        fresh.append(record)
+                    if fresh:
+                        # 写盘（含 fsync）放到线程中，每个视频的写入器只被自己的任务顺序使用
+                        await asyncio.to_thread(writer.extend, fresh)
+                        stats.messages += len(fresh)
+                    elif writer.pending:
+                        # 没有新弹幕时也按 flush_interval 把缓冲区落盘
+                        await asyncio.to_thread(writer.flush_if_due)
+            except Exception as e:
+                stats.error = str(e)
+                print(f"[{video_id}] 抓取失败: {e}")
+            finally:
+                await asyncio.to_thread(writer.close)
+                await source.close()
+                stats.finished = time.monotonic()
+
+    async def _report_loop(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self.report()
+
+    def report(self):
+        for s in self.stats.values():
+            state = '失败' if s.error else ('完成' if s.finished else ('抓取中' if s.started else '等待中'))
+            print(f"[{s.video_id}] {state} 已获取 {s.messages} 条 (跳过 {s.skipped} 条)，{s.rate:.1f} 条/秒")
+
+
+def fetch_many(urls_or_ids: Iterable[str], **kwargs) -> Dict[str, FetchStats]:
+    """同步入口：并发抓取多个视频"""
+    manager = ChatFetchManager(**kwargs)
+    return asyncio.run(manager.run(urls_or_ids))
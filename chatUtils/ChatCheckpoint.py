@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+from collections import deque
+from pathlib import Path
+from typing import Dict, Optional
+
+from chatUtils.ChatLog import list_segments
+
+CHECKPOINT_FILE = 'checkpoint.json'
+
+
+class ChatCheckpoint:
+    """
+    弹幕抓取断点：记录最后的 continuation、时间戳和最近的消息ID，重启后跳过已获取的弹幕
+    continuation 只能用于续接存档回放（is_replay）；直播中的视频重新按视频ID连接，再按消息ID去重
+    :param path: 断点文件路径
+    :param max_ids: 最多保留多少个最近的消息ID用于去重
+    """
+
+    def __init__(self, path, max_ids: int = 5000):
+        self.path = Path(path)
+        self.max_ids = max_ids
+        self.continuation: Optional[str] = None
+        self.is_replay = False
+        self.last_timestamp = 0
+        # 被挤出ID窗口的弹幕中最新的时间戳，早于它的弹幕一定已经获取过
+        self.floor_timestamp = 0
+        self.total_records = 0
+        self._recent_ids = deque()
+        self._id_set = set()
+
+    @classmethod
+    def for_log_dir(cls, log_dir, max_ids: int = 5000) -> 'ChatCheckpoint':
+        """
+        加载与日志目录配套的断点
+        断点只在日志刷写后保存，崩溃时两者之间可能差一个批次，因此再用最后一个分段补齐
+        """
+        checkpoint = cls(Path(log_dir) / CHECKPOINT_FILE, max_ids)
+        checkpoint.load()
+        segments = list_segments(log_dir)
+        if segments:
+            with open(segments[-1], 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        checkpoint._observe_id(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+        return checkpoint
+
+    def load(self) -> bool:
+        if not self.path.exists():
+            return False
+        with open(self.path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        self.continuation = state.get('continuation')
+        self.is_replay = state.get('is_replay', False)
+        self.last_timestamp = state.get('last_timestamp', 0)
+        self.floor_timestamp = state.get('floor_timestamp', 0)
+        self.total_records = state.get('total_records', 0)
+        for message_id, timestamp in state.get('message_ids', []):
+            self._remember(message_id, timestamp)
+        return True
+
+    def save(self):
+        """原子写入断点文件（先写临时文件再替换）"""
+        state = {
+            'continuation': self.continuation,
+            'is_replay': self.is_replay,
+            'last_timestamp': self.last_timestamp,
+            'floor_timestamp': self.floor_timestamp,
+            'total_records': self.total_records,
+            'message_ids': list(self._recent_ids),
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def is_seen(self, record: Dict) -> bool:
+        """
+        判断弹幕是否已经获取过：ID命中窗口，或早于窗口中最旧的弹幕
+        没有ID的记录只能按时间判断
+        """
+        timestamp = record.get('时间') or 0
+        message_id = record.get('消息ID')
+        if not message_id:
+            return timestamp <= self.last_timestamp
+        return message_id in self._id_set or timestamp < self.floor_timestamp
+
+    def observe(self, record: Dict):
+        """记录一条新写入的弹幕"""
+        self._observe_id(record)
+        self.total_records += 1
+
+    def _observe_id(self, record: Dict):
+        timestamp = record.get('时间') or 0
+        message_id = record.get('消息ID')
+        if message_id:
+            self._remember(message_id, timestamp)
+        if timestamp > self.last_timestamp:
+            self.last_timestamp = timestamp
+
+    def _remember(self, message_id, timestamp):
+        if message_id in self._id_set:
+            return
+        if len(self._recent_ids) >= self.max_ids:
+            old_id, old_timestamp = self._recent_ids.popleft()
+            self._id_set.discard(old_id)
+            self.floor_timestamp = max(self.floor_timestamp, old_timestamp)
+        self._recent_ids.append((message_id, timestamp))
+        self._id_set.add(message_id)
+
+    def replay_continuation(self) -> Optional[str]:
+        """续接用的 continuation：只有存档回放才返回，直播中的视频返回 None"""
+        return self.continuation if self.is_replay else None
+
+    def update_from_chat(self, chat):
+        """轮询后记录 pytchat 连接的 continuation 和是否为存档回放"""
+        self.continuation = getattr(chat, 'continuation', self.continuation)
+        is_replay = getattr(chat, 'is_replay', None)
+        if callable(is_replay):
+            self.is_replay = bool(is_replay())
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+# 弹幕记录的列顺序（与 save_to_excel 输出保持一致）
+CHAT_COLUMNS = ['时间', '用户名', '弹幕内容', '用户ID', '消息ID']
+
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.jsonl'
+
+
+class ChatLogWriter:
+    """
+    追加写入的弹幕日志：按批次把弹幕刷写到 JSONL 分段文件中，内存占用只与批次大小有关
+    :param log_dir: 日志目录，每个视频一个目录
+    :param batch_size: 缓冲区达到多少条时刷写
+    :param flush_interval: 距上次刷写超过多少秒时刷写（0 表示只按批次大小刷写）
+    :param segment_max_records: 单个分段文件的最大条数，超过后切换到新分段
+    :param on_flush: 每次刷写落盘后的回调（例如保存抓取断点）
+    """
+
+    def __init__(self, log_dir, batch_size: int = 500, flush_interval: float = 5.0,
+                 segment_max_records: int = 100000, on_flush: Optional[Callable[[], None]] = None):
+        self.log_dir = Path(log_dir)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.segment_max_records = max(1, segment_max_records)
+        self.on_flush = on_flush
+
+        self._buffer: List[Dict] = []
+        self._last_flush = time.monotonic()
+        self.total_records = 0
+
+        # 续写已有日志：从最后一个分段继续
+        segments = list_segments(self.log_dir)
+        if segments:
+            _truncate_partial_line(segments[-1])
+            self._segment_index = _segment_number(segments[-1])
+            self._segment_records = _count_lines(segments[-1])
+        else:
+            self._segment_index = 1
+            self._segment_records = 0
+
+    @property
+    def segment_path(self) -> Path:
+        return self.log_dir / f"{SEGMENT_PREFIX}{self._segment_index:06d}{SEGMENT_SUFFIX}"
+
+    def append(self, record: Dict):
+        """追加一条弹幕记录，必要时触发刷写"""
+        self._buffer.append(record)
+        self.total_records += 1
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    @property
+    def pending(self) -> int:
+        """缓冲区中尚未落盘的条数"""
+        return len(self._buffer)
+
+    def flush_if_due(self):
+        """
+        距上次刷写超过 flush_interval 时刷写
+        抓取循环每次轮询后调用，弹幕稀少（没有新的 append）时缓冲区也能按时落盘
+        """
+        if self._buffer and self.flush_interval and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def flush(self):
+        """把缓冲区写入当前分段并落盘"""
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        while self._buffer:
+            # 当前分段已满时切换到下一个分段
+            if self._segment_records >= self.segment_max_records:
+                self._segment_index += 1
+                self._segment_records = 0
+            room = self.segment_max_records - self._segment_records
+            batch, self._buffer = self._buffer[:room], self._buffer[room:]
+            lines = ''.join(json.dumps(r, ensure_ascii=False, default=str) + '\n' for r in batch)
+            with open(self.segment_path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            self._segment_records += len(batch)
+        if self.on_flush is not None:
+            self.on_flush()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 异常退出（包括 Ctrl-C）时也要把缓冲区写完
+        self.close()
+        return False
+
+
+def list_segments(log_dir) -> List[Path]:
+    """按序返回日志目录中的分段文件"""
+    log_dir = Path(log_dir)
+    if not log_dir.exists():
+        return []
+    return sorted(log_dir.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"), key=_segment_number)
+
+
+def iter_chat_log(log_dir) -> Iterator[Dict]:
+    """
+    逐条读取弹幕日志
+    进程崩溃时最后一行可能只写了一半，这种行会被跳过
+    """
+    for segment in list_segments(log_dir):
+        with open(segment, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"跳过损坏的日志行: {segment.name}:{line_no}")
+
+
+def finalize_chat_log(log_dir, output_path: str, columns: Optional[List[str]] = None) -> int:
+    """
+    把日志分段压缩为下游使用的文件（逐批写出，不把整份数据读入内存）
+    .arrow / .parquet 写为列式弹幕存储，.xlsx 写为旧版表格
+    :return: 写出的弹幕条数
+    """
+    from chatUtils.CommentStore import is_store_path, write_comment_records
+
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    if is_store_path(output_path):
+        count = write_comment_records(iter_chat_log(log_dir), output_path)
+        print(f"日志已压缩为 {output_path}，共 {count} 条弹幕")
+        return count
+
+    from openpyxl import Workbook
+
+    columns = columns or CHAT_COLUMNS
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(columns)
+    count = 0
+    for record in iter_chat_log(log_dir):
+        ws.append([record.get(col) for col in columns])
+        count += 1
+    wb.save(output_path)
+    print(f"日志已压缩为 {output_path}，共 {count} 条弹幕")
+    return count
+
+
+def _segment_number(path: Path) -> int:
+    return int(path.name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+
+def _truncate_partial_line(path: Path):
+    """截掉崩溃时写了一半的最后一行，避免续写的记录与它拼在一起"""
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+
+def _count_lines(path: Path) -> int:
+    with open(path, 'rb') as f:
+        return sum(1 for _ in f)
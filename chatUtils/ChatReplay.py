@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+from typing import Dict, Iterator, Optional
+
+# 只处理普通弹幕和SC，其余动作（置顶、会员通知等）跳过
+MESSAGE_RENDERERS = ('liveChatTextMessageRenderer', 'liveChatPaidMessageRenderer')
+
+
+def iter_live_chat_json(path) -> Iterator[Dict]:
+    """
+    流式解析已录制的弹幕文件（如 yt-dlp 的 .live_chat.json，每行一个JSON对象）
+    输出与 YoutubeCommentFetch 相同结构的弹幕记录
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            # 先做子串判断，跳过不含弹幕的行以免无谓的 json 解析
+            if 'addChatItemAction' not in line:
+                continue
+            try:
+                obj = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            actions = obj.get('replayChatItemAction', obj).get('actions', [])
+            for action in actions:
+                item = action.get('addChatItemAction', {}).get('item', {})
+                for renderer_name in MESSAGE_RENDERERS:
+                    renderer = item.get(renderer_name)
+                    if renderer is not None:
+                        yield renderer_to_record(renderer)
+                        break
+
+
+def renderer_to_record(renderer: Dict) -> Dict:
+    """把 liveChat*MessageRenderer 转换为弹幕记录"""
+    return {
+        '时间': int(renderer.get('timestampUsec', 0)) // 1000,
+        '用户名': renderer.get('authorName', {}).get('simpleText', ''),
+        '弹幕内容': runs_to_text(renderer.get('message', {}).get('runs', [])),
+        '用户ID': renderer.get('authorExternalChannelId', ''),
+        '消息ID': renderer.get('id', ''),
+    }
+
+
+def runs_to_text(runs) -> str:
+    """拼接消息片段，自定义表情输出为 :_stamp: 形式的短码（与 pytchat 一致）"""
+    parts = []
+    for run in runs:
+        if 'text' in run:
+            parts.append(run['text'])
+            continue
+        emoji = run.get('emoji')
+        if not emoji:
+            continue
+        shortcuts = emoji.get('shortcuts') or []
+        if emoji.get('isCustomEmoji') and shortcuts:
+            parts.append(shortcuts[0])
+        else:
+            parts.append(emoji.get('emojiId') or (shortcuts[0] if shortcuts else ''))
+    return ''.join(parts)
+
+
+def replay_live_chat_json(path, log_writer, checkpoint=None) -> int:
+    """
+    把录制的弹幕文件回放到弹幕日志中（不需要网络）
+    :param checkpoint: 传入 ChatCheckpoint 时跳过已写入的弹幕
+    :return: 新写入的弹幕条数
+    """
+    count = 0
+    for record in iter_live_chat_json(path):
+        if checkpoint is not None:
+            if checkpoint.is_seen(record):
+                continue
+            checkpoint.observe(record)
+        log_writer.append(record)
+        count += 1
+    return count
+
+
+def benchmark_replay(path, repeat: int = 1) -> Optional[float]:
+    """测量解析速度（条/秒）"""
+    start = time.perf_counter()
+    count = 0
+    for _ in range(repeat):
+        for _ in iter_live_chat_json(path):
+            count += 1
+    elapsed = time.perf_counter() - start
+    if count == 0:
+        return None
+    print(f"解析 {count} 条弹幕，耗时 {elapsed:.2f}秒，{count / elapsed:.0f} 条/秒")
+    return count / elapsed
+
+
+if __name__ == '__main__':
+    import sys
+    benchmark_replay(sys.argv[1])
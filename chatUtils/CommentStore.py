@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+列式弹幕存储：各阶段（抓取 -> 翻译 -> 生成ASS）之间的交换格式
+.arrow / .feather 为 Arrow IPC 文件（不压缩，可内存映射零拷贝读取），.parquet 为 Parquet 文件，
+.xlsx 仅作为导入/导出格式保留
+"""
+import os
+import ast
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# 列名
+TIMESTAMP = 'timestamp'      # 毫秒时间戳 int64
+AUTHOR = 'author'
+AUTHOR_ID = 'author_id'
+MESSAGE_ID = 'message_id'
+TEXT = 'text'
+TRANSLATION = 'translation'
+BACKEND = 'backend'          # 产生译文的翻译服务
+TOKENS = 'tokens'            # 消耗的tokens
+
+COMMENT_SCHEMA = pa.schema([
+    pa.field(TIMESTAMP, pa.int64()),
+    pa.field(AUTHOR, pa.string()),
+    pa.field(AUTHOR_ID, pa.string()),
+    pa.field(MESSAGE_ID, pa.string()),
+    pa.field(TEXT, pa.string()),
+    pa.field(TRANSLATION, pa.string()),
+    pa.field(BACKEND, pa.string()),
+    pa.field(TOKENS, pa.int64()),
+])
+
+# 旧版 xlsx / 弹幕日志中的中文列名
+LEGACY_COLUMNS = {
+    '时间': TIMESTAMP,
+    '用户名': AUTHOR,
+    '用户ID': AUTHOR_ID,
+    '消息ID': MESSAGE_ID,
+    '弹幕内容': TEXT,
+    '翻译后': TRANSLATION,
+}
+
+IPC_SUFFIXES = ('.arrow', '.feather', '.ipc')
+PARQUET_SUFFIXES = ('.parquet',)
+EXCEL_SUFFIXES = ('.xlsx', '.xls')
+
+
+def _suffix(path) -> str:
+    return os.path.splitext(str(path))[1].lower()
+
+
+def is_store_path(path) -> bool:
+    return _suffix(path) in IPC_SUFFIXES + PARQUET_SUFFIXES
+
+
+# --------------------------
+# 读取
+# --------------------------
+def read_comment_table(path, columns: Optional[List[str]] = None, memory_map: bool = True) -> pa.Table:
+    """
+    读取弹幕表
+    :param columns: 只读取这些列（列投影）
+    :param memory_map: IPC/Parquet 文件使用内存映射读取
+    """
+    suffix = _suffix(path)
+    if suffix in IPC_SUFFIXES:
+        # 读完即关闭文件（Windows 下未关闭的文件无法被随后的 write_comments 覆盖）
+        with (pa.memory_map(str(path), 'r') if memory_map else pa.OSFile(str(path), 'rb')) as source:
+            table = pa.ipc.open_file(source).read_all()
+        return table.select(columns) if columns else table
+    if suffix in PARQUET_SUFFIXES:
+        return pq.read_table(str(path), columns=columns, memory_map=memory_map)
+    if suffix in EXCEL_SUFFIXES:
+        table = frame_to_table(import_excel(path))
+        return table.select(columns) if columns else table
+    raise ValueError(f"不支持的弹幕文件格式: {path}")
+
+
+def read_comments(path, columns: Optional[List[str]] = None, memory_map: bool = True) -> pd.DataFrame:
+    """读取弹幕表为 DataFrame（列名为英文标准列名）"""
+    return read_comment_table(path, columns, memory_map).to_pandas()
+
+
+def import_excel(path) -> pd.DataFrame:
+    """导入旧版 xlsx（中文列名，翻译后列可能是 {'trans_res': ..., 'tokens_cost': ...} 字符串）"""
+    return from_legacy_frame(pd.read_excel(path))
+
+
+def from_legacy_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """中文列名的 DataFrame 转换为标准列"""
+    df = df.rename(columns=LEGACY_COLUMNS)
+    if TRANSLATION in df.columns:
+        parsed = df[TRANSLATION].map(_parse_legacy_translation)
+        df[TRANSLATION] = parsed.map(lambda x: x[0])
+        if TOKENS not in df.columns:
+            df[TOKENS] = parsed.map(lambda x: x[1])
+    return conform_frame(df)
+
+
+def _parse_legacy_translation(value):
+    """旧版翻译结果是字典的字符串形式，解析出译文和tokens"""
+    if isinstance(value, dict):
+        return value.get('trans_res'), value.get('tokens_cost', 0)
+    if not isinstance(value, str):
+        return None, 0
+    if value.startswith('{') and 'trans_res' in value:
+        try:
+            data = ast.literal_eval(value)
+            return data.get('trans_res'), data.get('tokens_cost', 0)
+        except (ValueError, SyntaxError):
+            pass
+    return value, 0
+
+
+def conform_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """补齐缺失列并统一类型"""
+    df = df.copy()
+    for field in COMMENT_SCHEMA:
+        if field.name not in df.columns:
+            df[field.name] = 0 if pa.types.is_integer(field.type) else None
+    df[TIMESTAMP] = pd.to_numeric(df[TIMESTAMP], errors='coerce').fillna(0).astype('int64')
+    df[TOKENS] = pd.to_numeric(df[TOKENS], errors='coerce').fillna(0).astype('int64')
+    for name in (AUTHOR, AUTHOR_ID, MESSAGE_ID, TEXT, TRANSLATION, BACKEND):
+        df[name] = df[name].map(lambda v: None if v is None or (isinstance(v, float) and pd.isna(v)) else str(v))
+    return df
+
+
+def frame_to_table(df: pd.DataFrame) -> pa.Table:
+    """DataFrame 转为弹幕表（只保留 COMMENT_SCHEMA 中的列）"""
+    df = conform_frame(df)
+    return pa.Table.from_pandas(df[COMMENT_SCHEMA.names], schema=COMMENT_SCHEMA, preserve_index=False)
+
+
+# --------------------------
+# 写入
+# --------------------------
+def write_comments(df, path):
+    """按扩展名写出弹幕表（DataFrame 或 pa.Table）"""
+    output_dir = os.path.dirname(str(path))
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    suffix = _suffix(path)
+    if suffix in EXCEL_SUFFIXES:
+        export_excel(df.to_pandas() if isinstance(df, pa.Table) else df, path)
+        return
+    table = df if isinstance(df, pa.Table) else frame_to_table(df)
+    if suffix in IPC_SUFFIXES:
+        with pa.OSFile(str(path), 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    elif suffix in PARQUET_SUFFIXES:
+        pq.write_table(table, str(path))
+    else:
+        raise ValueError(f"不支持的弹幕文件格式: {path}")
+
+
+def export_excel(df: pd.DataFrame, path):
+    """导出为 xlsx（中文列名）"""
+    legacy = {v: k for k, v in LEGACY_COLUMNS.items()}
+    df.rename(columns=legacy).to_excel(path, index=False)
+
+
+def write_comment_records(records: Iterable[Dict], path, batch_size: int = 50000) -> int:
+    """
+    逐批写出弹幕记录（中文键的字典，如弹幕日志中的记录），内存只与批次大小有关
+    :return: 写出的条数
+    """
+    suffix = _suffix(path)
+    if suffix in IPC_SUFFIXES:
+        sink = pa.OSFile(str(path), 'wb')
+        writer = pa.ipc.new_file(sink, COMMENT_SCHEMA)
+    elif suffix in PARQUET_SUFFIXES:
+        sink = None
+        writer = pq.ParquetWriter(str(path), COMMENT_SCHEMA)
+    else:
+        raise ValueError(f"不支持的弹幕文件格式: {path}")
+
+    count = 0
+    batch = []
+    try:
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                writer.write_table(_records_to_table(batch))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(_records_to_table(batch))
+            count += len(batch)
+    finally:
+        writer.close()
+        if sink is not None:
+            sink.close()
+    return count
+
+
+def _records_to_table(records: List[Dict]) -> pa.Table:
+    columns = {field.name: [] for field in COMMENT_SCHEMA}
+    for record in records:
+        for legacy_name, name in LEGACY_COLUMNS.items():
+            columns[name].append(record.get(legacy_name, record.get(name)))
+        columns[BACKEND].append(record.get(BACKEND))
+        columns[TOKENS].append(record.get(TOKENS) or 0)
+    return pa.Table.from_pydict(columns, schema=COMMENT_SCHEMA)
+
+
+def convert(src_path, dst_path, columns: Optional[List[str]] = None):
+    """格式转换，例如把旧版 xlsx 转为 .arrow"""
+    write_comments(read_comment_table(src_path, columns), dst_path)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from typing import Dict, Optional
+
+from chatUtils.ChatCheckpoint import ChatCheckpoint
+
+
+def get_video_id(url_or_id: str) -> str:
+    """获取 YouTube 视频 ID：同时接受完整链接和视频ID"""
+    if 'v=' in url_or_id:
+        return url_or_id.split('v=')[1].split('&')[0]
+    if '/' in url_or_id:
+        raise ValueError(f"Invalid YouTube URL: {url_or_id}")
+    return url_or_id
+
+
+def message_to_record(message) -> Dict:
+    """把 pytchat 消息转换为弹幕记录"""
+    return {
+        '时间': message.timestamp,
+        '用户名': message.author.name,
+        '弹幕内容': message.message,
+        '用户ID': message.author.channelId,
+        '消息ID': message.id
+    }
+
+
+def create_chat(video_id: str, checkpoint: Optional[ChatCheckpoint] = None, interruptable: bool = True):
+    """
+    创建 pytchat 弹幕连接：存档回放有断点时从上次的 continuation 继续；
+    直播中的视频不能用 replay_continuation（会切换到回放模式），按视频ID重新连接后再按断点去重
+    :param interruptable: 是否注册 Ctrl-C 信号处理（非主线程中必须为 False）
+    """
+    import pytchat
+    continuation = checkpoint.replay_continuation() if checkpoint is not None else None
+    if continuation:
+        try:
+            return pytchat.create(video_id=video_id, interruptable=interruptable,
+                                  replay_continuation=continuation)
+        except TypeError:
+            # 旧版本 pytchat 不支持 replay_continuation，只能从头获取再按断点去重
+            pass
+    return pytchat.create(video_id=video_id, interruptable=interruptable)
@@ -0,0 +1 @@
+from .ChatLog import ChatLogWriter, iter_chat_log, finalize_chat_log
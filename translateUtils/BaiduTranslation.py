@@ -1,18 +1,16 @@
 # -*- coding: utf-8 -*-
-import sys
-import requests
 import random
 import json
 import os
 
-# 获取当前文件所在目录
-current_dir = os.path.dirname(os.path.abspath(__file__))
-sys.path.append(current_dir)
-
 from dotenv import load_dotenv
 from pathlib import Path
 from hashlib import md5
-from QuickTable import *
+from contextlib import nullcontext
+from translateUtils.TranslationCache import get_cache
+from translateUtils.PhraseDict import lookup_phrase
+from translateUtils.HttpSession import http_request
+from translateUtils.TranslateErrors import TranslationError, RateLimitedError
 
 
 # 获取 .env 文件的绝对路径
@@ -28,26 +26,36 @@ appkey = os.getenv('BAIDU_APP_KEY')
 def make_md5(s, encoding='utf-8'):
     return md5(s.encode(encoding)).hexdigest()
 
-def createRequestBaidu(text):
-    # Trim input text
-    text = text.strip()
-    if not text:
-        return text
-        
-    # API endpoints
-    endpoint = 'http://api.fanyi.baidu.com'
-    path = '/api/trans/vip/translate'
-    url = endpoint + path
+# API endpoints
+BAIDU_URL = 'http://api.fanyi.baidu.com/api/trans/vip/translate'
+# 单次请求 q 的长度上限（UTF-8 字节）
+BAIDU_MAX_QUERY_BYTES = 6000
+
+# 缓存命名空间：(服务, 模型, 语言对)
+CACHE_NAMESPACE = ('baidu', 'general', 'jp-zh')
+# 限流错误码：54003 访问频率受限，54005 长query请求频繁
+RATE_LIMIT_CODES = {'54003', '54005'}
+# 可重试的错误码：52001 请求超时，52002 系统错误；其余（签名错误、余额不足等）重试无效
+RETRYABLE_CODES = {'52001', '52002'}
+
 
+def _raise_for_error(result):
+    """接口返回错误码时抛出 TranslationError"""
+    code = str(result['error_code'])
+    raise TranslationError('baidu', f"{code} {result.get('error_msg', '')}", retryable=code in RETRYABLE_CODES)
+
+
+def _postBaidu(q):
+    """发送一次签名请求，q 可以是用换行分隔的多段文本"""
     # Generate salt and sign
     salt = random.randint(32768, 65536)
-    sign = make_md5(appid + text + str(salt) + appkey)
+    sign = make_md5(appid + q + str(salt) + appkey)
 
     # Build request
     headers = {'Content-Type': 'application/x-www-form-urlencoded'}
     payload = {
         'appid': appid,
-        'q': text,
+        'q': q,
         'from': 'jp',
         'to': 'zh',
         'salt': salt,
@@ -55,12 +63,112 @@ def createRequestBaidu(text):
         'needIntervene': 1
     }
 
-    # Send request
-    r = requests.post(url, params=payload, headers=headers)
+    # Send request（多段请求的 q 较长，放在请求体中而不是URL里；共享会话复用连接）
+    r = http_request('baidu', 'POST', BAIDU_URL, data=payload, headers=headers)
     result = r.json()
-    
+    # 限流错误抛出给 backend_slot，由限流器降低QPS后再重试
+    if str(result.get('error_code')) in RATE_LIMIT_CODES:
+        raise RateLimitedError('baidu', f"{result['error_code']} {result.get('error_msg', '')}")
+    return result
+
+
+def createRequestBaidu(text):
+    """翻译单条文本，失败时抛出 TranslationError"""
+    # Trim input text
+    text = text.strip()
+    if not text:
+        return text
+
+    cached = lookup_phrase(text)
+    if cached is None:
+        cached = get_cache().get(CACHE_NAMESPACE, text)
+    if cached is not None:
+        return cached
+
+    result = _postBaidu(text)
+
     # Return translated text
     if 'error_code' in result:
-        print(text, ": ", result['error_code'], ", ", result['error_msg'])
-        return result['error_code']
-    return result['trans_result'][0]['dst']
+        _raise_for_error(result)
+    translated = result['trans_result'][0]['dst']
+    get_cache().put(CACHE_NAMESPACE, text, translated)
+    return translated
+
+
+def _clean_segment(text):
+    """多段请求按换行分段，单条弹幕内部的换行改为空格"""
+    return ' '.join(text.split())
+
+
+def pack_baidu_batches(texts, max_bytes=BAIDU_MAX_QUERY_BYTES):
+    """
+    把多条文本按顺序打包，每包拼接后的长度不超过 max_bytes
+    空文本不参与打包
+    :return: 每包对应的下标列表
+    """
+    batches = []
+    current = []
+    current_bytes = 0
+    for i, text in enumerate(texts):
+        segment = _clean_segment(text)
+        if not segment:
+            continue
+        size = len(segment.encode('utf-8')) + 1  # 加上换行符
+        if current and current_bytes + size > max_bytes:
+            batches.append(current)
+            current = []
+            current_bytes = 0
+        current.append(i)
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def createRequestBaiduBatch(texts, limiter=None):
+    """
+    多段批量翻译：一次签名请求翻译多条文本，结果按输入顺序返回
+    返回的段数与请求不一致或请求报错时，逐条重试；限流错误（RateLimitedError）直接抛出，由调用方整批重试
+    调用方应先用 pack_baidu_batches 控制每批长度
+    :param limiter: 可选，返回上下文管理器的函数，每次发出请求（包括逐条重试）前用于限流
+    :return: 与 texts 等长的译文列表（空文本原样返回，逐条重试仍失败的为 None）
+    """
+    segments = [_clean_segment(t) for t in texts]
+    results = list(segments)
+    cached = get_cache().get_many(CACHE_NAMESPACE, [seg for seg in segments if seg])
+    indices = []
+    for i, seg in enumerate(segments):
+        phrase = lookup_phrase(seg) if seg else None
+        if phrase is not None:
+            results[i] = phrase
+        elif seg in cached:
+            results[i] = cached[seg]
+        elif seg:
+            indices.append(i)
+    if not indices:
+        return results
+
+    limiter = limiter or nullcontext
+    with limiter():
+        result = _postBaidu('\n'.join(segments[i] for i in indices))
+    trans_result = result.get('trans_result', [])
+    if 'error_code' not in result and len(trans_result) == len(indices):
+        for i, item in zip(indices, trans_result):
+            results[i] = item['dst']
+        get_cache().put_many(CACHE_NAMESPACE, {segments[i]: results[i] for i in indices})
+        return results
+
+    if 'error_code' in result:
+        print(f"批量翻译失败（{len(indices)} 条）: ", result['error_code'], ", ", result.get('error_msg'))
+    else:
+        print(f"批量翻译段数不一致: 请求 {len(indices)} 段，返回 {len(trans_result)} 段，改为逐条翻译")
+    for i in indices:
+        try:
+            with limiter():
+                results[i] = createRequestBaidu(segments[i])
+        except RateLimitedError:
+            raise
+        except TranslationError as e:
+            print(f"翻译 {segments[i]} 失败: {e}")
+            results[i] = None
+    return results
@@ -1,31 +1,37 @@
 # Please install OpenAI SDK first: `pip3 install openai`
 # -*- coding: utf-8 -*-
-import sys
 import os
-from openai import OpenAI
+from openai import OpenAI, RateLimitError
 from dotenv import load_dotenv
 from pathlib import Path
 from hashlib import md5
-# 获取当前文件所在目录
-current_dir = os.path.dirname(os.path.abspath(__file__))
-sys.path.append(current_dir)
 
-from QuickTable import *
+from translateUtils.TranslationCache import get_cache, prompt_version
+from translateUtils.PhraseDict import lookup_phrase
+from translateUtils.TranslateErrors import TranslationError, RateLimitedError
+from translateUtils.Resilience import RetryPolicy, retry_call
 from functools import lru_cache
-from typing import Tuple  # 新增类型注解
+from threading import Lock
+from typing import List, Optional, Tuple  # 新增类型注解
+import json
 
 # 环境变量加载
 env_path = Path(__file__).resolve().parent.parent / '.env'
 load_dotenv(env_path)
 
-# 缓存目录（自动创建）
+# 旧版缓存目录（每条译文一个txt），首次使用时迁移到共享缓存数据库
 CACHE_DIR = Path(__file__).parent / 'translation_cache'
-CACHE_DIR.mkdir(exist_ok=True)
+
+DEEPSEEK_MODEL = "deepseek-chat"
+# 单次请求超时（秒）；重试由 Resilience 统一处理，SDK 内部不再重试
+DEEPSEEK_TIMEOUT = 60.0
 
 # 客户端初始化
 client = OpenAI(
     api_key=os.getenv('DEEPSEEK_KEY'),
-    base_url="https://api.deepseek.com"
+    base_url="https://api.deepseek.com",
+    timeout=DEEPSEEK_TIMEOUT,
+    max_retries=0
 )
 
 # 专用翻译提示词
@@ -37,37 +43,46 @@ TRANSLATION_SYSTEM_PROMPT = """你是一个专业的日译中翻译引擎，请
 5. 处理日语特有的拟声词和语气词
 6. 对长句子进行合理分段"""
 
+
+def cache_namespace(prompt: str) -> Tuple[str, str, str]:
+    """缓存命名空间 (服务, 模型, 提示词版本)：每个提示词一个命名空间，修改提示词后旧译文自动失效"""
+    return ('deepseek', DEEPSEEK_MODEL, prompt_version(prompt))
+
+
+# 逐条请求的缓存命名空间（旧版txt缓存也是逐条请求的结果）
+CACHE_NAMESPACE = cache_namespace(TRANSLATION_SYSTEM_PROMPT)
+
+
+def migrate_legacy_cache() -> int:
+    """把旧版 translation_cache/*.txt 迁移到共享缓存（逐条请求的命名空间），由入口脚本调用，迁移过后直接返回 0"""
+    return get_cache().migrate_txt_cache(CACHE_NAMESPACE, CACHE_DIR)
+
+
 def createRequestDeepSeek(text: str, use_cache: bool = True) -> Tuple[str, int]:
     """
     日语到中文翻译函数（带tokens统计）
     :param text: 需要翻译的日文文本
     :param use_cache: 是否启用本地缓存（默认开启）
-    :return: (中文译文 或 错误信息, 消耗的tokens总数)
+    :return: (中文译文, 消耗的tokens总数)；请求失败时抛出 TranslationError
     """
     text = text.strip()
     if not text:  # 如果文本为空，直接返回
-        return text
+        return (text, 0)
         
-    # 获取翻译映射表并检查是否存在对应翻译
-    translation_map = get_translation_map()
-    if text in translation_map:
-        return (translation_map[text], 0)
-    
-    # 输入验证
-    if not isinstance(text, str) or len(text) == 0:
-        return ("[错误] 输入文本无效", 0)
-    
-    text_hash = md5(text.encode('utf-8')).hexdigest()
-    cache_file = CACHE_DIR / f"{text_hash}.txt"
+    # 短语词典命中时直接返回
+    translated = lookup_phrase(text)
+    if translated is not None:
+        return (translated, 0)
     
     # 缓存命中时返回0 tokens消耗
-    if use_cache and cache_file.exists():
-        with open(cache_file, 'r', encoding='utf-8') as f:
-            return (f.read(), 0)
+    if use_cache:
+        cached = get_cache().get(CACHE_NAMESPACE, text)
+        if cached is not None:
+            return (cached, 0)
     
     try:
         response = client.chat.completions.create(
-            model="deepseek-chat",
+            model=DEEPSEEK_MODEL,
             messages=[
                 {"role": "system", "content": TRANSLATION_SYSTEM_PROMPT},
                 {"role": "user", "content": text}
@@ -81,13 +96,190 @@ def createRequestDeepSeek(text: str, use_cache: bool = True) -> Tuple[str, int]:
         used_tokens = response.usage.total_tokens  # 获取总tokens消耗
         
         if use_cache:
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                f.write(translated_text)
+            get_cache().put(CACHE_NAMESPACE, text, translated_text)
                 
         return (translated_text, used_tokens)
-        
+
+    except RateLimitError as e:
+        # 429 交给 backend_slot 收缩并发窗口
+        raise RateLimitedError('deepseek', str(e)) from e
     except Exception as e:
-        return (f"[API错误] {str(e)}", 0)  # 错误时返回0 tokens
+        raise TranslationError('deepseek', str(e)) from e
+
+# 批量翻译提示词：一次请求翻译多条弹幕，要求以JSON返回
+BATCH_SYSTEM_PROMPT = TRANSLATION_SYSTEM_PROMPT + """
+7. 输入是一个JSON数组，每个元素包含 id 和 text，请逐条独立翻译，不要合并或拆分条目
+8. 只输出JSON对象，格式为 {"translations": [{"id": 1, "text": "译文"}, ...]}，id 与输入一一对应"""
+BATCH_CACHE_NAMESPACE = cache_namespace(BATCH_SYSTEM_PROMPT)
+
+# 带上下文的批量提示词：前文只用于理解语境，不翻译
+CONTEXT_BATCH_SYSTEM_PROMPT = TRANSLATION_SYSTEM_PROMPT + """
+7. 输入是一个JSON对象：context 是前文（只用于理解语境，不要翻译），lines 是需要翻译的连续台词，每个元素包含 id 和 text
+8. 结合前后文逐条翻译 lines，不要合并或拆分条目，人称和称呼前后保持一致
+9. 只输出JSON对象，格式为 {"translations": [{"id": 1, "text": "译文"}, ...]}，id 与 lines 一一对应"""
+# 带前文的译文依赖语境，与不带前文的译文分开缓存，互不复用
+CONTEXT_CACHE_NAMESPACE = cache_namespace(CONTEXT_BATCH_SYSTEM_PROMPT)
+
+# 默认每批条数（K），调大可摊薄提示词开销，调小可降低单次延迟和失败重试的代价
+DEFAULT_BATCH_SIZE = 20
+
+# 拆分后的子批次遇到限流时的退避重试（整批的限流仍直接抛出，由调用方的限流器处理）
+SPLIT_RETRY_POLICY = RetryPolicy(max_attempts=4, base_delay=1.0, max_delay=16.0)
+
+# 批量翻译统计，用于评估不同 K 的成本
+_batch_stats = {'requests': 0, 'comments': 0, 'tokens': 0, 'failed_batches': 0}
+_batch_stats_lock = Lock()
+
+
+def _parse_batch_response(content: str, count: int) -> Optional[List[str]]:
+    """校验批量响应：id 必须恰好是 1..count，返回按 id 排序的译文；不合法时返回 None"""
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        return None
+    items = data.get('translations') if isinstance(data, dict) else data
+    if not isinstance(items, list) or len(items) != count:
+        return None
+    by_id = {}
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('text'), str):
+            return None
+        try:
+            by_id[int(item.get('id'))] = item['text'].strip()
+        except (TypeError, ValueError):
+            return None
+    if sorted(by_id) != list(range(1, count + 1)):
+        return None
+    return [by_id[i] for i in range(1, count + 1)]
+
+
+def _request_batch(texts: List[str], context: Optional[List[str]] = None) -> Tuple[List[str], int]:
+    """
+    发送一个批次，失败（异常、JSON不合法、id/条数不匹配）时对半拆分递归重试
+    单条仍失败时退回逐条接口，逐条也失败的条目为 None；
+    本次请求遇到 429 限流时不拆分，直接抛出 RateLimitedError；拆分后的子批次限流时只重试该子批次
+    :param context: 前文（只作为语境，不翻译）
+    """
+    if len(texts) == 1:
+        try:
+            translated_text, used_tokens = createRequestDeepSeek(texts[0], use_cache=False)
+        except RateLimitedError:
+            raise
+        except TranslationError as e:
+            print(f"翻译 {texts[0]} 失败: {e}")
+            translated_text, used_tokens = None, 0
+        with _batch_stats_lock:
+            _batch_stats['requests'] += 1
+            if translated_text is None:
+                _batch_stats['failed_batches'] += 1
+            else:
+                _batch_stats['comments'] += 1
+            _batch_stats['tokens'] += used_tokens
+        return [translated_text], used_tokens
+    lines = [{'id': i + 1, 'text': t} for i, t in enumerate(texts)]
+    if context:
+        system_prompt = CONTEXT_BATCH_SYSTEM_PROMPT
+        payload = json.dumps({'context': list(context), 'lines': lines}, ensure_ascii=False)
+    else:
+        system_prompt = BATCH_SYSTEM_PROMPT
+        payload = json.dumps(lines, ensure_ascii=False)
+    used_tokens = 0
+    translated = None
+    try:
+        response = client.chat.completions.create(
+            model=DEEPSEEK_MODEL,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": payload}
+            ],
+            temperature=0.1,
+            max_tokens=8000,
+            response_format={'type': 'json_object'},
+            stream=False
+        )
+        used_tokens = response.usage.total_tokens
+        translated = _parse_batch_response(response.choices[0].message.content, len(texts))
+    except RateLimitError as e:
+        raise RateLimitedError('deepseek', str(e)) from e
+    except Exception as e:
+        print(f"批量翻译请求失败（{len(texts)} 条）: {e}")
+
+    with _batch_stats_lock:
+        _batch_stats['requests'] += 1
+        _batch_stats['tokens'] += used_tokens
+        if translated is None:
+            _batch_stats['failed_batches'] += 1
+        else:
+            _batch_stats['comments'] += len(texts)
+
+    if translated is not None:
+        return translated, used_tokens
+
+    mid = len(texts) // 2
+    left, left_tokens = _request_half(texts[:mid], context)
+    right, right_tokens = _request_half(texts[mid:], context)
+    return left + right, used_tokens + left_tokens + right_tokens
+
+
+def _request_half(texts: List[str], context: Optional[List[str]]) -> Tuple[List[str], int]:
+    """
+    请求拆分后的一半：限流时只退避重试这一半，另一半已完成的结果保留，不会重新请求
+    重试用尽时这一半的条目为 None（由任务队列稍后重试）
+    """
+    try:
+        return retry_call(lambda: _request_batch(texts, context), SPLIT_RETRY_POLICY)
+    except RateLimitedError as e:
+        print(f"批量翻译子批次（{len(texts)} 条）持续限流，稍后重试: {e}")
+        with _batch_stats_lock:
+            _batch_stats['failed_batches'] += 1
+        return [None] * len(texts), 0
+
+
+def createRequestDeepSeekBatch(texts: List[str], use_cache: bool = True,
+                               context: Optional[List[str]] = None) -> Tuple[List[str], int]:
+    """
+    批量日译中：把多条文本编号后放在一次请求中翻译，提示词只发送一次
+    :param texts: 需要翻译的文本列表（调用方按 DEFAULT_BATCH_SIZE 之类的 K 分批）
+    :param use_cache: 是否启用本地缓存，命中缓存和映射表的文本不会发送
+    :param context: 前文（如字幕的上几行），只作为语境随请求发送；带前文的译文使用单独的缓存命名空间
+    :return: (与 texts 等长的译文列表（翻译失败的条目为 None）, 消耗的tokens总数)
+    """
+    namespace = CONTEXT_CACHE_NAMESPACE if context else BATCH_CACHE_NAMESPACE
+    results = [t.strip() for t in texts]
+    cached = get_cache().get_many(namespace, [t for t in results if t]) if use_cache else {}
+    pending = []
+    for i, text in enumerate(results):
+        if not text:
+            continue
+        phrase = lookup_phrase(text)
+        if phrase is not None:
+            results[i] = phrase
+        elif text in cached:
+            results[i] = cached[text]
+        else:
+            pending.append(i)
+
+    if not pending:
+        return results, 0
+
+    translated, used_tokens = _request_batch([results[i] for i in pending], context)
+    new_entries = {}
+    for i, translated_text in zip(pending, translated):
+        if translated_text is not None:
+            new_entries[results[i]] = translated_text
+        results[i] = translated_text
+    if use_cache:
+        get_cache().put_many(namespace, new_entries)
+    return results, used_tokens
+
+
+def batch_stats() -> dict:
+    """批量翻译统计：请求数、成功条数、tokens、平均每条tokens"""
+    with _batch_stats_lock:
+        stats = dict(_batch_stats)
+    stats['tokens_per_comment'] = stats['tokens'] / stats['comments'] if stats['comments'] else 0.0
+    return stats
+
 
 if __name__ == "__main__":
     # 更新测试用例
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import time
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HttpConfig:
+    """
+    HTTP 连接池配置
+    :param pool_size: 每个主机的最大保持连接数，应不小于该服务的并发上限
+    :param connect_timeout: 建立连接超时（秒）
+    :param read_timeout: 读取响应超时（秒）
+    """
+
+    def __init__(self, pool_size: int = 16, connect_timeout: float = 5.0, read_timeout: float = 30.0):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        return (self.connect_timeout, self.read_timeout)
+
+
+_config = HttpConfig()
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = Lock()
+
+
+def configure_http(pool_size: Optional[int] = None, connect_timeout: Optional[float] = None,
+                   read_timeout: Optional[float] = None):
+    """修改连接池配置，已创建的会话会被关闭并在下次使用时按新配置重建"""
+    with _sessions_lock:
+        if pool_size is not None:
+            _config.pool_size = pool_size
+        if connect_timeout is not None:
+            _config.connect_timeout = connect_timeout
+        if read_timeout is not None:
+            _config.read_timeout = read_timeout
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def _create_session() -> requests.Session:
+    session = requests.Session()
+    # 不在连接层自动重试，重试策略由调用方决定
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=_config.pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['Connection'] = 'keep-alive'
+    return session
+
+
+def get_session(name: str) -> requests.Session:
+    """
+    获取按名称共享的会话（每个翻译服务一个），连接保持复用，可在多线程中共用
+    """
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = _sessions[name] = _create_session()
+        return session
+
+
+def http_request(name: str, method: str, url: str, **kwargs) -> requests.Response:
+    """通过共享会话发送请求，未指定 timeout 时使用配置的超时"""
+    kwargs.setdefault('timeout', _config.timeout)
+    return get_session(name).request(method, url, **kwargs)
+
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+# --------------------------
+# 基准测试：本地模拟服务器，对比每次新建连接和连接复用
+# --------------------------
+def _run_mock_server():
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from threading import Thread
+
+    connections = set()
+    connections_lock = Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # 支持 keep-alive
+        disable_nagle_algorithm = True  # 响应头和响应体分两次写出，避免 Nagle 与延迟确认叠加造成的等待
+
+        def do_POST(self):
+            with connections_lock:
+                connections.add(self.client_address)
+            length = int(self.headers.get('Content-Length', 0))
+            self.rfile.read(length)
+            body = b'{"trans_result": [{"src": "x", "dst": "y"}]}'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server, connections
+
+
+def benchmark(requests_count: int = 2000, workers: int = 10):
+    from concurrent.futures import ThreadPoolExecutor
+
+    server, connections = _run_mock_server()
+    url = f'http://127.0.0.1:{server.server_address[1]}/api/trans/vip/translate'
+    payload = {'q': 'こんにちは', 'from': 'jp', 'to': 'zh'}
+
+    def run(label, send):
+        connections.clear()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda _: send(), range(requests_count)))
+        elapsed = time.perf_counter() - start
+        print(f"{label}: {requests_count / elapsed:.0f} 请求/秒，建立连接 {len(connections)} 个")
+
+    run('每次新建连接', lambda: requests.post(url, data=payload, timeout=_config.timeout))
+    run('共享会话连接池', lambda: http_request('benchmark', 'POST', url, data=payload))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+import os
+import socket
+import sqlite3
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 条目状态
+PENDING = 'pending'
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def make_job_id(kind: str, source) -> str:
+    """任务ID：任务类型 + 输入文件的绝对路径，同一输入重复运行时续接同一个任务"""
+    return f"{kind}:{Path(source).resolve()}"
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class TranslationJobQueue:
+    """
+    持久化的翻译任务队列（SQLite WAL，可被多个进程同时使用）
+    每个任务的条目状态：pending -> in_flight（带租约）-> done；失败超过次数为 failed
+    进程崩溃后，租约过期的 in_flight 条目会被其它进程重新领取
+    :param path: 数据库文件路径
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+        # isolation_level=None：手动管理事务，领取条目时用 BEGIN IMMEDIATE 加写锁
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=60, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                source TEXT,
+                created REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                job_id TEXT NOT NULL,
+                item_id INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                state TEXT NOT NULL,
+                translation TEXT,
+                backend TEXT,
+                tokens INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                lease_until REAL,
+                error TEXT,
+                updated REAL NOT NULL,
+                PRIMARY KEY (job_id, item_id)
+            ) WITHOUT ROWID
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_items_state ON items (job_id, state)')
+
+    def _transaction(self, fn, immediate: bool = True):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            return result
+
+    def enqueue(self, job_id: str, items: Iterable[Tuple[int, str]], kind: str = '', source: str = '') -> int:
+        """
+        加入条目 (item_id, 原文)；已存在且原文未变的条目保持原状态（续接），原文变化的条目重新排队
+        :return: 新加入或重新排队的条数
+        """
+        now = time.time()
+        rows = [(job_id, int(item_id), text, PENDING, now) for item_id, text in items]
+
+        def run(conn):
+            conn.execute('INSERT OR IGNORE INTO jobs (job_id, kind, source, created) VALUES (?, ?, ?, ?)',
+                         (job_id, kind, str(source), now))
+            before = conn.total_changes
+            conn.executemany("""
+                INSERT INTO items (job_id, item_id, text, state, updated) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (job_id, item_id) DO UPDATE SET
+                    text = excluded.text, state = excluded.state, translation = NULL, backend = NULL,
+                    tokens = 0, attempts = 0, worker = NULL, lease_until = NULL, error = NULL,
+                    updated = excluded.updated
+                WHERE items.text != excluded.text
+            """, rows)
+            return conn.total_changes - before
+
+        return self._transaction(run)
+
+    def claim(self, job_id: str, worker: str, limit: int, lease_seconds: float = 600.0) -> List[Tuple[int, str]]:
+        """领取最多 limit 个待处理条目（包括租约已过期的 in_flight 条目）"""
+        now = time.time()
+
+        def run(conn):
+            rows = conn.execute("""
+                SELECT item_id, text FROM items
+                WHERE job_id = ? AND (state = ? OR (state = ? AND lease_until < ?))
+                ORDER BY item_id LIMIT ?
+            """, (job_id, PENDING, IN_FLIGHT, now, limit)).fetchall()
+            conn.executemany("""
+                UPDATE items SET state = ?, worker = ?, lease_until = ?, attempts = attempts + 1, updated = ?
+                WHERE job_id = ? AND item_id = ?
+            """, [(IN_FLIGHT, worker, now + lease_seconds, now, job_id, item_id) for item_id, _ in rows])
+            return rows
+
+        return self._transaction(run)
+
+    def complete(self, job_id: str, results: Iterable[Tuple[int, str, Optional[str], int]]):
+        """提交完成的条目 (item_id, 译文, 服务, tokens)"""
+        now = time.time()
+        rows = [(DONE, translation, backend, int(tokens or 0), now, job_id, int(item_id))
+                for item_id, translation, backend, tokens in results]
+        self._transaction(lambda conn: conn.executemany("""
+            UPDATE items SET state = ?, translation = ?, backend = ?, tokens = ?, error = NULL,
+                worker = NULL, lease_until = NULL, updated = ?
+            WHERE job_id = ? AND item_id = ?
+        """, rows))
+
+    def fail(self, job_id: str, failures: Iterable[Tuple[int, str]], max_attempts: int = 3):
+        """记录失败的条目 (item_id, 错误信息)；未超过次数的重新排队"""
+        now = time.time()
+        rows = [(max_attempts, FAILED, PENDING, error, now, job_id, int(item_id)) for item_id, error in failures]
+        self._transaction(lambda conn: conn.executemany("""
+            UPDATE items SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, error = ?,
+                worker = NULL, lease_until = NULL, updated = ?
+            WHERE job_id = ? AND item_id = ?
+        """, rows))
+
+    def release(self, job_id: str, worker: str):
+        """把该进程领取但未完成的条目放回队列（例如 Ctrl-C 退出时），不计失败次数"""
+        self._transaction(lambda conn: conn.execute("""
+            UPDATE items SET state = ?, worker = NULL, lease_until = NULL, attempts = MAX(attempts - 1, 0)
+            WHERE job_id = ? AND state = ? AND worker = ?
+        """, (PENDING, job_id, IN_FLIGHT, worker)))
+
+    def retry_failed(self, job_id: str) -> int:
+        """把 failed 条目重新排队"""
+        return self._transaction(lambda conn: conn.execute(
+            'UPDATE items SET state = ?, attempts = 0 WHERE job_id = ? AND state = ?',
+            (PENDING, job_id, FAILED)).rowcount)
+
+    def counts(self, job_id: str) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute('SELECT state, COUNT(*) FROM items WHERE job_id = ? GROUP BY state',
+                                      (job_id,)).fetchall()
+        counts = {PENDING: 0, IN_FLIGHT: 0, DONE: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def results(self, job_id: str) -> Dict[int, Tuple[str, Optional[str], int]]:
+        """已完成条目：{item_id: (译文, 服务, tokens)}"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT item_id, translation, backend, tokens FROM items WHERE job_id = ? AND state = ?',
+                (job_id, DONE)).fetchall()
+        return {item_id: (translation, backend, tokens) for item_id, translation, backend, tokens in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def drain(queue: TranslationJobQueue, job_id: str, translate_fn: Callable[[Sequence[str]], List[Dict]],
+          worker: Optional[str] = None, chunk_size: int = 500, lease_seconds: float = 600.0,
+          max_attempts: int = 3) -> Dict[str, int]:
+    """
+    领取并翻译队列中的条目，直到没有可领取的条目
+    每处理完一块（chunk_size 条）就把结果写入数据库（检查点），中断时最多损失一块
+    可在多个进程中同时运行
+    :param translate_fn: 批量翻译函数，返回与输入等长的结果（{"trans_res", "tokens_cost", "backend", "error"}）
+    :return: 队列各状态的条数
+    """
+    worker = worker or default_worker_id()
+    try:
+        while True:
+            claimed = queue.claim(job_id, worker, chunk_size, lease_seconds)
+            if not claimed:
+                break
+            results = translate_fn([text for _, text in claimed])
+            done, failed = [], []
+            for (item_id, _), r in zip(claimed, results):
+                if r.get('error') is None and r.get('trans_res') is not None:
+                    done.append((item_id, r['trans_res'], r.get('backend'), r.get('tokens_cost', 0)))
+                else:
+                    failed.append((item_id, r.get('error') or '翻译失败'))
+            queue.complete(job_id, done)
+            queue.fail(job_id, failed, max_attempts)
+            counts = queue.counts(job_id)
+            print(f"[{worker}] 检查点：完成 {counts[DONE]}，待处理 {counts[PENDING]}，"
+                  f"处理中 {counts[IN_FLIGHT]}，失败 {counts[FAILED]}")
+    except BaseException:
+        # 中断时把未完成的条目放回队列，其它进程或下次运行可以立即领取
+        queue.release(job_id, worker)
+        raise
+    return queue.counts(job_id)
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+from pathlib import Path
+from threading import Lock
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from translateUtils.TextNormalize import normalize_text, split_tail
+
+# 默认词典文件：每行 "原文<TAB>译文"，# 开头为注释；也支持 {"原文": "译文"} 格式的 .json
+DEFAULT_PHRASE_PATH = Path(__file__).parent / 'phrase_table.tsv'
+
+_END = ''  # 字典树中表示词条结束的键
+
+# 前缀匹配时允许丢掉的句尾（お疲れ様です / お疲れ様でした 都按 お疲れ様 翻译）
+VARIANT_SUFFIXES = frozenset(['です', 'でした', 'ですね', 'でーす', 'だね', 'だよ', 'ね', 'よ'])
+
+
+class PhraseIndex:
+    """
+    不可变的短语索引（加载后不再修改，重新加载时整体替换）
+    查找顺序：原文精确匹配 -> 规范化后匹配 -> 去掉语气尾巴后在字典树中从长到短做前缀匹配
+    （前缀之后只允许是 VARIANT_SUFFIXES 中的句尾）
+    """
+
+    def __init__(self, phrases: Dict[str, str]):
+        self.exact: Mapping[str, str] = MappingProxyType(dict(phrases))
+        normalized = {}
+        trie: Dict = {}
+        for src, dst in phrases.items():
+            key = normalize_text(src)
+            # 同一规范化键有多个词条时，以先出现的为准
+            normalized.setdefault(key, dst)
+            node = trie
+            for char in key:
+                node = node.setdefault(char, {})
+            node.setdefault(_END, dst)
+        self.normalized: Mapping[str, str] = MappingProxyType(normalized)
+        self._trie = trie
+
+    def __len__(self):
+        return len(self.exact)
+
+    def prefix_matches(self, text: str) -> List[Tuple[str, int]]:
+        """返回 text 的所有词条前缀的 (译文, 长度)，按长度从长到短排列"""
+        node = self._trie
+        matches = []
+        for i, char in enumerate(text):
+            node = node.get(char)
+            if node is None:
+                break
+            if _END in node:
+                matches.append((node[_END], i + 1))
+        matches.reverse()
+        return matches
+
+    def lookup(self, text: str) -> Optional[Tuple[str, str]]:
+        """
+        查找译文
+        :return: (译文, 匹配方式 exact/normalized/variant)，未命中返回 None
+        """
+        stripped = text.strip()
+        if stripped in self.exact:
+            return self.exact[stripped], 'exact'
+        key = normalize_text(stripped)
+        if key in self.normalized:
+            return self.normalized[key], 'normalized'
+        core, _ = split_tail(key)
+        # 从最长的前缀开始尝试，剩余部分不是变体后缀时再试更短的前缀
+        for translated, length in self.prefix_matches(core):
+            if length == len(core) or core[length:] in VARIANT_SUFFIXES:
+                # 语气尾巴按原文写法拼接到译文后
+                _, raw_tail = split_tail(stripped)
+                return translated + raw_tail, 'variant'
+        return None
+
+
+def load_phrases(path) -> Dict[str, str]:
+    """从 TSV 或 JSON 文件读取词条"""
+    path = Path(path)
+    if path.suffix.lower() == '.json':
+        with open(path, 'r', encoding='utf-8') as f:
+            return {str(k): str(v) for k, v in json.load(f).items()}
+
+    phrases = {}
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.rstrip('\r\n')
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            cols = line.split('\t')
+            if len(cols) < 2 or not cols[0].strip():
+                print(f"跳过格式错误的词条: {path.name}:{line_no}")
+                continue
+            phrases.setdefault(cols[0].strip(), cols[1].strip())
+    return phrases
+
+
+class PhraseDictionary:
+    """
+    短语词典：从外部文件加载一次，文件修改后自动热加载
+    :param path: 词典文件路径
+    :param check_interval: 检查文件修改时间的最小间隔（秒）
+    """
+
+    def __init__(self, path=DEFAULT_PHRASE_PATH, check_interval: float = 2.0):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self._lock = Lock()
+        self._mtime = None
+        self._last_check = 0.0
+        self._index = PhraseIndex({})
+        self.reload()
+
+    def reload(self) -> bool:
+        """重新加载词典文件，返回是否加载成功"""
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.path)
+                index = PhraseIndex(load_phrases(self.path))
+            except (OSError, ValueError) as e:
+                print(f"加载词典 {self.path} 失败: {e}")
+                return False
+            # 整体替换引用，正在查找的线程仍使用旧索引
+            self._index = index
+            self._mtime = mtime
+            self._last_check = time.monotonic()
+        return True
+
+    @property
+    def index(self) -> PhraseIndex:
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            try:
+                changed = os.path.getmtime(self.path) != self._mtime
+            except OSError:
+                changed = False
+            if changed:
+                self.reload()
+        return self._index
+
+    def lookup(self, text: str) -> Optional[str]:
+        match = self.index.lookup(text)
+        return match[0] if match else None
+
+
+_shared_dictionary = None
+_shared_dictionary_lock = Lock()
+
+
+def get_phrase_dictionary() -> PhraseDictionary:
+    """共享的短语词典实例"""
+    global _shared_dictionary
+    with _shared_dictionary_lock:
+        if _shared_dictionary is None:
+            _shared_dictionary = PhraseDictionary()
+        return _shared_dictionary
+
+
+def lookup_phrase(text: str) -> Optional[str]:
+    """在共享词典中查找译文，未命中返回 None"""
+    return get_phrase_dictionary().lookup(text)
@@ -1,11 +1,5 @@
+from translateUtils.PhraseDict import get_phrase_dictionary, lookup_phrase
+
 def get_translation_map():
-    """返回常用日语短语的中文翻译映射表"""
-    return {
-        'こんにちは': '中午好',
-        'こんにちはー': '中午好ー',
-        'こんにちは！': '中午好！',
-        'こんにちは〜': '中午好〜',
-        'お疲れ様': '辛苦了',
-        '待機': '待机',
-        '待機です': '待机'
-    }
\ No newline at end of file
+    """返回常用日语短语的中文翻译映射表（只读，词条来自 phrase_table.tsv，加载一次并在文件修改后自动重新加载）"""
+    return get_phrase_dictionary().index.exact
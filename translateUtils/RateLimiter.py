@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+import time
+from contextlib import contextmanager
+from threading import Condition, Lock
+from typing import Dict, Optional
+
+from translateUtils.TranslateErrors import RateLimitedError
+
+
+class TokenBucket:
+    """
+    令牌桶：按 rate（个/秒）生成令牌，最多积累 capacity 个（默认1秒的量）
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._fixed_capacity = capacity is not None
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+            if not self._fixed_capacity:
+                self.capacity = max(1.0, rate)
+            self._tokens = min(self._tokens, self.capacity)
+
+    def acquire(self):
+        """取一个令牌，没有时等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    """
+    单个翻译服务的自适应限流：令牌桶控制 QPS，AIMD 并发窗口控制同时进行的请求数
+    请求成功时 QPS 和窗口缓慢增加（加性增），遇到限流错误时减半（乘性减），
+    从而逐步逼近账号等级的真实上限
+    :param max_concurrency: 并发窗口上限；初始窗口为 initial_concurrency（默认等于上限的一半）
+    :param qps: 初始 QPS，None 表示不限 QPS 只控制并发
+    :param max_qps: QPS 增长上限（例如账号等级允许的最大值）
+    :param decrease_cooldown: 两次乘性减之间的最小间隔（秒），避免同一波限流被重复惩罚
+    """
+
+    def __init__(self, backend: str, max_concurrency: int, qps: Optional[float] = None,
+                 max_qps: Optional[float] = None, min_qps: float = 1.0,
+                 initial_concurrency: Optional[int] = None, min_concurrency: int = 1,
+                 qps_increase: float = 1.0, decrease_factor: float = 0.5, decrease_cooldown: float = 1.0):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.window = float(initial_concurrency or max(min_concurrency, max_concurrency // 2))
+        self.bucket = TokenBucket(qps) if qps else None
+        self.max_qps = max_qps or qps
+        self.min_qps = min_qps
+        self.qps_increase = qps_increase
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+
+        self._cond = Condition()
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self.successes = 0
+        self.throttles = 0
+        self.errors = 0
+        # 实际完成速率（指数滑动平均）
+        self._completed_rate = 0.0
+        self._last_complete = None
+
+    @property
+    def qps(self) -> Optional[float]:
+        return self.bucket.rate if self.bucket else None
+
+    @contextmanager
+    def slot(self):
+        """
+        占用一个请求名额；块内抛出 RateLimitedError 时记为限流并收缩，
+        其它异常记为错误（不调整窗口），正常退出记为成功
+        """
+        with self._cond:
+            while self._in_flight >= int(self.window):
+                self._cond.wait()
+            self._in_flight += 1
+        try:
+            if self.bucket is not None:
+                self.bucket.acquire()
+            yield
+        except RateLimitedError:
+            self.on_rate_limited()
+            raise
+        except Exception:
+            with self._cond:
+                self.errors += 1
+            raise
+        else:
+            self.on_success()
+        finally:
+            # KeyboardInterrupt / GeneratorExit 等也要归还名额，否则其它线程会一直等待
+            self._release()
+
+    def _release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        with self._cond:
+            self.successes += 1
+            now = time.monotonic()
+            if self._last_complete is not None:
+                instant = 1.0 / max(now - self._last_complete, 1e-3)
+                self._completed_rate = 0.9 * self._completed_rate + 0.1 * instant
+            self._last_complete = now
+            # 加性增：每完成约一个窗口的请求，窗口 +1
+            self.window = min(float(self.max_concurrency), self.window + 1.0 / max(self.window, 1.0))
+            self._cond.notify_all()
+        if self.bucket is not None and self.bucket.rate < self.max_qps:
+            # 每秒约增加 qps_increase
+            rate = self.bucket.rate
+            self.bucket.set_rate(min(self.max_qps, rate + self.qps_increase / max(rate, 1.0)))
+
+    def on_rate_limited(self):
+        with self._cond:
+            self.throttles += 1
+            now = time.monotonic()
+            if now - self._last_decrease < self.decrease_cooldown:
+                return
+            self._last_decrease = now
+            self.window = max(float(self.min_concurrency), self.window * self.decrease_factor)
+        if self.bucket is not None:
+            self.bucket.set_rate(max(self.min_qps, self.bucket.rate * self.decrease_factor))
+        print(f"[{self.backend}] 触发限流，QPS 降至 {self.qps or 0:.1f}，并发窗口降至 {int(self.window)}")
+
+    def snapshot(self) -> Dict:
+        """当前限流状态，用于监控"""
+        with self._cond:
+            return {
+                'backend': self.backend,
+                'qps_limit': self.qps,
+                'window': int(self.window),
+                'in_flight': self._in_flight,
+                'completed_rate': self._completed_rate,
+                'successes': self.successes,
+                'throttles': self.throttles,
+                'errors': self.errors,
+            }
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+import random
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from threading import Lock
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from translateUtils.TranslateErrors import TranslationError, RateLimitedError, DeadlineExceeded, CircuitOpenError
+
+# 翻译函数：输入原文，返回 (译文, tokens)，失败时抛出 TranslationError
+BackendFn = Callable[[str], Tuple[str, int]]
+
+
+class LatencyStats:
+    """
+    单个服务最近 window 次请求的延迟和成败
+    用于计算对冲延迟（p95），也可供路由参考
+    """
+
+    def __init__(self, window: int = 200):
+        self._latencies = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+        self._lock = Lock()
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            if ok:
+                self._latencies.append(latency)
+            self._outcomes.append(ok)
+
+    @property
+    def samples(self) -> int:
+        return len(self._latencies)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            data = sorted(self._latencies)
+        if not data:
+            return None
+        return data[min(len(data) - 1, int(q * len(data)))]
+
+    @property
+    def mean_latency(self) -> Optional[float]:
+        with self._lock:
+            return sum(self._latencies) / len(self._latencies) if self._latencies else None
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            return 1 - sum(self._outcomes) / len(self._outcomes) if self._outcomes else 0.0
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败 failure_threshold 次后打开，reset_timeout 秒内不再发送请求；
+    之后进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = Lock()
+
+    def available(self) -> bool:
+        """是否可能放行请求（不改变状态）"""
+        with self._lock:
+            return self.state != 'open' or time.monotonic() - self._opened_at >= self.reset_timeout
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'half_open':
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                print(f"[{self.name}] 恢复正常，关闭熔断")
+            self.state = 'closed'
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == 'half_open' or self._failures >= self.failure_threshold:
+                if self.state != 'open':
+                    print(f"[{self.name}] 连续失败 {self._failures} 次，熔断 {self.reset_timeout:.0f} 秒")
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+
+@dataclass
+class RetryPolicy:
+    """
+    指数退避重试：第 n 次重试前等待 base_delay * 2^n（不超过 max_delay），并加随机抖动
+    """
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+
+    def delay(self, attempt: int) -> float:
+        upper = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(upper / 2, upper)
+
+
+def retry_call(fn: Callable, policy: Optional[RetryPolicy] = None, deadline_at: Optional[float] = None,
+               on_retry: Optional[Callable[[TranslationError], None]] = None):
+    """
+    调用 fn()，遇到可重试的 TranslationError 时按退避策略重试
+    :param deadline_at: time.monotonic() 截止时间，等待后会超过截止时间时不再重试
+    """
+    policy = policy or RetryPolicy()
+    for attempt in range(policy.max_attempts):
+        try:
+            return fn()
+        except TranslationError as e:
+            if not e.retryable or attempt == policy.max_attempts - 1:
+                raise
+            delay = policy.delay(attempt)
+            if deadline_at is not None and time.monotonic() + delay >= deadline_at:
+                raise
+            if on_retry is not None:
+                on_retry(e)
+            time.sleep(delay)
+
+
+class ResilientTranslator:
+    """
+    带截止时间、重试、对冲请求和熔断的翻译调用
+    :param backends: 服务名 -> 翻译函数（返回 (译文, tokens)，失败抛出 TranslationError）
+    :param deadline: 单条文本（含重试、对冲）的总时限（秒）
+    :param hedge: 主服务超过其 p95 延迟仍未返回时，是否向下一个服务发出对冲请求（先返回的结果生效）
+    :param min_hedge_delay: 对冲延迟下限（秒）；样本不足 min_samples 时使用 default_hedge_delay
+    """
+
+    def __init__(self, backends: Dict[str, BackendFn], retry: Optional[RetryPolicy] = None,
+                 deadline: float = 60.0, hedge: bool = True, hedge_quantile: float = 0.95,
+                 min_hedge_delay: float = 0.5, default_hedge_delay: float = 3.0, min_samples: int = 20,
+                 breaker_threshold: int = 5, breaker_reset: float = 30.0, max_workers: int = 64):
+        self.backends = dict(backends)
+        self.retry = retry or RetryPolicy()
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.min_hedge_delay = min_hedge_delay
+        self.default_hedge_delay = default_hedge_delay
+        self.min_samples = min_samples
+        self.stats = {name: LatencyStats() for name in self.backends}
+        self.breakers = {name: CircuitBreaker(name, breaker_threshold, breaker_reset) for name in self.backends}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='translate')
+        self._counters = {'requests': 0, 'retries': 0, 'hedges': 0, 'hedge_wins': 0,
+                          'failovers': 0, 'failures': 0, 'abandoned_tokens': 0}
+        self._counters_lock = Lock()
+
+    def _count(self, key: str, n: int = 1):
+        with self._counters_lock:
+            self._counters[key] += n
+
+    def _call_once(self, backend: str, text: str) -> Tuple[str, int]:
+        breaker = self.breakers[backend]
+        if not breaker.allow():
+            raise CircuitOpenError(backend)
+        self._count('requests')
+        start = time.monotonic()
+        try:
+            result = self.backends[backend](text)
+        except RateLimitedError:
+            # 限流说明服务可用，由限流器降速处理，不计入失败
+            breaker.record_success()
+            raise
+        except Exception as e:
+            self.stats[backend].record(time.monotonic() - start, False)
+            breaker.record_failure()
+            if isinstance(e, TranslationError):
+                raise
+            raise TranslationError(backend, str(e)) from e
+        self.stats[backend].record(time.monotonic() - start, True)
+        breaker.record_success()
+        return result
+
+    def _call_with_retry(self, backend: str, text: str, deadline_at: float) -> Tuple[str, int]:
+        return retry_call(lambda: self._call_once(backend, text), self.retry, deadline_at,
+                          on_retry=lambda e: self._count('retries'))
+
+    def hedge_delay(self, backend: str) -> float:
+        """主服务发出后等待多久再发对冲请求：该服务最近延迟的 p95"""
+        stats = self.stats[backend]
+        if stats.samples < self.min_samples:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, stats.percentile(self.hedge_quantile))
+
+    def _abandon(self, future):
+        """放弃仍在进行的请求（线程无法中断），完成后只统计其 tokens"""
+        def on_done(f):
+            if f.exception() is None:
+                self._count('abandoned_tokens', f.result()[1])
+        future.add_done_callback(on_done)
+
+    def translate(self, text: str, order: Sequence[str]) -> Dict:
+        """
+        按 order 顺序翻译：第一个为主服务，其余依次作为对冲和失败转移的备用服务
+        :return: {"trans_res", "tokens_cost", "backend", "error"}；
+                 失败时 trans_res 为 None、error 为错误信息，调用方不应把它写入译文
+        """
+        deadline_at = time.monotonic() + self.deadline
+        queue = [b for b in order if b in self.backends]
+        primary = queue[0] if queue else None
+        errors = []
+        pending = {}
+        launched = []
+
+        def launch() -> bool:
+            while queue:
+                backend = queue.pop(0)
+                if not self.breakers[backend].available():
+                    errors.append(f"{backend}: 熔断中")
+                    continue
+                future = self._executor.submit(self._call_with_retry, backend, text, deadline_at)
+                pending[future] = backend
+                launched.append(backend)
+                return True
+            return False
+
+        launch()
+        hedged = False
+        while pending:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                errors.append(str(DeadlineExceeded(','.join(pending.values()), f"超过 {self.deadline:.0f} 秒")))
+                break
+            can_hedge = self.hedge and not hedged and queue and len(pending) == 1
+            timeout = min(remaining, self.hedge_delay(launched[0])) if can_hedge else remaining
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if can_hedge and launch():
+                    hedged = True
+                    self._count('hedges')
+                continue
+            for future in done:
+                backend = pending.pop(future)
+                try:
+                    translated, tokens = future.result()
+                except TranslationError as e:
+                    errors.append(str(e))
+                    continue
+                if backend != primary:
+                    self._count('hedge_wins' if hedged and backend == launched[1] else 'failovers')
+                for other in pending:
+                    self._abandon(other)
+                return {"trans_res": translated, "tokens_cost": tokens, "backend": backend, "error": None}
+            if not pending:
+                launch()
+
+        for other in pending:
+            self._abandon(other)
+        self._count('failures')
+        return {"trans_res": None, "tokens_cost": 0, "backend": None, "error": '; '.join(errors) or "没有可用的翻译服务"}
+
+    def report(self) -> str:
+        with self._counters_lock:
+            c = dict(self._counters)
+        lines = [f"请求 {c['requests']} 次，重试 {c['retries']} 次，对冲 {c['hedges']} 次（对冲胜出 {c['hedge_wins']}），"
+                 f"失败转移 {c['failovers']} 次，最终失败 {c['failures']} 条，被放弃请求的 tokens {c['abandoned_tokens']}"]
+        for name, stats in self.stats.items():
+            p95 = stats.percentile(0.95)
+            lines.append(f"{name}: p95 {p95 or 0:.2f} 秒，错误率 {stats.error_rate:.1%}，熔断状态 {self.breakers[name].state}")
+        return '\n'.join(lines)
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Sequence
+
+DICT_BACKEND = 'dict'
+
+
+@dataclass
+class BackendProfile:
+    """
+    翻译服务的成本和能力
+    :param cost_per_char: 按字符计费的单价（元/字符）
+    :param cost_per_token: 按 token 计费的单价（元/token，输入输出平均）
+    :param overhead_tokens: 每次请求固定的提示词 tokens，批量请求时按 batch_size 摊薄
+    :param tokens_per_char: 每个字符约消耗的 tokens（输入+输出）
+    :param batch_size: 一次请求通常包含的条数
+    :param max_chars: 超过该长度时译文质量明显下降（如机器翻译处理长句），只在预算或时间不够时使用
+    :param default_latency: 没有实测数据时假设的单次请求延迟（秒）
+    """
+    name: str
+    cost_per_char: float = 0.0
+    cost_per_token: float = 0.0
+    overhead_tokens: int = 0
+    tokens_per_char: float = 0.0
+    batch_size: int = 1
+    max_chars: Optional[int] = None
+    default_latency: float = 1.0
+
+    def estimate_cost(self, text: str) -> float:
+        chars = len(text)
+        tokens = self.overhead_tokens / self.batch_size + self.tokens_per_char * chars
+        return chars * self.cost_per_char + tokens * self.cost_per_token
+
+
+# 默认价格（元）：百度标准版每月免费额度内按 0 计（超出后为 49 元/百万字符）；
+# 有道 48 元/百万字符；DeepSeek 输入输出平均约 5 元/百万 tokens
+DEFAULT_PROFILES = {
+    'baidu': BackendProfile('baidu', cost_per_char=0.0, batch_size=50, max_chars=11, default_latency=0.5),
+    'youdao': BackendProfile('youdao', cost_per_char=48e-6, max_chars=11, default_latency=0.5),
+    'deepseek': BackendProfile('deepseek', cost_per_token=5e-6, overhead_tokens=150, tokens_per_char=2.5,
+                               batch_size=20, default_latency=4.0),
+}
+
+
+@dataclass
+class RouteDecision:
+    """一次路由决策：order 为主服务加备用服务的顺序"""
+    backend: Optional[str]
+    order: List[str]
+    reason: str
+    est_cost: float = 0.0
+
+
+class RoutingLog:
+    """把每次路由决策追加写入 JSONL 文件，便于事后复查"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.counts = Counter()
+        self._lock = Lock()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def write(self, text: str, decision: RouteDecision, **extra):
+        with self._lock:
+            self.counts[decision.backend] += 1
+            if not self.path:
+                return
+            entry = {'time': round(time.time(), 3), 'text': text[:50], 'chars': len(text),
+                     'backend': decision.backend, 'order': decision.order, 'reason': decision.reason,
+                     'est_cost': round(decision.est_cost, 8), **extra}
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def report(self) -> str:
+        with self._lock:
+            return '路由：' + '，'.join(f"{k or '跳过'} {v} 条" for k, v in self.counts.most_common())
+
+
+class Router:
+    """路由接口：根据文本决定使用哪个翻译服务"""
+    log: Optional[RoutingLog] = None
+
+    def start_job(self, budget: Optional[float] = None, target_seconds: Optional[float] = None):
+        """开始新任务；没有预算和负载状态的路由什么都不做"""
+
+    def route(self, text: str) -> RouteDecision:
+        raise NotImplementedError
+
+    def plan(self, texts: Sequence[str]) -> List[RouteDecision]:
+        """为一批文本决策（可在整体上分配负载），默认逐条调用 route"""
+        return [self.route(t) for t in texts]
+
+    def record(self, text: str, decision: RouteDecision, result: Dict):
+        """翻译完成后回报实际结果（用于预算统计）"""
+
+    def report(self) -> str:
+        return self.log.report() if self.log is not None else ''
+
+
+class LengthRouter(Router):
+    """旧规则：超过 threshold 个字符用 DeepSeek，否则用百度"""
+
+    def __init__(self, threshold: int = 11, dictionary: Optional[Callable[[str], Optional[str]]] = None,
+                 log: Optional[RoutingLog] = None):
+        self.threshold = threshold
+        self.dictionary = dictionary
+        self.log = log or RoutingLog(None)
+
+    def route(self, text: str) -> RouteDecision:
+        text = text.strip()
+        if not text or (self.dictionary is not None and self.dictionary(text) is not None):
+            decision = RouteDecision(DICT_BACKEND if text else None, [], '词典命中' if text else '空文本')
+        elif len(text) > self.threshold:
+            decision = RouteDecision('deepseek', ['deepseek', 'baidu'], f'长度>{self.threshold}')
+        else:
+            decision = RouteDecision('baidu', ['baidu', 'deepseek'], f'长度<={self.threshold}')
+        self.log.write(text, decision)
+        return decision
+
+
+class CostLatencyRouter(Router):
+    """
+    按成本和耗时选择翻译服务：在满足目标耗时的前提下花费最少
+    对每条文本，按（质量是否合适, 预估成本）排序候选服务，依次检查：
+    1. 分配给该服务后，该服务预计完成时间不超过目标耗时（各服务并行，整体耗时取最大值）
+    2. 累计花费不超过预算
+    都不满足时，时间不够则选预计完成最早的服务，预算不够则选最便宜的服务
+    吞吐量根据实时的限流状态（QPS、并发窗口）和实测延迟估算
+    :param backends: 可用服务名，顺序即同等条件下的优先级
+    :param budget: 总预算（元），None 表示不限
+    :param target_seconds: 目标耗时（秒），None 表示不限
+    :param dictionary: 词典查找函数，命中时不发请求
+    :param stats: 服务名 -> 实测延迟统计（Resilience.LatencyStats）
+    :param available: 服务名 -> 是否可用（如熔断器状态）
+    :param limits: 返回服务名 -> 限流状态（TranslateEngine.limiter_status 的元素）的函数
+    """
+
+    def __init__(self, backends: Sequence[str], profiles: Optional[Dict[str, BackendProfile]] = None,
+                 budget: Optional[float] = None, target_seconds: Optional[float] = None,
+                 dictionary: Optional[Callable[[str], Optional[str]]] = None,
+                 stats: Optional[Dict] = None, available: Optional[Callable[[str], bool]] = None,
+                 limits: Optional[Callable[[], Dict[str, Dict]]] = None, log: Optional[RoutingLog] = None):
+        self.profiles = {name: (profiles or DEFAULT_PROFILES)[name] for name in backends}
+        self.budget = budget
+        self.target_seconds = target_seconds
+        self.dictionary = dictionary
+        self.stats = stats or {}
+        self.available = available or (lambda name: True)
+        self.limits = limits or (lambda: {})
+        self.log = log or RoutingLog(None)
+        self.spent = 0.0
+        self._committed = 0.0  # 已决策但未回报结果的预估花费
+        self._load = {name: 0.0 for name in self.profiles}  # 各服务已分配的预计耗时（秒）
+        self._started = time.monotonic()
+        self._lock = Lock()
+
+    def start_job(self, budget: Optional[float] = None, target_seconds: Optional[float] = None):
+        """开始新任务：重置计时和负载；预算按剩余额度继续计算"""
+        with self._lock:
+            if budget is not None:
+                self.budget = budget
+                self.spent = 0.0
+                self._committed = 0.0
+            if target_seconds is not None:
+                self.target_seconds = target_seconds
+            self._load = {name: 0.0 for name in self.profiles}
+            self._started = time.monotonic()
+
+    def throughput(self, name: str) -> float:
+        """预计每秒完成的条数"""
+        profile = self.profiles[name]
+        limit = self.limits().get(name, {})
+        stats = self.stats.get(name)
+        latency = (stats.mean_latency if stats is not None else None) or profile.default_latency
+        concurrency = limit.get('window') or 1
+        requests_per_second = concurrency / latency
+        if limit.get('qps_limit'):
+            requests_per_second = min(requests_per_second, limit['qps_limit'])
+        error_rate = stats.error_rate if stats is not None else 0.0
+        return requests_per_second * profile.batch_size * (1 - error_rate)
+
+    def _decide(self, text: str, throughputs: Dict[str, float]) -> RouteDecision:
+        text = text.strip()
+        if not text:
+            return RouteDecision(None, [], '空文本')
+        if self.dictionary is not None and self.dictionary(text) is not None:
+            return RouteDecision(DICT_BACKEND, [], '词典命中')
+
+        candidates = [name for name in self.profiles if self.available(name) and throughputs[name] > 0]
+        if not candidates:
+            candidates = list(self.profiles)
+        costs = {name: self.profiles[name].estimate_cost(text) for name in candidates}
+
+        def unsuitable(name):
+            max_chars = self.profiles[name].max_chars
+            return max_chars is not None and len(text) > max_chars
+
+        ranked = sorted(candidates, key=lambda name: (unsuitable(name), costs[name]))
+        elapsed = time.monotonic() - self._started
+        remaining_budget = None if self.budget is None else self.budget - self.spent - self._committed
+
+        def finish_time(name):
+            return self._load[name] + 1.0 / throughputs[name] if throughputs[name] > 0 else float('inf')
+
+        chosen, reason = None, ''
+        for name in ranked:
+            if self.target_seconds is not None and elapsed + finish_time(name) > self.target_seconds:
+                continue
+            if remaining_budget is not None and costs[name] > remaining_budget:
+                continue
+            chosen = name
+            reason = '质量和成本最优' if name == ranked[0] else f'{ranked[0]} 预计超时或超预算'
+            break
+        if chosen is None:
+            if remaining_budget is not None and min(costs.values()) > remaining_budget:
+                chosen = min(candidates, key=lambda name: costs[name])
+                reason = '预算不足，选最便宜的服务'
+            else:
+                chosen = min(candidates, key=finish_time)
+                reason = '无法满足目标耗时，选预计完成最早的服务'
+        if unsuitable(chosen):
+            reason += f'（超过 {chosen} 适合的长度）'
+
+        self._load[chosen] = finish_time(chosen)
+        self._committed += costs[chosen]
+        order = [chosen] + [name for name in ranked if name != chosen]
+        return RouteDecision(chosen, order, reason, costs[chosen])
+
+    def route(self, text: str) -> RouteDecision:
+        return self.plan([text])[0]
+
+    def plan(self, texts: Sequence[str]) -> List[RouteDecision]:
+        throughputs = {name: self.throughput(name) for name in self.profiles}
+        decisions = []
+        with self._lock:
+            for text in texts:
+                decision = self._decide(text, throughputs)
+                decisions.append(decision)
+                self.log.write(text.strip(), decision,
+                               projected_seconds=round(max(self._load.values(), default=0.0), 3))
+        return decisions
+
+    def record(self, text: str, decision: RouteDecision, result: Dict):
+        """按实际使用的服务计入花费：按 token 计费的用实际 tokens（缓存命中为0），按字符计费的按原文长度"""
+        backend = result.get('backend')
+        with self._lock:
+            self._committed = max(0.0, self._committed - decision.est_cost)
+            if result.get('error') is not None or backend not in self.profiles:
+                return
+            profile = self.profiles[backend]
+            if profile.cost_per_token:
+                self.spent += (result.get('tokens_cost') or 0) * profile.cost_per_token
+            else:
+                self.spent += len(text.strip()) * profile.cost_per_char
+
+    def report(self) -> str:
+        budget = '不限' if self.budget is None else f'{self.budget:.2f}'
+        return f"{self.log.report()}；已花费 {self.spent:.4f} 元（预算 {budget}）"
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import re
+from collections import Counter
+from typing import Optional, Sequence, Tuple
+
+from translateUtils.TextNormalize import normalize_text
+from translateUtils.PhraseDict import lookup_phrase
+
+# 分类结果
+PASSTHROUGH = 'passthrough'  # 不需要翻译，原样保留
+DICTIONARY = 'dictionary'    # 短语词典命中
+NEEDS_MT = 'needs_mt'        # 需要调用翻译服务
+
+# 自定义表情/贴图的短代码（:_stamp: / :face-with-tears-of-joy:）
+_STAMP_RE = re.compile(r':_?[^:\s]+:')
+# 假名（平假名、片假名、片假名扩展、半角片假名），出现即视为日语
+_KANA = '\u3040-\u30ff\u31f0-\u31ff\uff66-\uff9f'
+# 汉字（扩展A、基本区、兼容区）
+_HAN = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+# 韩文
+_HANGUL = '\u1100-\u11ff\u3130-\u318f\uac00-\ud7af'
+# 拉丁字母（NFKC 后全角字母已转为半角）
+_LATIN = 'A-Za-z\u00c0-\u024f'
+_KANA_RE = re.compile(f'[{_KANA}]')
+_HAN_RE = re.compile(f'[{_HAN}]')
+_HANGUL_RE = re.compile(f'[{_HANGUL}]')
+_LATIN_RE = re.compile(f'[{_LATIN}]')
+# 字母、数字、汉字、假名、韩文之外的都是符号/表情/标点
+_WORD_RE = re.compile(f'[0-9{_LATIN}{_KANA}{_HAN}{_HANGUL}]')
+# 笑声、鼓掌：www、草、888
+_LAUGH_RE = re.compile(r'^[wW草]+$')
+_DIGIT_RE = re.compile(r'^[0-9]+$')
+# 日语中不使用的简体字，只含汉字的文本里出现这些字时按中文处理
+# 只收录日文汉字（JIS X 0208）中没有的字形；没、个、听、网 等在日语中也是常用汉字（没収、出没），不能收录
+_SIMPLIFIED_ONLY = frozenset('这们说吗呢么为还对时谢觉欢过让给样问题实现开关东车长门见应该话语')
+
+
+def classify_text(text: Optional[str]) -> Tuple[str, str]:
+    """
+    判断一条弹幕是否需要翻译
+    :return: (分类, 原因)，分类为 PASSTHROUGH / DICTIONARY / NEEDS_MT
+    """
+    if not isinstance(text, str):
+        return PASSTHROUGH, 'empty'
+    text = normalize_text(text)
+    if not text:
+        return PASSTHROUGH, 'empty'
+    if lookup_phrase(text) is not None:
+        return DICTIONARY, 'phrase'
+
+    body = _STAMP_RE.sub('', text).replace(' ', '')
+    if not body:
+        return PASSTHROUGH, 'stamp'
+    if _KANA_RE.search(body):
+        return NEEDS_MT, 'kana'
+    if _LAUGH_RE.match(body):
+        return PASSTHROUGH, 'laugh'
+    if _DIGIT_RE.match(body):
+        return PASSTHROUGH, 'digits'
+    if not _WORD_RE.search(body):
+        return PASSTHROUGH, 'symbol'
+    if _HAN_RE.search(body):
+        if any(char in _SIMPLIFIED_ONLY for char in body):
+            return PASSTHROUGH, 'chinese'
+        return NEEDS_MT, 'kanji'
+    if _HANGUL_RE.search(body):
+        return PASSTHROUGH, 'korean'
+    if _LATIN_RE.search(body):
+        return PASSTHROUGH, 'latin'
+    return PASSTHROUGH, 'other'
+
+
+class ClassifyReport:
+    """按分类和原因统计条数"""
+
+    def __init__(self):
+        self.classes = Counter()
+        self.reasons = Counter()
+
+    def add(self, kind: str, reason: str):
+        self.classes[kind] += 1
+        self.reasons[reason] += 1
+
+    def __str__(self):
+        total = sum(self.classes.values())
+        skipped = total - self.classes[NEEDS_MT]
+        reasons = '，'.join(f"{k} {v}" for k, v in self.reasons.most_common())
+        return (f"分类：共 {total} 条，原样保留 {self.classes[PASSTHROUGH]}，词典 {self.classes[DICTIONARY]}，"
+                f"需要翻译 {self.classes[NEEDS_MT]}；省去 {skipped} 次请求（{reasons}）")
+
+
+def classify_texts(texts: Sequence[Optional[str]]) -> Tuple[list, ClassifyReport]:
+    """对多条文本分类，返回 (每条的分类, 统计)"""
+    report = ClassifyReport()
+    kinds = []
+    for text in texts:
+        kind, reason = classify_text(text)
+        report.add(kind, reason)
+        kinds.append(kind)
+    return kinds, report
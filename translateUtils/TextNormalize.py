@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 连续空白折叠为一个空格
+_SPACE_RE = re.compile(r'\s+')
+# 同一字符（含表情）连续出现3次以上时折叠为3次：草草草草草 -> 草草草，😂😂😂😂 -> 😂😂😂
+_RUN_RE = re.compile(r'(.)\1{3,}')
+# 句尾的语气/笑声：ー〜~、w（前面不是英文字母时）、草、标点和符号，同时匹配全角写法
+# 片假名后的 ー 是长音（コーヒー），不算语气尾巴
+_TAIL_RE = re.compile(
+    r'(?:[〜~～!！?？.。…・♪☆★草]|(?<![ァ-ヺー])ー+|(?<![A-Za-zＡ-Ｚａ-ｚ])[wWｗＷ]+)+$'
+)
+
+
+def normalize_text(text: str) -> str:
+    """NFKC 规范化（全角转半角等）、去首尾空白、折叠空白和重复字符"""
+    text = unicodedata.normalize('NFKC', text).strip()
+    text = _SPACE_RE.sub(' ', text)
+    return _RUN_RE.sub(r'\1\1\1', text)
+
+
+def split_tail(text: str) -> Tuple[str, str]:
+    """
+    拆出句尾的语气尾巴，返回 (主体, 尾巴)
+    整句都是尾巴（如 wwww、ーー）时不拆分
+    """
+    match = _TAIL_RE.search(text)
+    if match is None or match.start() == 0:
+        return text, ''
+    return text[:match.start()].rstrip(), text[match.start():]
+
+
+def dedup_key(text: str) -> Tuple[str, str]:
+    """
+    翻译去重键：规范化后去掉语气尾巴
+    こんにちは / こんにちはー / こんにちは〜 / こんにちは！ 得到相同的键
+    :return: (去重键, 原文中被去掉的尾巴)
+    """
+    core, _ = split_tail(normalize_text(text))
+    # 尾巴保留原文写法（ー/〜/！等），译文拼接回去
+    _, tail = split_tail(text.strip())
+    return core, tail
+
+
+@dataclass
+class DedupPlan:
+    """
+    去重计划：每个去重键只翻译一次，结果再分发到所有对应的行
+    :param keys: 需要翻译的去重键（按首次出现顺序）
+    :param row_keys: 每行对应的键下标，空文本为 -1
+    :param row_tails: 每行被去掉的语气尾巴
+    """
+    keys: List[str] = field(default_factory=list)
+    row_keys: List[int] = field(default_factory=list)
+    row_tails: List[str] = field(default_factory=list)
+
+    @property
+    def rows(self) -> int:
+        return len(self.row_keys)
+
+    @property
+    def dedup_ratio(self) -> float:
+        """省掉的翻译比例"""
+        non_empty = sum(1 for k in self.row_keys if k >= 0)
+        return 1 - len(self.keys) / non_empty if non_empty else 0.0
+
+    def expand(self, key_results: Sequence[Dict]) -> List[Dict]:
+        """
+        把每个键的翻译结果分发到行：译文后拼接该行的语气尾巴
+        tokens 只记在每个键第一次出现的行上，总和保持不变
+        """
+        rows = []
+        counted = set()
+        for key_index, tail in zip(self.row_keys, self.row_tails):
+            if key_index < 0:
+                rows.append({"trans_res": "", "tokens_cost": 0, "backend": None, "error": None})
+                continue
+            result = dict(key_results[key_index])
+            if isinstance(result.get("trans_res"), str) and tail:
+                result["trans_res"] = result["trans_res"] + tail
+            if key_index in counted:
+                result["tokens_cost"] = 0
+            counted.add(key_index)
+            rows.append(result)
+        return rows
+
+    def report(self) -> str:
+        return f"去重：{self.rows} 行 -> {len(self.keys)} 个待翻译文本，去重率 {self.dedup_ratio:.1%}"
+
+
+def plan_dedup(texts: Sequence[Optional[str]]) -> DedupPlan:
+    """按去重键对所有行分组"""
+    plan = DedupPlan()
+    key_index: Dict[str, int] = {}
+    for text in texts:
+        if not isinstance(text, str) or not text.strip():
+            plan.row_keys.append(-1)
+            plan.row_tails.append('')
+            continue
+        key, tail = dedup_key(text)
+        if key not in key_index:
+            key_index[key] = len(plan.keys)
+            plan.keys.append(key)
+        plan.row_keys.append(key_index[key])
+        plan.row_tails.append(tail)
+    return plan
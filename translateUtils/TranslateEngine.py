@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence
+
+from tqdm import tqdm
+
+from translateUtils.RateLimiter import AdaptiveLimiter
+
+
+# 各翻译服务的自适应限流：从保守的初始值开始，成功时逐步提高，遇到限流错误时减半
+# 百度标准版 QPS=10、高级版 QPS=100；DeepSeek 不限 QPS，只按并发窗口自适应
+BACKEND_LIMITS: Dict[str, AdaptiveLimiter] = {
+    'baidu': AdaptiveLimiter('baidu', max_concurrency=16, qps=10, max_qps=100),
+    'youdao': AdaptiveLimiter('youdao', max_concurrency=16, qps=10, max_qps=50),
+    'deepseek': AdaptiveLimiter('deepseek', max_concurrency=32, initial_concurrency=16),
+}
+
+
+def set_backend_limit(backend: str, max_concurrency: int, qps: Optional[float] = None,
+                      max_qps: Optional[float] = None, **kwargs):
+    BACKEND_LIMITS[backend] = AdaptiveLimiter(backend, max_concurrency, qps=qps, max_qps=max_qps, **kwargs)
+
+
+@contextmanager
+def backend_slot(backend: str):
+    """
+    占用指定翻译服务的一个请求名额
+    块内抛出 RateLimitedError 时该服务的 QPS 和并发窗口减半，正常完成时缓慢回升
+    """
+    limiter = BACKEND_LIMITS.get(backend)
+    if limiter is None:
+        yield
+        return
+    with limiter.slot():
+        yield
+
+
+def limiter_status() -> List[Dict]:
+    """各翻译服务当前的限流状态（QPS 上限、并发窗口、实际完成速率、限流次数）"""
+    return [limiter.snapshot() for limiter in BACKEND_LIMITS.values()]
+
+
+def format_limiter_status() -> str:
+    lines = []
+    for s in limiter_status():
+        qps = f"{s['qps_limit']:.1f}" if s['qps_limit'] else '不限'
+        lines.append(f"{s['backend']}: QPS上限 {qps}，并发窗口 {s['window']}，实际 {s['completed_rate']:.1f} 请求/秒，"
+                     f"成功 {s['successes']}，限流 {s['throttles']}，出错 {s['errors']}")
+    return '\n'.join(lines)
+
+
+def translate_parallel(texts: Sequence[str], translate_fn: Callable[[str], Dict],
+                       max_workers: int = 32, progress: str = 'throughput',
+                       desc: str = "翻译进度") -> List[Dict]:
+    """
+    并发翻译，结果按输入顺序返回
+    :param translate_fn: 单条翻译函数（如 translate_with_rate_limit），内部通过 backend_slot 限流
+    :param max_workers: 线程数，应不小于各服务并发上限之和
+    :param progress: 'throughput' 按完成顺序更新进度（反映吞吐）；
+                     'ordered' 按输入顺序更新进度（进度条位置即已连续完成的行数）
+    """
+    results: List[Optional[Dict]] = [None] * len(texts)
+    if not texts:
+        return results
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_to_index = {executor.submit(translate_fn, text): i for i, text in enumerate(texts)}
+        with tqdm(total=len(texts), desc=desc) as pbar:
+            if progress == 'ordered':
+                futures = sorted(future_to_index, key=future_to_index.get)
+            elif progress == 'throughput':
+                futures = as_completed(future_to_index)
+            else:
+                raise ValueError(f"不支持的进度模式: {progress}")
+            for future in futures:
+                results[future_to_index[future]] = future.result()
+                pbar.update(1)
+
+    return results
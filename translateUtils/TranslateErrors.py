@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+
+class TranslationError(Exception):
+    """
+    翻译失败（接口报错、超时、返回格式错误等）
+    翻译函数失败时抛出该异常，而不是把错误信息当作译文返回
+    :param retryable: 是否值得重试（参数错误、签名错误等重试也不会成功）
+    """
+
+    def __init__(self, backend: str, detail='', retryable: bool = True):
+        super().__init__(f"{backend}: {detail}")
+        self.backend = backend
+        self.detail = detail
+        self.retryable = retryable
+
+
+class RateLimitedError(TranslationError):
+    """翻译服务返回了限流错误（百度 54003、有道 411、DeepSeek 429 等）"""
+
+    def __init__(self, backend: str, detail=''):
+        super().__init__(backend, f"触发限流 {detail}")
+
+
+class DeadlineExceeded(TranslationError):
+    """请求超过截止时间"""
+
+
+class CircuitOpenError(TranslationError):
+    """该服务近期连续失败，熔断中"""
+
+    def __init__(self, backend: str):
+        super().__init__(backend, "熔断中，暂不发送请求", retryable=False)
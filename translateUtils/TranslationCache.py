@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+import time
+from hashlib import md5
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterable, Optional, Tuple
+
+# 默认缓存数据库（单文件，WAL 模式，可被多个线程/进程共享）
+DEFAULT_CACHE_PATH = Path(__file__).parent / 'translation_cache.sqlite3'
+# 旧版缓存目录：每条译文一个 <md5>.txt
+LEGACY_CACHE_DIR = Path(__file__).parent / 'translation_cache'
+
+# 共享缓存的容量上限：条目数和最久未访问天数（None 表示不限），打开时按此淘汰
+DEFAULT_MAX_ENTRIES = 1000000
+DEFAULT_MAX_AGE_DAYS = 180
+
+# SQLite 单条语句的参数个数上限（旧版本为 999）
+_SQL_CHUNK = 900
+
+# 缓存命名空间：(翻译服务, 模型, 提示词版本)
+Namespace = Tuple[str, str, str]
+
+
+def cache_key(text: str) -> str:
+    """缓存键：去除首尾空白后的文本的 md5（与旧版 txt 缓存的文件名一致，便于迁移）"""
+    return md5(text.strip().encode('utf-8')).hexdigest()
+
+
+def prompt_version(prompt: str) -> str:
+    """提示词版本号：提示词改动后自动使用新的缓存空间"""
+    return md5(prompt.encode('utf-8')).hexdigest()[:8]
+
+
+class TranslationCache:
+    """
+    翻译缓存：按 (翻译服务, 模型, 提示词版本, 文本) 索引
+    :param path: 数据库文件路径
+    :param max_entries: 条目数上限，超过后按最近访问时间淘汰
+    :param max_age_days: 超过多少天未访问的条目会被淘汰
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries: Optional[int] = None,
+                 max_age_days: Optional[float] = None):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS translations (
+                backend TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                key TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (backend, model, prompt_version, key)
+            ) WITHOUT ROWID
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_accessed ON translations (accessed)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+        self._conn.commit()
+
+    def get(self, namespace: Namespace, text: str) -> Optional[str]:
+        return self.get_many(namespace, [text]).get(text)
+
+    def put(self, namespace: Namespace, text: str, translation: str):
+        self.put_many(namespace, {text: translation})
+
+    def get_many(self, namespace: Namespace, texts: Iterable[str]) -> Dict[str, str]:
+        """批量查询，返回命中的 {原文: 译文}"""
+        key_to_texts: Dict[str, list] = {}
+        for text in texts:
+            key_to_texts.setdefault(cache_key(text), []).append(text)
+        keys = list(key_to_texts)
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), _SQL_CHUNK):
+                chunk = keys[start:start + _SQL_CHUNK]
+                marks = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, translation FROM translations "
+                    f"WHERE backend=? AND model=? AND prompt_version=? AND key IN ({marks})",
+                    (*namespace, *chunk)).fetchall()
+                for key, translation in rows:
+                    found[key] = translation
+                if rows:
+                    hit_keys = [key for key, _ in rows]
+                    self._conn.execute(
+                        f"UPDATE translations SET accessed=? "
+                        f"WHERE backend=? AND model=? AND prompt_version=? "
+                        f"AND key IN ({','.join('?' * len(hit_keys))})",
+                        (now, *namespace, *hit_keys))
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        result = {}
+        for key, translation in found.items():
+            for text in key_to_texts[key]:
+                result[text] = translation
+        return result
+
+    def put_many(self, namespace: Namespace, items: Dict[str, str]):
+        """批量写入 {原文: 译文}"""
+        now = time.time()
+        rows = [(*namespace, cache_key(text), translation, now, now)
+                for text, translation in items.items() if isinstance(translation, str)]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO translations "
+                "(backend, model, prompt_version, key, translation, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def evict(self, max_entries: Optional[int] = None, max_age_days: Optional[float] = None) -> int:
+        """按访问时间淘汰条目，返回删除的条数"""
+        max_entries = max_entries if max_entries is not None else self.max_entries
+        max_age_days = max_age_days if max_age_days is not None else self.max_age_days
+        deleted = 0
+        with self._lock:
+            if max_age_days is not None:
+                cutoff = time.time() - max_age_days * 86400
+                deleted += self._conn.execute("DELETE FROM translations WHERE accessed < ?", (cutoff,)).rowcount
+            if max_entries is not None:
+                count = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+                if count > max_entries:
+                    # WITHOUT ROWID 表没有 rowid，按主键删除最久未访问的条目
+                    deleted += self._conn.execute(
+                        "DELETE FROM translations WHERE (backend, model, prompt_version, key) IN "
+                        "(SELECT backend, model, prompt_version, key FROM translations ORDER BY accessed LIMIT ?)",
+                        (count - max_entries,)).rowcount
+            self._conn.commit()
+        return deleted
+
+    def migrate_txt_cache(self, namespace: Namespace, cache_dir=LEGACY_CACHE_DIR) -> int:
+        """
+        一次性迁移旧版 <md5>.txt 缓存（文件名即缓存键），迁移过后再次调用直接返回 0
+        :return: 迁移的条数
+        """
+        cache_dir = Path(cache_dir)
+        with self._lock:
+            done = self._conn.execute("SELECT value FROM meta WHERE name='migrated_txt'").fetchone()
+        if done or not cache_dir.exists():
+            return 0
+
+        now = time.time()
+        rows = []
+        for cache_file in cache_dir.glob('*.txt'):
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                rows.append((*namespace, cache_file.stem, f.read(), now, now))
+        with self._lock:
+            # 不覆盖已有条目
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO translations "
+                "(backend, model, prompt_version, key, translation, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('migrated_txt', ?)",
+                               (str(len(rows)),))
+            self._conn.commit()
+        print(f"已迁移旧版缓存 {len(rows)} 条")
+        return len(rows)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            'entries': entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def report(self) -> str:
+        s = self.stats()
+        return (f"翻译缓存：命中 {s['hits']} 条，未命中 {s['misses']} 条，命中率 {s['hit_rate']:.1%}，"
+                f"共 {s['entries']} 条")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_shared_cache = None
+_shared_cache_lock = Lock()
+
+
+def get_cache() -> TranslationCache:
+    """所有翻译服务共享的缓存实例；首次打开时按容量上限和访问时间淘汰旧条目"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = TranslationCache(max_entries=DEFAULT_MAX_ENTRIES, max_age_days=DEFAULT_MAX_AGE_DAYS)
+            deleted = _shared_cache.evict()
+            if deleted:
+                print(f"翻译缓存：淘汰 {deleted} 条过期或超出容量的条目")
+        return _shared_cache
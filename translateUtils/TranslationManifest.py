@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from translateUtils.TranslationCache import cache_key
+
+MANIFEST_SUFFIX = '.manifest.json'
+MANIFEST_VERSION = 1
+
+
+def manifest_path(output_path) -> Path:
+    """输出文件配套的清单文件：<输出文件>.manifest.json"""
+    output_path = Path(output_path)
+    return output_path.with_name(output_path.name + MANIFEST_SUFFIX)
+
+
+class TranslationManifest:
+    """
+    输出文件的翻译清单：原文内容哈希 -> (译文, 服务)
+    重新运行时（重新对齐的字幕、修改过的弹幕表）按内容而不是行号比对，
+    原文没变的行直接复用上次的译文，只把新增或修改的行发送给翻译服务；
+    行号变化（插入、删除、时间轴调整）不影响复用
+    :param path: 清单文件路径，通常由 manifest_path(输出文件) 得到
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries: Dict[str, Tuple[str, Optional[str]]] = {}
+        self.reused = 0
+        self.translated = 0
+
+    @classmethod
+    def for_output(cls, output_path) -> 'TranslationManifest':
+        manifest = cls(manifest_path(output_path))
+        manifest.load()
+        return manifest
+
+    def load(self) -> bool:
+        if not self.path.exists():
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"清单文件 {self.path} 无法读取，将全部重新翻译：{e}")
+            return False
+        if state.get('version') != MANIFEST_VERSION:
+            return False
+        self.entries = {key: (entry['translation'], entry.get('backend'))
+                        for key, entry in state.get('entries', {}).items()}
+        return True
+
+    def lookup(self, text: str) -> Optional[Tuple[str, Optional[str]]]:
+        """返回上次的 (译文, 服务)，原文不在清单中时返回 None"""
+        return self.entries.get(cache_key(text))
+
+    def split(self, items: Iterable[Tuple[int, str]]) -> Tuple[Dict[int, Tuple[str, Optional[str], int]],
+                                                             List[Tuple[int, str]]]:
+        """
+        把 (条目ID, 原文) 分成可复用和需要翻译的两部分
+        :return: ({条目ID: (译文, 服务, 0)}, [(条目ID, 原文)])；复用的条目不消耗 tokens
+        """
+        reused, missing = {}, []
+        for item_id, text in items:
+            hit = self.lookup(text)
+            if hit is None:
+                missing.append((item_id, text))
+            else:
+                reused[item_id] = (hit[0], hit[1], 0)
+        self.reused = len(reused)
+        self.translated = len(missing)
+        return reused, missing
+
+    def rebuild(self, items: Iterable[Tuple[str, str, Optional[str]]]):
+        """用本次输出的 (原文, 译文, 服务) 重建清单；不再出现的原文被移除"""
+        self.entries = {cache_key(text): (translation, backend) for text, translation, backend in items
+                        if translation is not None}
+
+    def save(self):
+        """原子写入清单文件（先写临时文件再替换）"""
+        state = {
+            'version': MANIFEST_VERSION,
+            'entries': {key: {'translation': translation, 'backend': backend}
+                        for key, (translation, backend) in self.entries.items()},
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def report(self) -> str:
+        total = self.reused + self.translated
+        return f"增量翻译：共 {total} 行，复用上次译文 {self.reused} 行，需要翻译 {self.translated} 行"
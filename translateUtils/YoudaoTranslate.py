@@ -1,12 +1,13 @@
-import requests
 import json
 import os
 from dotenv import load_dotenv
 from pathlib import Path
 from hashlib import md5
-from QuickTable import *
+from translateUtils.TranslationCache import get_cache
+from translateUtils.HttpSession import http_request
+from translateUtils.TranslateErrors import TranslationError, RateLimitedError
 
-from Youdao.AuthV3Util import addAuthParams
+from translateUtils.Youdao.AuthV3Util import addAuthParams
 
 # 获取 .env 文件的绝对路径
 env_path = Path(__file__).resolve().parent.parent / '.env'
@@ -19,11 +20,18 @@ appid = os.getenv('YOUDAO_APP_ID')
 appkey = os.getenv('YOUDAO_APP_KEY')
 vocab_id = os.getenv('YOUDAO_APP_VOCABID')
 
+# 缓存命名空间：(服务, 术语表, 语言对)，术语表不同译文也可能不同
+CACHE_NAMESPACE = ('youdao', vocab_id or 'general', 'ja-zh-CHS')
+
 def createRequest(src_msg) -> str:
     '''
     note: 将下列变量替换为需要请求的参数
     '''
     q = src_msg
+    cached = get_cache().get(CACHE_NAMESPACE, q)
+    if cached is not None:
+        return cached
+
     lang_from = 'ja'
     lang_to = 'zh-CHS'
 
@@ -38,15 +46,23 @@ def createRequest(src_msg) -> str:
     response = json.loads(res.content)
     
     print(src_msg, ": ", response)
+    # 411 访问频率受限
+    if response.get('errorCode') == '411':
+        raise RateLimitedError('youdao', response.get('errorCode'))
+    if response.get('errorCode') != '0' or not response.get('translation'):
+        raise TranslationError('youdao', response.get('errorCode'))
     # 返回翻译结果
-    return response["translation"][0]
+    translated = response["translation"][0]
+    get_cache().put(CACHE_NAMESPACE, q, translated)
+    return translated
 
 
 def doCall(url, header, params, method):
+    # 共享会话复用 TCP/TLS 连接
     if 'get' == method:
-        return requests.get(url, params)
+        return http_request('youdao', 'GET', url, params=params)
     elif 'post' == method:
-        return requests.post(url, params, header)
+        return http_request('youdao', 'POST', url, data=params, headers=header)
 
 # 网易有道智云翻译服务api调用demo
 # api接口: https://openapi.youdao.com/api
@@ -1 +1,2 @@
-from .QuickTable import get_translation_map
\ No newline at end of file
+from .QuickTable import get_translation_map
+from .PhraseDict import lookup_phrase